@@ -0,0 +1,76 @@
+"""
+Benchmarks the MetaTFT client end to end against the stand-in server replaying recorded fixtures
+(see scripts/record_fixtures.py), so results are repeatable and need no network. Measures:
+  cold:           Fetching everything into an empty snapshot, like a server booting.
+  warm:           Reading everything back out of a warm snapshot.
+  refresh (304):  Revalidating everything after the TTLs expire, when nothing changed.
+  refresh (full): Re-downloading everything after the TTLs expire.
+
+Usage:
+    python scripts/bench_client.py --latency 0.05 --scale 2
+    python scripts/bench_client.py --rate 1000  # Take the client's rate limit out of the picture.
+"""
+import argparse
+import time
+
+import tft.client.meta as meta
+from tft.client.limits import TokenBucket
+from tft.client.standin import StandIn
+
+
+def warm_up() -> None:
+    meta.get_comp_data()
+    meta.get_champ_item_data()
+    meta.get_set_data()
+    meta.get_comp_details()
+
+
+def cold() -> None:
+    meta.swap_snapshot(meta.Snapshot())
+    warm_up()
+
+
+def expire(drop_validators: bool) -> None:
+    for key, validators in meta.get_snapshot().validators.items():
+        validators.fetched_at = 0
+        if drop_validators:
+            validators.etag = None
+            validators.last_modified = None
+
+
+def refresh_not_modified() -> None:
+    expire(False)
+    meta.refresh()
+
+
+def refresh_full() -> None:
+    expire(True)
+    meta.refresh()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the MetaTFT client against recorded fixtures.')
+    parser.add_argument('--fixtures', default=meta.FIXTURE_DIR)
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds the stand-in waits per request.')
+    parser.add_argument('--scale', type=int, default=1, help='How many times bigger to make each payload.')
+    parser.add_argument('--rate', type=float, default=meta.RATE_LIMIT, help='Client rate limit in requests per second.')
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+    meta.LIMITER = TokenBucket(args.rate, meta.FANOUT_WORKERS)
+
+    with StandIn(fixture_dir=args.fixtures, latency=args.latency, scale=args.scale) as server:
+        meta.URLS.update(server.urls())
+        meta.create_client(meta.MetaTFTClientType.ONLINE_ONLY)
+        for name, phase in [('cold', cold), ('warm', warm_up), ('refresh (304)', refresh_not_modified), ('refresh (full)', refresh_full)]:
+            timings = []
+            for _ in range(args.repeats):
+                served = server.requests_served
+                start = time.perf_counter()
+                phase()
+                timings.append(time.perf_counter() - start)
+            requests = server.requests_served - served
+            print(f"{name:15} best {min(timings):.3f}s  mean {sum(timings) / len(timings):.3f}s  {requests} requests")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Benchmarks decoding MetaTFT responses whole against decoding only each API's registered paths (see
+`meta.PROJECTIONS`). The payloads are the snapshots in `res/`, re-encoded compactly like the website
+sends them. Reports the best decode time, the peak memory allocated while decoding and the memory
+still held by the result.
+
+Usage:
+    python scripts/bench_decode.py --repeats 20
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from typing import Any, Callable
+
+import tft.client.meta as meta
+from tft.client.standin import CHAMP_DATA_FILE, COMP_DATA_FILE, SET_DATA_FILE, read_snapshot
+
+PAYLOADS = [
+    (meta.MetaTFTApis.COMPS_DATA, COMP_DATA_FILE),
+    (meta.MetaTFTApis.SET_DATA, SET_DATA_FILE),
+    (meta.MetaTFTApis.CHAMP_ITEMS, CHAMP_DATA_FILE),
+]
+
+
+def best_time(decode: Callable[[], Any], repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        decode()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def memory(decode: Callable[[], Any]) -> tuple[int, int]:
+    """Returns the peak bytes allocated while decoding and the bytes held by the result."""
+    tracemalloc.start()
+    result = decode()
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak, held
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks full against selective JSON decoding.')
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    for api, path in PAYLOADS:
+        body = json.dumps(read_snapshot(path)).encode()
+        print(f"{api.value} ({path}, {len(body) / 1024:.0f}KB)")
+        for name, decode in [('full', lambda: json.loads(body)), ('selective', lambda: meta.decode(api, body))]:
+            seconds = best_time(decode, args.repeats)
+            peak, held = memory(decode)
+            print(f"  {name:10} best {seconds * 1000:6.1f}ms  peak {peak / 1024:6.0f}KB  held {held / 1024:6.0f}KB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmarks a cold fetch of every champ and comp against a local stand-in for metatft.com. Compares
+the old approach (a fresh multiprocessing pool doing unpooled `requests.get` calls) with the
+client's threaded fan out over a shared keep-alive session.
+
+With `--throttle` the stand-in rejects that fraction of requests with a 429. Only the fan out is run
+then, since the pool approach has no retries.
+
+Usage:
+    python scripts/bench_fetch.py --latency 0.05 --repeats 3
+    python scripts/bench_fetch.py --throttle 0.1
+"""
+import argparse
+import multiprocessing
+import time
+import requests
+
+import tft.client.meta as meta
+import tft.ql.expr as ql
+from tft.client.standin import StandIn
+
+
+def pool_fetch(args: tuple[str, dict]) -> dict:
+    """What each pool worker used to do."""
+    url, params = args
+    return requests.get(url, params=params).json()
+
+
+def fetch_with_pool(champ_ids: list[str], cids: list[str]) -> None:
+    champ_args = [(meta.URLS[meta.MetaTFTApis.CHAMP_ITEMS], {'unit': champ_id}) for champ_id in champ_ids]
+    comp_args = [(meta.URLS[meta.MetaTFTApis.COMP_DETAILS], {'comp': cid}) for cid in cids]
+    with multiprocessing.Pool(meta.FANOUT_WORKERS) as pool:
+        for champ_id, data in zip(champ_ids, pool.map(pool_fetch, champ_args)):
+            meta.get_snapshot().champs[champ_id] = data
+    with multiprocessing.Pool(meta.FANOUT_WORKERS) as pool:
+        for cid, data in zip(cids, pool.map(pool_fetch, comp_args)):
+            meta.get_snapshot().comps[cid] = data
+
+
+def fetch_with_fan_out(champ_ids: list[str], cids: list[str]) -> None:
+    client = meta.get_client()
+    meta.fan_out(client.fetch_champ, champ_ids)
+    meta.fan_out(client.fetch_comp, cids)
+
+
+def clear_caches() -> None:
+    meta.get_snapshot().champs.clear()
+    meta.get_snapshot().comps.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks fetching all champs and comps.')
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds the stand-in waits per request.')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--throttle', type=float, default=0.0, help='Fraction of requests the stand-in answers with a 429.')
+    args = parser.parse_args()
+
+    with StandIn(latency=args.latency, throttle=args.throttle, retry_after=0) as server:
+        meta.URLS.update(server.urls())
+        meta.create_client(meta.MetaTFTClientType.ONLINE_ONLY)
+        champ_ids = ql.query(meta.get_set_data()).idx('units').filter(ql.idx('traits').len().gt(0)).map(ql.idx('apiName')).eval()
+        cids = [str(cid) for cid in ql.query(meta.get_comp_data()).idx('results.data.cluster_details').map(ql.idx('Cluster')).values().eval()]
+        print(f"{len(champ_ids)} champs, {len(cids)} comps, {args.latency * 1000:.0f}ms latency")
+
+        approaches = [('pool', fetch_with_pool), ('fan out', fetch_with_fan_out)]
+        if args.throttle > 0:
+            approaches = approaches[1:]
+        for name, fetch in approaches:
+            timings = []
+            for _ in range(args.repeats):
+                clear_caches()
+                start = time.perf_counter()
+                fetch(champ_ids, cids)
+                timings.append(time.perf_counter() - start)
+                assert len(meta.get_snapshot().champs) == len(champ_ids) and len(meta.get_snapshot().comps) == len(cids)
+            print(f"{name:8} best {min(timings):.3f}s  mean {sum(timings) / len(timings):.3f}s")
+        print(f"{server.requests_served} requests served, {server.throttled_served} throttled")
+
+
+if __name__ == '__main__':
+    main()
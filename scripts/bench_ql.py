@@ -0,0 +1,244 @@
+"""
+Benchmarks the QL engine on the hot queries behind `/top_comps` and the `match` command. Every run
+builds the query from scratch like a request does, so compiling is part of the measured time. Also
+reports the peak memory allocated by a run, which the lazily streamed lists in compiled queries cut.
+
+Then times the top `--top` exploded comp options by games, as a full sort and slice against the
+heap based `top_by` that compiled `sort_by(...).top(n)` queries are rewritten into.
+
+Then it times filters, sorts and `to_pandas` over the exploded comp options and made up champion
+builds, row by row against on NumPy columns (see `tft.ql.columns`).
+
+Then it times the filters of `match` and `/top_comps` scanning the comps against looking them up in
+hash indexes (see `tft.ql.index`).
+
+Then it times running an ad hoc text query (see `tft.ql.parse`) parsed and compiled every time
+against from the plan cache.
+
+Then it times picking the item ids and fields out of the raw set data, decoded whole against read as
+a JSON source that only decodes them (see `tft.ql.source`).
+
+Then it times bringing the `comps` view (see `tft.ql.views`) up to date after a refresh changed
+three comps, evaluated whole against evaluating only those three.
+
+Last it times the match score map and a build filter over `--parallel-rows` rows in this process
+against split across `--workers` worker processes (see `tft.ql.parallel`), at most one per CPU the
+process may use, so with one CPU both run in this process. The first run starts the workers and is
+left out of the timings.
+
+The comp data comes from `res/comp_data.json`. There is no comp details snapshot in `res/`, so one is
+made up from it with `--options` early and late options per level for every comp, which is what
+the `comps` view explodes and flattens. `explode comps` times doing that whole on every run, which
+`query_comps()` only does again for the comps a refresh changed, and `filtered_comps` filters it.
+
+Usage:
+    python scripts/bench_ql.py --options 20 --repeats 10 --top 50
+"""
+import argparse
+import json
+import random
+import time
+import tracemalloc
+from typing import Any, Callable
+
+
+import tft.client.meta as meta
+import tft.ql.columns as columns
+import tft.ql.parallel as parallel
+import tft.ql.expr as ql
+from tft.ql.parse import PLANS
+from tft.ql.views import VIEWS
+from tft.client.standin import COMP_DATA_FILE, SET_DATA_FILE, read_snapshot
+from tft.ql.util import count_match_score, match_rank, match_score
+from tft.queries.adhoc import run_query
+from tft.queries.comps import explode_comps, has_champs, query_comps, query_indexed_comps, query_indexed_top_comps, query_top_comps
+
+LEVELS = ['6', '7', '8', '9']
+
+
+def make_comp_details(comp_data: dict, options: int) -> dict:
+    """Makes up comp details for every comp, with options built from the comp's units."""
+    rng = random.Random(0)
+    details = {}
+    for cluster in comp_data['results']['data']['cluster_details'].values():
+        units = cluster['units_string'].split(', ')
+        def option(key: str) -> dict:
+            return {key: '&'.join(rng.sample(units, rng.randint(1, len(units)))), 'avg': rng.uniform(1, 8), 'count': rng.randint(1, 10000)}
+        details[str(cluster['Cluster'])] = {'results': {
+            'early_options': {level: [option('unit_list') for _ in range(options)] for level in LEVELS},
+            'options': {level: [option('units_list') for _ in range(options)] for level in LEVELS},
+        }}
+    return details
+
+
+def make_builds(count: int) -> list[dict]:
+    """Makes up champion builds, with how many games placed first through eighth."""
+    rng = random.Random(0)
+    return [{'items': [f"TFT_Item_{rng.randint(0, 40)}" for _ in range(3)], 'places': [rng.randint(0, 500) for _ in range(8)]} for _ in range(count)]
+
+
+def top_comps_query() -> ql.BaseQuery:
+    """What `/top_comps` runs."""
+    return query_top_comps().filter(ql.idx('units').unary(match_score(['TFT12_Ahri'])).eq(1)).sort_by(ql.idx('games'), True).top(50)
+
+
+def match_query() -> ql.BaseQuery:
+    """What the `match` command runs."""
+    return query_comps().map(ql.extend({
+        'match_score': ql.unary(match_rank(['TFT12_Ahri', 'TFT12_Bard']))
+    })).sort_by(ql.idx('match_score'), True)
+
+
+def explode_comps_query() -> ql.BaseQuery:
+    """The `comps` view evaluated whole, see `tft.queries.comps`."""
+    return explode_comps(ql.query(meta.get_comp_details())).sort_by(ql.idx('games'), True)
+
+
+def filtered_comps_query() -> ql.BaseQuery:
+    """What the `match` command filters by level and cluster on the exploded comps, which the optimizer pushes below the explode."""
+    clusters = {str(cluster) for cluster in range(5)}
+    return explode_comps(ql.query(meta.get_comp_details())).filter(ql.idx('level').in_set({'7', '8'})).filter(ql.idx('cluster').in_set(clusters))
+
+
+def best_time(run: Callable[[], Any], repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def peak_memory(run: Callable[[], Any]) -> int:
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks QL queries on the hot path.')
+    parser.add_argument('--options', type=int, default=20, help='Options per level per comp in the made up comp details.')
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--top', type=int, default=50, help='How many comp options to keep in the top k benchmark.')
+    parser.add_argument('--builds', type=int, default=20000, help='How many made up builds to sort.')
+    parser.add_argument('--parallel-rows', type=int, default=200000, help='How many rows to map and filter in workers.')
+    parser.add_argument('--workers', type=int, default=min(parallel.MAX_WORKERS, parallel.available_cpus()), help='How many workers to compare against serial, at most one per CPU this process may use.')
+    args = parser.parse_args()
+
+    comp_data = read_snapshot(COMP_DATA_FILE)
+    # Seed the in-memory snapshot so no requests are made.
+    snapshot = meta.get_snapshot()
+    snapshot.apis[meta.MetaTFTApis.COMPS_DATA.value] = comp_data
+    snapshot.apis[meta.MetaTFTApis.COMP_DETAILS.value] = make_comp_details(comp_data, args.options)
+    # A copy, the view's list is shared and is shuffled below.
+    rows = list(query_comps().eval())
+    print(f"{len(rows)} exploded comp options")
+
+    for name, build in [('top_comps', top_comps_query), ('explode comps', explode_comps_query), ('match', match_query), ('filtered_comps', filtered_comps_query)]:
+        assert build().eval() == build().interpret(), f"{name} differs when compiled"
+        print(name)
+        for mode, run in [('interpret', lambda: build().interpret()), ('eval', lambda: build().eval())]:
+            seconds = best_time(run, args.repeats)
+            print(f"  {mode:10} best {seconds * 1000:7.2f}ms  peak {peak_memory(run) / 1024:7.0f}KB")
+
+    # Shuffled so the sort has work to do, query_comps() already sorts by games.
+    random.Random(0).shuffle(rows)
+    print(f"top {args.top} by games")
+    top_runs = [
+        ('sort', lambda: ql.query(rows).sort_by(ql.idx('games'), True).eval()[:args.top]),
+        ('top_by', lambda: ql.query(rows).sort_by(ql.idx('games'), True).top(args.top).eval()),
+    ]
+    assert top_runs[0][1]() == top_runs[1][1](), "top_by differs from sorting"
+    for mode, run in top_runs:
+        print(f"  {mode:10} best {best_time(run, args.repeats) * 1000:7.2f}ms")
+
+    builds = make_builds(args.builds)
+    columnar_runs = [
+        ('filter comps', lambda: ql.query(rows).filter(ql.idx('avg_place').lt(4.5)).filter(ql.idx('games').gt(1000)).sort_by(ql.idx('avg_place')).eval()),
+        ('level comps', lambda: ql.query(rows).filter(ql.idx('level').in_set({'7', '8'})).sort_by(ql.idx('games'), True).top(args.top).eval()),
+        ('sort builds', lambda: ql.query(builds).sort_by(ql.idx('places').unary(sum), True).top(100).eval()),
+        ('to_pandas', lambda: ql.query(rows).to_pandas()),
+    ]
+    min_rows = columns.COLUMNAR_MIN_ROWS
+    for name, run in columnar_runs:
+        print(name)
+        for mode, threshold in [('rows', len(rows) + len(builds) + 1), ('columns', min_rows)]:
+            columns.COLUMNAR_MIN_ROWS = threshold
+            print(f"  {mode:10} best {best_time(run, args.repeats) * 1000:7.2f}ms")
+    columns.COLUMNAR_MIN_ROWS = min_rows
+
+    champs = ['TFT12_Ahri', 'TFT12_Bard']
+    index_runs = [
+        ('match filters', query_indexed_comps().m, lambda comps: ql.query(comps).filter(ql.idx('level').in_set({'7', '8'})).filter(ql.idx('cluster').in_set({'1', '2', '3'})).eval()),
+        ('top_comps champs', query_indexed_top_comps().m, lambda comps: ql.query(comps).filter(has_champs(champs)).eval()),
+    ]
+    for name, comps, run in index_runs:
+        # A copy of the list has no indexes.
+        scan = list(comps)
+        assert run(comps) == run(scan), f"{name} differs when looked up"
+        print(name)
+        for mode, data in [('scan', scan), ('index', comps)]:
+            print(f"  {mode:10} best {best_time(lambda: run(data), args.repeats) * 1000:7.2f}ms")
+
+    text = "top_comps.filter(all([idx('units').contains('TFT12_Ahri'), idx('games').gt(100)])).sort_by(idx('games'), True).top(10)"
+    print('ad hoc query')
+    def uncached() -> Any:
+        PLANS.invalidate()
+        return run_query(text)
+    assert uncached() == run_query(text), "ad hoc query differs from its cached plan"
+    for mode, run in [('parse', uncached), ('plan cache', lambda: run_query(text))]:
+        print(f"  {mode:10} best {best_time(run, args.repeats) * 1000:7.2f}ms")
+
+    # The raw set data, as `/set_info` and `get_api_ids` would query it if it weren't decoded yet.
+    with open(SET_DATA_FILE, 'rb') as f:
+        set_bytes = f.read()
+    source_runs = [
+        ('item ids', lambda m: ql.query(m).idx('items').map(ql.idx('apiName')).eval()),
+        ('set info items', lambda m: ql.query(m).idx('items').map(ql.sub({'apiName': ql.idx('apiName'), 'composition': ql.idx('composition'), 'name': ql.idx('name')})).eval()),
+    ]
+    for name, run in source_runs:
+        assert run(set_bytes) == run(json.loads(set_bytes)), f"{name} differs on the json source"
+        print(name)
+        for mode, load in [('json.loads', lambda: run(json.loads(set_bytes))), ('json source', lambda: run(set_bytes))]:
+            print(f"  {mode:10} best {best_time(load, args.repeats) * 1000:7.2f}ms  peak {peak_memory(load) / 1024:7.0f}KB")
+
+    # A refresh that brought new data for three comps, as copies of what they had.
+    details = snapshot.apis[meta.MetaTFTApis.COMP_DETAILS.value]
+    changed = list(details)[:3]
+    def refresh_three() -> Any:
+        snapshot.apis[meta.MetaTFTApis.COMP_DETAILS.value] = details | {cid: dict(details[cid]) for cid in changed}
+        return query_comps().eval()
+    def refresh_whole() -> Any:
+        VIEWS.invalidate()
+        return refresh_three()
+    assert refresh_three() == refresh_whole(), "comps view differs when updated"
+    print(f"comps view ({len(changed)} of {len(details)} comps changed)")
+    for mode, run in [('whole', refresh_whole), ('changed', refresh_three)]:
+        print(f"  {mode:10} best {best_time(run, args.repeats) * 1000:7.2f}ms")
+    snapshot.apis[meta.MetaTFTApis.COMP_DETAILS.value] = details
+
+    # Long enough to be run in workers, see `tft.ql.parallel`.
+    many_rows = rows * max(1, -(-args.parallel_rows // len(rows)))
+    many_builds = make_builds(args.parallel_rows)
+    parallel_runs = [
+        ('match', lambda: ql.query(many_rows).map(ql.extend({'match_score': ql.unary(match_rank(champs))})).sort_by(ql.idx('match_score'), True).eval()),
+        ('builds from components', lambda: ql.query(many_builds).filter(ql.idx('items').unary(count_match_score(['TFT_Item_1', 'TFT_Item_2'])).eq(2)).eval()),
+    ]
+    workers = parallel.WORKERS
+    for name, run in parallel_runs:
+        parallel.WORKERS = 0
+        expected = run()
+        parallel.WORKERS = args.workers
+        assert run() == expected, f"{name} differs in workers"
+        print(f"{name} ({len(many_rows) if name == 'match' else len(many_builds)} rows, {parallel.workers()} workers on {parallel.available_cpus()} CPUs)")
+        for mode, count in [('serial', 0), (f"{parallel.workers()} workers", args.workers)]:
+            parallel.WORKERS = count
+            print(f"  {mode:10} best {best_time(run, args.repeats) * 1000:7.2f}ms")
+    parallel.WORKERS = workers
+    parallel.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,21 @@
+"""
+Records every MetaTFT response the client makes into fixtures, so the stand-in server can replay
+them for benchmarks without the network.
+
+Usage:
+    python scripts/record_fixtures.py
+"""
+import tft.client.meta as meta
+
+
+def main():
+    meta.create_client(meta.MetaTFTClientType.RECORD)
+    meta.get_set_data()
+    meta.get_comp_data()
+    meta.get_champ_item_data()
+    meta.get_comp_details()
+    print(f"Recorded fixtures to {meta.FIXTURE_DIR}")
+
+
+if __name__ == '__main__':
+    main()
@@ -58,6 +58,7 @@ import yaml
 DB = "{backend['db']}"
 IP = "{backend['ip']}"
 PORT = {backend['port']}
+REFRESH_INTERVAL = {backend['refresh_interval']}
 
 # Alias configs.
 CHAMP_ALIAS_FILE = "{files['champ_alias']}"
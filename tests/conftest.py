@@ -0,0 +1,41 @@
+"""
+Fixtures shared by the tests. Everything runs against `StandIn` on localhost, and the globals the
+client keeps, like the breaker and the snapshots, are swapped for fresh ones per test.
+"""
+from pathlib import Path
+import pytest
+import tft.client.meta as meta
+from tft.client.disk import DiskCache
+from tft.client.limits import CircuitBreaker, RetryPolicy
+from tft.client.standin import StandIn
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture(autouse=True)
+def client_globals(monkeypatch, tmp_path):
+    """Fresh guards, snapshots and caches, with the disk cache and fixtures under a temp directory."""
+    # The stand-in reads its defaults from `res/`.
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setattr(meta, 'BREAKER', CircuitBreaker(failure_threshold=2, reset_timeout=0.2))
+    monkeypatch.setattr(meta, 'RETRY_POLICY', RetryPolicy(attempts=3, base_delay=0.0))
+    monkeypatch.setattr(meta, 'SNAPSHOTS', type(meta.SNAPSHOTS)())
+    monkeypatch.setattr(meta, 'CLIENT', None)
+    monkeypatch.setattr(meta, 'DISK_CACHE', DiskCache(tmp_path / 'cache'))
+    monkeypatch.setattr(meta, 'FIXTURES', DiskCache(tmp_path / 'fixtures'))
+    monkeypatch.setattr(meta, 'URLS', dict(meta.URLS))
+
+
+def serve(**kwargs) -> StandIn:
+    """Starts a stand-in and points the client at it. Stop it with `stop()`."""
+    standin = StandIn(**kwargs)
+    standin.start()
+    meta.URLS.update(standin.urls())
+    return standin
+
+
+@pytest.fixture
+def standin():
+    server = serve()
+    yield server
+    server.stop()
@@ -0,0 +1,123 @@
+import pytest
+import requests
+import tft.client.meta as meta
+from tft.client.disk import DiskCache
+from tft.client.standin import StandIn
+from tft.queries.champs import query_champ_builds
+from tests.conftest import serve
+
+CHAMPS = ['TFT12_Ahri', 'TFT12_Bard']
+
+
+@pytest.fixture
+def replayed(tmp_path):
+    """A stand-in replaying fixtures, recorded here from a stand-in serving the defaults."""
+    recorder = serve()
+    try:
+        client = meta.MetaTFTClient(meta.MetaTFTClientType.RECORD, snapshot=meta.Snapshot())
+        client.fetch(meta.MetaTFTApis.SET_DATA)
+        for champ in CHAMPS:
+            client.fetch_champ(champ)
+    finally:
+        recorder.stop()
+    server = serve(fixture_dir=str(tmp_path / 'fixtures'))
+    yield server
+    server.stop()
+
+
+def write_fixture(champ: str, data: dict) -> None:
+    meta.FIXTURES.write(meta.MetaTFTApis.CHAMP_ITEMS.value, data, champ)
+
+
+def test_record_writes_fixtures(replayed):
+    assert sorted(meta.FIXTURES.keys(meta.MetaTFTApis.CHAMP_ITEMS.value)) == CHAMPS
+    assert meta.FIXTURES.read(meta.MetaTFTApis.SET_DATA.value) is not None
+
+
+def test_replays_recorded_fixtures(replayed):
+    write_fixture('TFT12_Ahri', {'builds': ['recorded']})
+    replayed.reload()
+    assert meta.get_champ_item_data('TFT12_Ahri') == {'TFT12_Ahri': {'builds': ['recorded']}}
+    assert meta.get_champ_item_data('TFT12_Bard')['TFT12_Bard'] == meta.FIXTURES.read(meta.MetaTFTApis.CHAMP_ITEMS.value, 'TFT12_Bard')
+
+
+def test_cold_start_then_warm_reads(replayed):
+    set_data = meta.get_set_data()
+    champ = meta.get_champ_item_data('TFT12_Ahri')['TFT12_Ahri']
+    served = replayed.requests_served
+    assert served == 2
+    assert meta.get_set_data() is set_data
+    assert meta.get_champ_item_data('TFT12_Ahri')['TFT12_Ahri'] is champ
+    assert replayed.requests_served == served
+
+
+def test_refresh_within_ttl_carries_data_over(replayed):
+    set_data = meta.get_set_data()
+    snapshot = meta.refresh()
+    # Nothing changed, so the snapshot is kept.
+    assert snapshot is meta.get_snapshot()
+    assert meta.get_set_data() is set_data
+    assert replayed.requests_served == 1
+
+
+def test_refresh_reuses_not_modified_responses(replayed, monkeypatch):
+    monkeypatch.setattr(meta, 'TTLS', {api: 0 for api in meta.TTLS})
+    set_data = meta.get_set_data()
+    champs = {champ: meta.get_champ_item_data(champ)[champ] for champ in CHAMPS}
+    version = meta.get_version()
+
+    snapshot = meta.refresh()
+    assert replayed.not_modified_served == 3
+    assert snapshot.version == version
+    assert meta.get_set_data() is set_data
+
+    write_fixture('TFT12_Ahri', {'builds': ['changed']})
+    replayed.reload()
+    snapshot = meta.refresh()
+    assert snapshot.version == version + 1
+    assert meta.get_snapshot() is snapshot
+    # Only the changed champ is new, everything that got a 304 is the same object.
+    assert meta.get_champ_item_data('TFT12_Ahri')['TFT12_Ahri'] == {'builds': ['changed']}
+    assert meta.get_champ_item_data('TFT12_Bard')['TFT12_Bard'] is champs['TFT12_Bard']
+    assert meta.get_set_data() is set_data
+
+
+def test_champ_builds_follow_refreshes(replayed, monkeypatch):
+    monkeypatch.setattr(meta, 'TTLS', {api: 0 for api in meta.TTLS})
+    write_fixture('TFT12_Ahri', {'builds': [{'buildNames': 'A|B', 'places': [1, 2]}]})
+    replayed.reload()
+    # Built before the refresh, and read when evaluated.
+    query = query_champ_builds('TFT12_Ahri')
+    assert query.eval() == [{'items': ['A', 'B'], 'places': [1, 2]}]
+    cached = query.eval_cached()
+    meta.refresh()
+    assert query.eval_cached() is cached
+
+    write_fixture('TFT12_Ahri', {'builds': [{'buildNames': 'C', 'places': [3]}]})
+    replayed.reload()
+    meta.refresh()
+    assert query.eval() == query.eval_cached() == [{'items': ['C'], 'places': [3]}]
+
+
+@pytest.mark.parametrize('api', [meta.MetaTFTApis.CHAMP_ITEMS, meta.MetaTFTApis.COMPS_DATA])
+def test_bodies_that_arent_utf8_fail_to_decode(api):
+    with pytest.raises(requests.JSONDecodeError):
+        meta.decode(api, b'{"builds": "\xff\xfe"}')
+
+
+def test_bodies_that_arent_utf8_fall_back_to_disk(standin, monkeypatch):
+    body = StandIn.body
+    monkeypatch.setattr(StandIn, 'body', lambda self, api, key: (b'{"builds": "\xff\xfe"}', '"bad"') if api == meta.MetaTFTApis.CHAMP_ITEMS else body(self, api, key))
+    meta.DISK_CACHE.sub(meta.DEFAULT_DATASET.name()).write(meta.MetaTFTApis.CHAMP_ITEMS.value, {'builds': ['from disk']}, 'TFT12_Ahri')
+    client = meta.MetaTFTClient(snapshot=meta.Snapshot())
+    assert client.fetch_champ('TFT12_Ahri') == {'builds': ['from disk']}
+    assert standin.requests_served == 1
+
+
+@pytest.mark.parametrize('key', ['', '.', '..', 'a/b', '..\\x', '/tmp/x', 'C:x'])
+def test_disk_cache_rejects_bad_keys(tmp_path, key):
+    disk = DiskCache(tmp_path)
+    with pytest.raises(ValueError):
+        disk.path('champ_items', key)
+    with pytest.raises(ValueError):
+        disk.sub(key)
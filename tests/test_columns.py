@@ -0,0 +1,59 @@
+import random
+import pytest
+import tft.ql.columns as columns
+import tft.ql.expr as ql
+
+rng = random.Random(0)
+ROWS = [
+    {'level': rng.choice(['6', '7', '8']), 'games': rng.randint(0, 2000), 'avg_place': rng.uniform(1, 8), 'places': [rng.randint(0, 50) for _ in range(8)]}
+    for _ in range(1000)
+]
+QUERIES = [
+    ql.query().filter(ql.idx('avg_place').lt(4.5)).filter(ql.idx('games').gt(1000)).sort_by(ql.idx('avg_place')),
+    ql.query().filter(ql.idx('level').in_set({'7', '8'})).sort_by(ql.idx('games'), True).top(50),
+    ql.query().filter(ql.idx('level').eq('6')).sort_by(ql.idx('games')),
+    ql.query().sort_by(ql.idx('places').unary(sum), True).top(100),
+    ql.query().filter(ql.all([ql.idx('games').gt(100), ql.idx('level').eq('7').neg()])).len(),
+]
+
+
+def run(query: ql.BaseQuery, min_rows: int, monkeypatch) -> list:
+    monkeypatch.setattr(columns, 'COLUMNAR_MIN_ROWS', min_rows)
+    return query.eval(ROWS)
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_columns_match_rows(query, monkeypatch):
+    by_rows = run(query, len(ROWS) + 1, monkeypatch)
+    by_columns = run(query, 1, monkeypatch)
+    assert by_columns == by_rows
+    if isinstance(by_rows, list):
+        # The rows that come out are the same objects that went in.
+        assert all(a is b for a, b in zip(by_columns, by_rows))
+
+
+@pytest.mark.parametrize('min_rows', [len(ROWS) + 1, 1])
+def test_rows_without_a_field_fail_like_rows(min_rows, monkeypatch):
+    rows = ROWS + [{'level': '6'}]
+    monkeypatch.setattr(columns, 'COLUMNAR_MIN_ROWS', min_rows)
+    with pytest.raises(AssertionError, match='No field games'):
+        ql.query().filter(ql.idx('games').gt(1000)).eval(rows)
+
+
+def test_lists_with_other_rows_arent_tables(monkeypatch):
+    monkeypatch.setattr(columns, 'COLUMNAR_MIN_ROWS', 1)
+    assert columns.is_table(ROWS)
+    assert not columns.is_table(ROWS + [['6', 100]])
+
+
+def test_errors_in_sub_queries_are_raised_once(monkeypatch):
+    calls = []
+    def check(games: int) -> int:
+        calls.append(games)
+        if len(calls) == 10:
+            raise ValueError(games)
+        return games
+    with pytest.raises(ValueError):
+        run(ql.query().sort_by(ql.idx('games').unary(check)), 1, monkeypatch)
+    # The rows aren't run again one at a time after the columns fail.
+    assert len(calls) == 10
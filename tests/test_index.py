@@ -0,0 +1,70 @@
+import random
+import pytest
+import tft.ql.expr as ql
+from tft.ql.index import INDEXES, HashIndex
+
+rng = random.Random(1)
+UNITS = [f"U{i}" for i in range(12)]
+ROWS = [
+    {'units': rng.sample(UNITS, rng.randint(1, 6)), 'cluster': str(rng.randint(0, 20)), 'level': rng.choice(['6', '7', '8', '9']), 'games': rng.randint(0, 1000), 'n': rng.choice([1, 2, 3.0, True])}
+    for _ in range(200)
+]
+PREDICATES = [
+    ql.idx('units').contains('U3'),
+    ql.idx('cluster').in_set({'1', '2', '3'}),
+    ql.idx('cluster').in_set(['4', '5']),
+    ql.idx('level').eq('7'),
+    # 1, 1.0 and True are equal, and hash the same.
+    ql.idx('n').eq(1),
+    ql.idx('n').in_set({3}),
+    ql.all([ql.idx('units').contains(unit) for unit in ['U1', 'U2']]),
+    ql.all([]),
+    ql.all([ql.idx('units').contains('U1'), ql.idx('games').gt(500)]),
+    ql.all([ql.idx('games').gt(300), ql.idx('level').in_set(['7', '8']), ql.idx('units').len().gt(2)]),
+    ql.any([ql.idx('level').eq('6'), ql.idx('units').contains('U0')]),
+    ql.any([ql.idx('level').eq('6'), ql.idx('games').gt(900)]),
+    ql.idx('cluster').eq('missing'),
+    ql.idx('units').eq(['U1']),
+    ql.idx('level').contains('7'),
+]
+TAILS = [
+    lambda q: q,
+    lambda q: q.sort_by(ql.idx('games'), True).top(5),
+    lambda q: q.map(ql.idx('games')),
+    lambda q: q.len(),
+]
+
+
+@pytest.fixture
+def indexed():
+    INDEXES.invalidate()
+    rows = ql.query(ROWS).indexed(['units', 'cluster', 'level', 'n', 'missing']).m
+    assert INDEXES.get(rows) is not None
+    yield rows
+    INDEXES.invalidate()
+
+
+@pytest.mark.parametrize('predicate', PREDICATES)
+@pytest.mark.parametrize('tail', TAILS)
+def test_lookups_match_scans(indexed, predicate, tail):
+    # A copy of the list has no indexes, so it is scanned.
+    scanned = tail(ql.query(list(indexed)).filter(predicate)).interpret()
+    assert tail(ql.query(indexed).filter(predicate)).eval() == scanned
+    assert tail(ql.query(indexed).filter(predicate).filter(ql.idx('games').ge(0))).eval() == scanned
+
+
+def test_multi_valued_postings():
+    index = HashIndex.build([{'u': ['a', 'b']}, {'u': ['b']}, {'u': []}], lambda row: row['u'])
+    assert index.multi
+    assert index.lookup('b').tolist() == [0, 1]
+    assert index.lookup_any(['a', 'c']).tolist() == [0]
+
+
+def test_mixed_fields_are_not_indexed():
+    assert HashIndex.build([{'u': ['a']}, {'u': 'a'}], lambda row: row['u']) is None
+    assert HashIndex.build([{'u': 'a'}, {}], lambda row: row['u']) is None
+
+
+def test_invalidate_drops_indexes(indexed):
+    INDEXES.invalidate()
+    assert INDEXES.get(indexed) is None
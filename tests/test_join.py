@@ -0,0 +1,41 @@
+import random
+import pytest
+import tft.ql.expr as ql
+
+rng = random.Random(0)
+RIGHT = [{'id': rng.randint(0, 8), 'tags': rng.sample(range(6), rng.randint(0, 3)), 'v': i} for i in range(60)]
+LEFT = [{'k': rng.randint(0, 10), 'ks': [rng.randint(0, 10) for _ in range(rng.randint(0, 4))], 'name': i} for i in range(80)]
+SCALARS = [rng.randint(0, 10) for _ in range(30)]
+CASES = [
+    (LEFT, ql.query(RIGHT), ql.idx('k'), ql.idx('id')),
+    (LEFT, ql.query(RIGHT), ql.idx('ks'), ql.idx('id')),
+    (LEFT, ql.query(RIGHT), ql.idx('k'), ql.idx('tags')),
+    (LEFT, ql.query(RIGHT), ql.idx('ks'), ql.idx('tags')),
+    (SCALARS, ql.query(RIGHT), ql.query(), ql.idx('id')),
+    (LEFT, ql.query(RIGHT), ql.idx('k'), ql.idx('id').unary(lambda x: x + 1)),
+    (LEFT, ql.query(RIGHT).filter(ql.idx('v').gt(3)), ql.idx('k'), ql.idx('id')),
+]
+
+
+@pytest.mark.parametrize('case', CASES)
+@pytest.mark.parametrize('how', ['inner', 'left'])
+def test_hash_join_matches_interpreted(case, how):
+    m, other, left_key, right_key = case
+    query = ql.query(m).join(other, left_key, right_key, how)
+    assert query.eval() == query.interpret()
+    # Once the hash table is kept.
+    assert query.eval() == query.interpret()
+    streamed = ql.query(m).join(other, left_key, right_key, how).map(ql.query()).top(3)
+    assert streamed.eval() == streamed.interpret()
+
+
+def test_join_merges_right_rows_in_order():
+    left = [{'k': 1, 'a': 0}, {'k': 2}]
+    right = ql.query([{'id': 1, 'k': 5}, {'id': 1, 'z': 2}])
+    assert ql.query(left).join(right, ql.idx('k'), ql.idx('id')).eval() == [{'k': 5, 'a': 0, 'id': 1}, {'k': 1, 'a': 0, 'id': 1, 'z': 2}]
+    assert ql.query(left).join(right, ql.idx('k'), ql.idx('id'), 'left').eval()[-1] == {'k': 2}
+
+
+def test_join_without_right_key_raises():
+    with pytest.raises(Exception, match="Can't hash the rows to join to"):
+        ql.query([{'k': 1}]).join(ql.query([{'x': 1}]), ql.idx('k'), ql.idx('id')).eval()
@@ -0,0 +1,139 @@
+import time
+import pytest
+import requests
+import tft.client.meta as meta
+from tft.client.limits import BreakerState, CircuitOpenException
+from tests.conftest import serve
+
+CHAMP = 'TFT12_Ahri'
+
+
+@pytest.fixture
+def throttled():
+    """A stand-in that answers every request with a 429 and no wait."""
+    server = serve(throttle=1.0, retry_after=0)
+    yield server
+    server.stop()
+
+
+def url() -> str:
+    return meta.URLS[meta.MetaTFTApis.SET_DATA]
+
+
+def write_shard(data: dict) -> None:
+    meta.DISK_CACHE.sub(meta.DEFAULT_DATASET.name()).write(meta.MetaTFTApis.CHAMP_ITEMS.value, data, CHAMP)
+
+
+def test_guarded_get_returns_response(standin):
+    assert meta.guarded_get(url()).status_code == 200
+    assert meta.BREAKER.state == BreakerState.CLOSED
+
+
+def test_retry_after_is_honoured():
+    server = serve(throttle=1.0, retry_after=1)
+    try:
+        meta.RETRY_POLICY.attempts = 2
+        start = time.monotonic()
+        with pytest.raises(requests.HTTPError):
+            meta.guarded_get(url())
+        assert time.monotonic() - start >= 1.0
+    finally:
+        server.stop()
+
+
+def test_retries_stop_after_attempts(throttled):
+    with pytest.raises(requests.HTTPError):
+        meta.guarded_get(url())
+    assert throttled.throttled_served == meta.RETRY_POLICY.attempts
+
+
+def test_breaker_opens_after_failures(throttled):
+    for _ in range(meta.BREAKER.failure_threshold):
+        with pytest.raises(requests.HTTPError):
+            meta.guarded_get(url())
+    assert meta.BREAKER.state == BreakerState.OPEN
+    served = throttled.throttled_served
+    with pytest.raises(CircuitOpenException):
+        meta.guarded_get(url())
+    assert throttled.throttled_served == served
+
+
+def test_breaker_half_opens_after_reset_timeout(throttled):
+    for _ in range(meta.BREAKER.failure_threshold):
+        with pytest.raises(requests.HTTPError):
+            meta.guarded_get(url())
+    time.sleep(meta.BREAKER.reset_timeout + 0.05)
+    # A single trial call is let through, and failing it opens the breaker again.
+    with pytest.raises(requests.HTTPError):
+        meta.guarded_get(url())
+    assert meta.BREAKER.state == BreakerState.OPEN
+    with pytest.raises(CircuitOpenException):
+        meta.guarded_get(url())
+    time.sleep(meta.BREAKER.reset_timeout + 0.05)
+    assert meta.BREAKER.allow()
+    assert meta.BREAKER.state == BreakerState.HALF_OPEN
+    assert not meta.BREAKER.allow()
+
+
+def test_breaker_closes_after_successful_trial(throttled):
+    for _ in range(meta.BREAKER.failure_threshold):
+        with pytest.raises(requests.HTTPError):
+            meta.guarded_get(url())
+    throttled.throttle = 0.0
+    time.sleep(meta.BREAKER.reset_timeout + 0.05)
+    assert meta.guarded_get(url()).status_code == 200
+    assert meta.BREAKER.state == BreakerState.CLOSED
+
+
+class FailingSession:
+    """A session whose requests fail with an error that isn't worth retrying."""
+    def __init__(self):
+        self.calls = 0
+
+    def get(self, url, **kwargs):
+        self.calls += 1
+        raise requests.TooManyRedirects(f"Exceeded redirects for {url}")
+
+
+def test_other_errors_fail_the_trial(throttled, monkeypatch):
+    for _ in range(meta.BREAKER.failure_threshold):
+        with pytest.raises(requests.HTTPError):
+            meta.guarded_get(url())
+    time.sleep(meta.BREAKER.reset_timeout + 0.05)
+    session = FailingSession()
+    get_session = meta.get_session
+    monkeypatch.setattr(meta, 'get_session', lambda: session)
+    with pytest.raises(requests.TooManyRedirects):
+        meta.guarded_get(url())
+    # Not retried, and the breaker is open again rather than stuck half open.
+    assert session.calls == 1
+    assert meta.BREAKER.state == BreakerState.OPEN
+    monkeypatch.setattr(meta, 'get_session', get_session)
+    throttled.throttle = 0.0
+    time.sleep(meta.BREAKER.reset_timeout + 0.05)
+    assert meta.guarded_get(url()).status_code == 200
+    assert meta.BREAKER.state == BreakerState.CLOSED
+
+
+def test_open_breaker_serves_disk_shard(standin):
+    write_shard({'builds': ['from disk']})
+    for _ in range(meta.BREAKER.failure_threshold):
+        meta.BREAKER.record_failure()
+    client = meta.MetaTFTClient(snapshot=meta.Snapshot())
+    assert client.fetch_champ(CHAMP) == {'builds': ['from disk']}
+    assert standin.requests_served == 0
+
+
+def test_exhausted_retries_serve_disk_shard(throttled):
+    write_shard({'builds': ['from disk']})
+    client = meta.MetaTFTClient(snapshot=meta.Snapshot())
+    assert client.fetch_champ(CHAMP) == {'builds': ['from disk']}
+    assert throttled.throttled_served == meta.RETRY_POLICY.attempts
+
+
+def test_open_breaker_without_shard_raises(standin):
+    for _ in range(meta.BREAKER.failure_threshold):
+        meta.BREAKER.record_failure()
+    client = meta.MetaTFTClient(snapshot=meta.Snapshot())
+    with pytest.raises(CircuitOpenException):
+        client.fetch_champ(CHAMP)
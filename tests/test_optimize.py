@@ -0,0 +1,51 @@
+import random
+import pytest
+import tft.ql.expr as ql
+
+rng = random.Random(5)
+GROUPS = {str(g): [{'count': rng.randint(0, 50), 'lvl': rng.choice(['6', '7', '8']), 'u': 'a&b'} for _ in range(rng.randint(1, 8))] for g in range(30)}
+GROUPS['single'] = {'count': 3, 'lvl': '7', 'u': 'c'}
+BASE = ql.query(GROUPS).explode('cluster').map(ql.sub({
+    'games': ql.idx('count'),
+    'level': ql.idx('lvl'),
+    'units': ql.idx('u').split('&'),
+    'cluster': ql.idx('cluster'),
+})).sort_by(ql.idx('games'), True)
+QUERIES = [
+    BASE.filter(ql.idx('level').in_set({'7'})).filter(ql.idx('cluster').in_set({'3', '4', 'single'})),
+    BASE.filter(ql.idx('games').gt(10)).top(5),
+    BASE.filter(ql.idx('units').len().eq(2)),
+    BASE.map(ql.extend({'x': ql.idx('games').unary(lambda g: g * 2)})).filter(ql.idx('x').gt(40)).filter(ql.idx('level').eq('8')),
+    BASE.noop().map(ql.idx('games')).map(ql.unary(lambda g: g + 1)).filter(ql.query().gt(20)),
+    BASE.filter(ql.any([ql.idx('games').lt(3), ql.idx('level').eq('6')])),
+    ql.query(GROUPS).explode('cluster').filter(ql.idx('count').gt(25)).filter(ql.idx('cluster').eq('2')),
+    ql.query(GROUPS).explode('cluster').filter(ql.idx('count').gt(25)).filter(ql.idx('lvl').eq('7')).len(),
+    BASE.top(3),
+]
+
+
+def names(query: ql.BaseQuery) -> list[str]:
+    return [type(transform).__name__ for transform in ql.optimize(query.transforms)]
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_optimized_matches_interpreted(query):
+    # `interpret` runs the transforms as written, one at a time.
+    assert query.eval() == query.interpret()
+
+
+def test_filter_moves_before_sort():
+    query = ql.query([]).sort_by(ql.idx('g'), True).filter(ql.idx('a').eq(1))
+    assert names(query) == ['Filter', 'SortBy']
+
+
+def test_filter_on_cluster_moves_into_explode():
+    assert 'Filter' not in names(QUERIES[6])
+
+
+def test_sort_and_top_become_top_by():
+    assert names(ql.query([]).sort_by(ql.idx('g')).top(3)) == ['TopBy']
+
+
+def test_noops_are_dropped():
+    assert names(ql.query([]).noop().len()) == ['Length']
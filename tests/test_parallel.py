@@ -0,0 +1,75 @@
+import os
+import random
+import pytest
+import tft.ql.expr as ql
+import tft.ql.parallel as parallel
+from tft.ql.parallel import SnapshotRegistry
+from tft.ql.util import count_match_score, match_rank, match_score
+
+rng = random.Random(0)
+CHAMPS = [f"C{i}" for i in range(40)]
+ROWS = [{'units': rng.sample(CHAMPS, 8), 'games': rng.randint(0, 1000), 'level': str(rng.randint(6, 9))} for _ in range(3000)]
+QUERIES = [
+    lambda: ql.query(ROWS).map(ql.extend({'match_score': ql.unary(match_rank(['C1', 'C2']))})).sort_by(ql.idx('match_score'), True).top(20),
+    lambda: ql.query(ROWS).filter(ql.idx('units').unary(match_score(['C1', 'C2', 'C3'])).ge(2)),
+    lambda: ql.query(ROWS).filter(ql.idx('level').eq('7')).filter(ql.idx('units').unary(count_match_score(['C1', 'C5'])).eq(2)),
+    lambda: ql.query(ROWS).map(ql.idx('units').unary(match_score(['C4']))),
+]
+
+
+@pytest.fixture(scope='module')
+def workers():
+    """Two workers, even on a machine with one CPU, for lists of 1000 rows and up."""
+    patch = pytest.MonkeyPatch()
+    patch.setattr(parallel, 'available_cpus', lambda: 2)
+    patch.setattr(parallel, 'MIN_ROWS', 1000)
+    yield patch
+    parallel.shutdown()
+    patch.undo()
+
+
+def test_off_by_default():
+    assert parallel.WORKERS == 0
+    assert not parallel.enabled()
+
+
+def test_workers_bounded_by_cpus(monkeypatch):
+    monkeypatch.setattr(parallel, 'available_cpus', lambda: 1)
+    monkeypatch.setattr(parallel, 'WORKERS', 4)
+    assert parallel.workers() == 1
+    assert not parallel.enabled()
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_workers_match_serial(workers, query):
+    serial = query().eval()
+    workers.setattr(parallel, 'WORKERS', 2)
+    try:
+        assert parallel.enabled()
+        assert query().eval() == serial
+    finally:
+        workers.setattr(parallel, 'WORKERS', 0)
+
+
+def test_filter_keeps_the_callers_rows(workers):
+    workers.setattr(parallel, 'WORKERS', 2)
+    try:
+        kept = ql.query(ROWS).filter(ql.idx('units').unary(match_score(['C1']))).eval()
+    finally:
+        workers.setattr(parallel, 'WORKERS', 0)
+    assert all(a is b for a, b in zip(kept, [row for row in ROWS if match_score(['C1'])(row['units'])]))
+
+
+def test_snapshots_follow_the_rows():
+    snapshots = SnapshotRegistry()
+    rows = [{'a': i} for i in range(10)]
+    path = snapshots.path(rows)
+    assert snapshots.path(rows) == path
+    # The same rows in another list share nothing with it.
+    assert snapshots.path(list(rows)) != path
+    rows.append({'a': 10})
+    changed = snapshots.path(rows)
+    assert changed != path and not os.path.exists(path)
+    rows[0] = {'a': -1}
+    assert snapshots.path(rows) != changed
+    snapshots.close()
@@ -0,0 +1,58 @@
+import time
+import pytest
+import tft.ql.expr as ql
+from tft.ql.budget import BudgetExceeded, limit
+from tft.ql.parse import Plan, PlanCache, ParseError, parse
+
+ROWS = [{'units': ['A', 'B'] if i % 3 == 0 else ['C'], 'games': i, 'level': str(6 + i % 3)} for i in range(100)]
+DATASETS = {'comps': lambda: ql.query(ROWS)}
+
+
+@pytest.mark.parametrize('text, query', [
+    ("comps.filter(idx('units').contains('A')).sort_by(idx('games'), True).top(5)", ql.query(ROWS).filter(ql.idx('units').contains('A')).sort_by(ql.idx('games'), True).top(5)),
+    ("comps.filter(ql.all([idx('level').in_set(['7', '8']), idx('games').gt(50)])).len()", ql.query(ROWS).filter(ql.all([ql.idx('level').in_set(['7', '8']), ql.idx('games').gt(50)])).len()),
+    ("comps.group_by(idx('level')).agg({'n': count(), 'games': sum(idx('games'))})", ql.query(ROWS).group_by(ql.idx('level')).agg({'n': ql.count(), 'games': ql.sum(ql.idx('games'))})),
+    ("comps.filter(idx('level').eq('7')).map(sub({'g': idx('games')})).top(2, true)", ql.query(ROWS).filter(ql.idx('level').eq('7')).map(ql.sub({'g': ql.idx('games')})).top(2, True)),
+])
+def test_text_matches_python(text, query):
+    assert parse(text, DATASETS).eval() == query.eval()
+
+
+@pytest.mark.parametrize('text', [
+    "__import__('os').system('true')",
+    "comps.filter(idx('games').unary(print))",
+    "comps.__class__",
+    "comps.filter(lambda row: True)",
+    "champs.len()",
+    "idx('games')",
+    "comps.len(",
+    "comps" + ".noop()" * 1000,
+])
+def test_invalid_text_raises(text):
+    with pytest.raises(ParseError):
+        parse(text, DATASETS)
+
+
+def test_plan_cache_hits_until_invalidated():
+    plans = PlanCache()
+    text = "comps.len()"
+    first = plans.get(text, lambda: Plan.build(text, DATASETS))
+    assert plans.get(text, lambda: Plan.build(text, DATASETS)) is first
+    assert first.run() == 100
+    plans.invalidate()
+    assert plans.get(text, lambda: Plan.build(text, DATASETS)) is not first
+    assert plans.stats()['hits'] == 1 and plans.stats()['misses'] == 2
+
+
+def test_budget_stops_checked_queries():
+    def slow(games: int) -> bool:
+        time.sleep(0.01)
+        return True
+    fn = ql.query().filter(ql.idx('games').unary(slow)).compile_checked()
+    start = time.perf_counter()
+    with pytest.raises(BudgetExceeded):
+        with limit(0.05):
+            fn(ROWS)
+    assert time.perf_counter() - start < 0.5
+    # Outside a budget checked queries run as usual.
+    assert len(fn(ROWS[:5])) == 5
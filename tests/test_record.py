@@ -0,0 +1,34 @@
+import copy
+import pickle
+import pytest
+import tft.ql.expr as ql
+from tft.ql.record import FrozenList, Record, freeze
+
+DATA = {'comps': {'1': [{'units': ['TFT12_Ahri'], 'games': 10}], '2': [{'units': ['TFT12_Bard'], 'games': 5}]}}
+
+
+def test_freeze_keeps_values():
+    frozen = freeze(DATA)
+    assert frozen == DATA
+    assert isinstance(frozen['comps']['1'], FrozenList)
+    assert isinstance(frozen['comps']['1'][0], Record)
+
+
+def test_rows_from_the_cache_cant_be_changed():
+    rows = ql.query(freeze(DATA)).idx('comps').explode('cluster').eval()
+    with pytest.raises(TypeError):
+        rows[0]['units'].append('TFT12_Bard')
+    with pytest.raises(TypeError):
+        rows[0]['games'] = 0
+    with pytest.raises(TypeError):
+        rows[0]['units'][0] = 'TFT12_Bard'
+    assert freeze(DATA) == DATA
+
+
+def test_copies_can_be_changed():
+    frozen = freeze(DATA)
+    changed = copy.deepcopy(frozen)
+    changed['comps']['1'][0]['units'].append('TFT12_Bard')
+    assert type(changed['comps']['1']) is list
+    assert frozen == DATA
+    assert pickle.loads(pickle.dumps(frozen)) == frozen
@@ -0,0 +1,35 @@
+import pytest
+import tft.client.meta as meta
+from tft.interpreter import server
+
+
+@pytest.fixture
+def app(standin):
+    return server.app.test_client()
+
+
+def test_bis_serves_builds(app):
+    response = app.get('/bis?champ_id=TFT12_Ahri')
+    assert response.status_code == 200
+    assert 'error' not in response.get_json()
+
+
+@pytest.mark.parametrize('champ_id', ['TFT12_Nobody', '..', '../../etc/passwd', '..\\..\\x', '/tmp/x'])
+def test_bis_rejects_unknown_champs(app, standin, champ_id):
+    response = app.get('/bis', query_string={'champ_id': champ_id})
+    assert response.status_code == 400
+    assert response.get_json()['builds'] == []
+    # Only the set data was requested, and nothing was written for the champ.
+    assert standin.requests_served == 1
+    assert meta.DISK_CACHE.sub(meta.DEFAULT_DATASET.name()).keys(meta.MetaTFTApis.CHAMP_ITEMS.value) == []
+
+
+def test_unknown_ids_are_never_fetched(standin):
+    with pytest.raises(ValueError):
+        meta.get_champ_item_data('TFT12_Nobody')
+    with pytest.raises(ValueError):
+        meta.get_comp_details('not a cluster')
+    # Only the set data and the comp data were requested, to look the ids up.
+    assert standin.requests_served == 2
+    assert meta.DISK_CACHE.sub(meta.DEFAULT_DATASET.name()).keys(meta.MetaTFTApis.CHAMP_ITEMS.value) == []
+
@@ -0,0 +1,89 @@
+import json
+import pytest
+import tft.ql.expr as ql
+from tft.client.extract import extract, projection
+from tft.ql.source import JsonSource
+
+DOCUMENT = {
+    'tft_set': 'TFTSet12',
+    'results': {'data': {'cluster_details': {
+        '1': {'units_string': 'TFT12_Ahri, TFT12_Bard', 'games': 10, 'traits': ['Arcana']},
+        '2': {'units_string': 'TFT12_Nami', 'games': 5, 'traits': []},
+    }}},
+    'ignored': [{'a': [1, 2, {'b': None}]}, 'x' * 100],
+}
+
+
+def _prune(data, spec):
+    """What `extract` keeps, from the document decoded whole."""
+    if spec is True:
+        return data
+    if isinstance(data, dict):
+        children = {key: spec.get(key, spec.get('*')) for key in data}
+        return {key: _prune(data[key], child) for key, child in children.items() if child is not None}
+    if isinstance(data, list):
+        return [_prune(value, spec['*']) for value in data] if '*' in spec else []
+    return data
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / 'document.json'
+    path.write_text(json.dumps(DOCUMENT, indent=1))
+    return path
+
+
+@pytest.mark.parametrize('paths', [
+    ['tft_set'],
+    ['results.data.cluster_details.*.units_string'],
+    ['tft_set', 'results.data.cluster_details.*.games', 'ignored.*.a'],
+    ['results.data', 'results.data.cluster_details.1'],
+])
+def test_extract_keeps_what_a_full_decode_would(paths):
+    spec = projection(paths)
+    text = json.dumps(DOCUMENT)
+    assert extract(text, spec) == _prune(DOCUMENT, spec)
+    assert JsonSource(text.encode()).extract(spec) == _prune(DOCUMENT, spec)
+
+
+def test_extract_rejects_invalid_documents():
+    with pytest.raises(json.JSONDecodeError):
+        extract('{"tft_set": "TFTSet12"', projection(['tft_set']))
+    with pytest.raises(json.JSONDecodeError):
+        extract('{"tft_set": "TFTSet12"} []', projection(['tft_set']))
+
+
+def test_queries_decode_what_they_read(path):
+    with JsonSource.open(path) as source:
+        units = ql.query(source).idx('results.data.cluster_details').map(ql.idx('units_string')).eval()
+        assert units == {'1': 'TFT12_Ahri, TFT12_Bard', '2': 'TFT12_Nami'}
+        assert ql.query(source).idx('tft_set').eval() == 'TFTSet12'
+        assert source.load() == DOCUMENT
+
+
+def test_parts_are_decoded_once(path):
+    with JsonSource.open(path) as source:
+        spec = projection(['tft_set'])
+        assert source.extract(spec) is source.extract(spec)
+        text = source.text()
+        assert source.text() is text
+        assert source.extract(projection(['ignored'])) == {'ignored': DOCUMENT['ignored']}
+        assert source.text() is text
+
+
+def test_close_unmaps_the_file(path):
+    source = JsonSource.open(path)
+    with source:
+        assert source.extract(projection(['tft_set'])) == {'tft_set': 'TFTSet12'}
+    assert source.data.closed
+    with pytest.raises(ValueError):
+        source.extract(projection(['tft_set']))
+
+
+def test_empty_files(tmp_path):
+    path = tmp_path / 'empty.json'
+    path.touch()
+    with JsonSource.open(path) as source:
+        assert source.nbytes() == 0
+        with pytest.raises(json.JSONDecodeError):
+            source.load()
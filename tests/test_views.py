@@ -0,0 +1,161 @@
+import threading
+import time
+import pytest
+import tft.ql.expr as ql
+import tft.ql.views as views
+from tft.ql.cache import QueryCache
+from tft.ql.index import IndexRegistry
+from tft.ql.views import View, ViewRegistry, ViewSource
+
+PARTITION = ql.query().map(ql.idx('options').map(ql.extend({'score': ql.idx('games').unary(lambda games: games * 2)}))).explode('cluster')
+BY_GAMES = ql.query().sort_by(ql.idx('games'), True)
+
+
+def make_data(comps: int) -> dict:
+    return {str(cid): {'options': [{'games': cid * 10 + option, 'level': str(7 + option % 2)} for option in range(3)]} for cid in range(comps)}
+
+
+@pytest.fixture
+def data(monkeypatch):
+    """Comps by cluster in the `comps` view, in a registry of its own with caches of its own."""
+    data = {'comps': make_data(10)}
+    monkeypatch.setattr(views, 'VIEWS', ViewRegistry())
+    monkeypatch.setattr(ql, 'RESULTS', QueryCache())
+    monkeypatch.setattr(ql, 'INDEXES', IndexRegistry())
+    views.VIEWS.define('comps', lambda scope: data['comps'], PARTITION, BY_GAMES)
+    return data
+
+
+def whole(data: dict) -> list:
+    return BY_GAMES.eval(PARTITION.eval(data['comps']))
+
+
+def test_only_changed_partitions_are_evaluated(data):
+    view = views.VIEWS._views['comps']
+    rows = view.get()
+    assert rows == whole(data)
+    assert view.evaluated == 10 and view.version() == 1
+    data['comps'] = data['comps'] | {cid: {'options': [{'games': 1000, 'level': '9'}]} for cid in ['1', '4', '7']}
+    changed = view.get()
+    assert changed == whole(data)
+    assert view.evaluated == 13 and view.version() == 2
+    assert changed is not rows
+
+
+def test_views_evaluated_again_get_new_versions(data):
+    view = views.VIEWS._views['comps']
+    query = ql.query(ViewSource('comps')).map(ql.idx('games'))
+    query.eval_cached()
+    view.invalidate()
+    data['comps'] = make_data(3)
+    assert query.eval_cached() == [row['games'] for row in whole(data)]
+    assert view.version() == 2
+
+
+def test_unchanged_views_are_the_same_object(data):
+    view = views.VIEWS._views['comps']
+    rows = view.get()
+    data['comps'] = dict(data['comps'])
+    assert view.get() is rows
+    assert view.evaluated == 10 and view.version() == 1
+
+
+def test_removed_partitions_change_the_view(data):
+    view = views.VIEWS._views['comps']
+    view.get()
+    del data['comps']['3']
+    assert view.get() == whole(data)
+    assert view.version() == 2
+
+
+def test_source_can_change_while_it_is_read():
+    data = make_data(5)
+    def fetch(games: int) -> int:
+        # Like a fetch on another thread adding to the snapshot's cache.
+        data.setdefault('added', {'options': []})
+        return games
+    view = View('comps', lambda scope: data, ql.query().map(ql.idx('options').map(ql.idx('games').unary(fetch))))
+    assert view.get() == {str(cid): [cid * 10 + option for option in range(3)] for cid in range(5)}
+    assert 'added' in view.get()
+
+
+def test_scopes_are_dropped_least_recently_read_first():
+    view = View('games', lambda scope: {'games': scope}, ql.idx('games'), max_scopes=2)
+    assert [view.get(scope) for scope in [1, 2, 1, 3]] == [1, 2, 1, 3]
+    assert view.version(1) == 1 and view.version(2) == 0 and view.version(3) == 3
+    assert view.stats()['scopes'] == 2
+    # Read again after it was dropped, with a version it never had.
+    assert view.get(2) == 2 and view.version(2) == 4
+
+
+def blocking_view() -> tuple[View, threading.Event, threading.Event]:
+    """A view whose first evaluation waits until it is released."""
+    started, release = threading.Event(), threading.Event()
+    def evaluate(games: int) -> int:
+        if not started.is_set():
+            started.set()
+            assert release.wait(5)
+        return games
+    return View('games', lambda scope: {'games': scope}, ql.idx('games').unary(evaluate)), started, release
+
+
+def test_reads_dont_wait_on_evaluations():
+    view, started, release = blocking_view()
+    reader = threading.Thread(target=view.get, args=(1,))
+    reader.start()
+    assert started.wait(5)
+    # Another scope is evaluated, then read up to date, while the first is still being evaluated.
+    start = time.monotonic()
+    assert view.get(2) == 2 and view.get(2) == 2
+    assert time.monotonic() - start < 1
+    release.set()
+    reader.join()
+    assert view.get(1) == 1
+
+
+def test_readers_of_a_scope_share_what_was_published_first():
+    view, started, release = blocking_view()
+    results = []
+    reader = threading.Thread(target=lambda: results.append(view.read(1)))
+    reader.start()
+    assert started.wait(5)
+    first = view.read(1)
+    release.set()
+    reader.join()
+    # The slow reader read the same data, so it returns what was published instead of a new version.
+    assert results == [first] and results[0][0] is first[0]
+    assert view.version(1) == first[1] == 1
+
+
+def test_queries_read_the_view_when_evaluated(data):
+    query = ql.query(ViewSource('comps')).filter(ql.idx('level').eq('8')).map(ql.idx('cluster'))
+    assert query.eval() == query.interpret() == [row['cluster'] for row in whole(data) if row['level'] == '8']
+    data['comps'] = data['comps'] | {'2': {'options': [{'games': 1000, 'level': '8'}]}}
+    assert query.eval()[0] == '2'
+    assert query.eval() == query.interpret()
+
+
+def test_memoized_results_follow_the_view(data):
+    query = ql.query(ViewSource('comps')).map(ql.idx('games'))
+    games = query.eval_cached()
+    assert query.eval_cached() is games
+    # A refresh that didn't change the view keeps the result.
+    ql.RESULTS.invalidate()
+    assert query.eval_cached() is games
+    data['comps'] = data['comps'] | {'2': {'options': [{'games': 1000, 'level': '8'}]}}
+    assert query.eval_cached()[0] == 1000
+
+
+def test_results_on_other_views_are_dropped_by_a_refresh(data):
+    query = ql.query(ViewSource('comps')).join(ql.query(ViewSource('comps')), ql.idx('cluster'), ql.idx('cluster'))
+    rows = query.eval_cached()
+    ql.RESULTS.invalidate()
+    assert query.eval_cached() is not rows
+
+
+def test_indexes_on_views_are_kept(data):
+    rows = ql.query(ViewSource('comps')).indexed(['level']).m
+    other = ql.query([dict(row) for row in rows]).indexed(['level']).m
+    ql.INDEXES.invalidate(keep=views.VIEWS.values())
+    assert ql.INDEXES.get(rows) is not None
+    assert ql.INDEXES.get(other) is None
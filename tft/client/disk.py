@@ -0,0 +1,100 @@
+"""
+Sharded on-disk cache for MetaTFT responses. Every API gets its own file and the per champ and per
+comp APIs get one file per id, so writes only touch what was fetched and reads only load what a
+command needs.
+
+Layout:
+    <root>/comps_data.json
+    <root>/set_data.json
+    <root>/champ_items/<champ_id>.json
+    <root>/comp_details/<comp_id>.json
+
+Each shard written from a response also gets a `.validators` file next to it holding the response's
+ETag and Last-Modified headers.
+"""
+import json
+import os
+from pathlib import Path
+import re
+import tempfile
+from typing import Any
+import attrs
+from tft.ql.source import JsonSource
+
+# Shard ids and directory names, like champ API names, cluster ids and dataset names.
+_NAME = re.compile(r'[A-Za-z0-9_][A-Za-z0-9_.-]*')
+
+
+def _check_name(name: str, what: str) -> str:
+    """Returns the name if it is a single path segment that stays in its directory. Raises ValueError if not."""
+    if not isinstance(name, str) or _NAME.fullmatch(name) is None or name == '..':
+        raise ValueError(f"Bad cache {what}: {name!r}")
+    return name
+
+
+@attrs.define
+class DiskCache:
+    root: Path = attrs.field(converter=Path)
+
+    def path(self, name: str, key: str | None = None) -> Path:
+        """Returns the shard file for an API, or for one id of that API if `key` is passed."""
+        if key is None:
+            return self.root / f"{name}.json"
+        return self.root / name / f"{_check_name(key, 'key')}.json"
+
+    def sub(self, name: str) -> 'DiskCache':
+        """Returns a cache stored in a directory under this one, used to keep datasets apart."""
+        return DiskCache(self.root / _check_name(name, 'directory'))
+
+    def read(self, name: str, key: str | None = None) -> Any | None:
+        """Loads a single shard. Returns None if it was never written."""
+        path = self.path(name, key)
+        if not path.exists():
+            return None
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def source(self, name: str, key: str | None = None) -> JsonSource | None:
+        """
+        Opens a single shard without decoding it, so only the parts that are read get decoded, see
+        `tft.ql.source`. The shard stays mapped until the source is closed. Returns None if it was
+        never written.
+        """
+        path = self.path(name, key)
+        if not path.exists():
+            return None
+        return JsonSource.open(path)
+
+    def size(self, name: str, key: str | None = None) -> int:
+        """Size of a shard in bytes, or 0 if it was never written."""
+        path = self.path(name, key)
+        return path.stat().st_size if path.exists() else 0
+
+    def write(self, name: str, data: Any, key: str | None = None) -> None:
+        """
+        Atomically writes a single shard. The data is dumped to a temp file in the same directory and
+        then moved over the old shard, so readers never see a partially written file.
+        """
+        self._write(self.path(name, key), data)
+
+    def _write(self, path: Path, data: Any) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def write_validators(self, name: str, validators: dict, key: str | None = None) -> None:
+        """Stores the HTTP validators of a shard next to it, using the same atomic write."""
+        self._write(self.path(name, key).with_suffix('.validators'), validators)
+
+    def keys(self, name: str) -> list[str]:
+        """Lists the ids that have a shard under an API."""
+        directory = self.root / name
+        if not directory.is_dir():
+            return []
+        return [path.stem for path in directory.glob('*.json')]
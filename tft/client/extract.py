@@ -0,0 +1,151 @@
+"""
+Selective JSON decoding. Most of what metatft.com sends back is never read, so instead of decoding a
+whole response and throwing most of it away, only the registered paths are kept. The document is
+walked down to the registered paths and everything else is decoded a value at a time and dropped
+straight away, so the unused parts are never all held in memory.
+
+Paths use the same dotted syntax as `ql.idx`, plus `*` to match every key of an object or every
+element of a list:
+    projection(['tft_set', 'results.data.cluster_details.*.units_string'])
+"""
+import json
+from json.decoder import scanstring
+import re
+from typing import Any
+
+# A projection is a tree of the keys to keep, where True keeps a whole value.
+Projection = dict[str, 'Projection'] | bool
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_DECODER = json.JSONDecoder()
+
+
+def projection(paths: list[str]) -> Projection:
+    """Builds the projection that keeps the given paths."""
+    root: dict = {}
+    for path in paths:
+        node = root
+        parts = path.split('.')
+        for part in parts[:-1]:
+            child = node.setdefault(part, {})
+            if child is True:
+                break
+            node = child
+        else:
+            node[parts[-1]] = True
+    return root
+
+
+def _child(spec: dict, key: str) -> Projection | None:
+    return spec.get(key, spec.get('*'))
+
+
+def extract(text: str, spec: Projection, partial: bool = False) -> Any:
+    """
+    Decodes only the parts of a JSON document kept by the projection. Objects and lists keep their
+    structure down to the kept values, and anything else is dropped. Raises `json.JSONDecodeError`
+    if the document is not valid JSON.
+
+    If `partial`, reading stops as soon as every kept value has been found, without checking the
+    rest of the document, so paths near the start of a long document are found without reading it.
+    """
+    try:
+        data, end = _extract(text, spec, 0, partial)
+    except IndexError:
+        raise json.JSONDecodeError("Unexpected end of document", text, len(text))
+    if end is None:
+        return data
+    end = _WHITESPACE.match(text, end).end()
+    if end != len(text):
+        raise json.JSONDecodeError("Extra data", text, end)
+    return data
+
+
+def _expect(text: str, pos: int, char: str) -> int:
+    """Checks the next non whitespace character and returns the position after it."""
+    pos = _WHITESPACE.match(text, pos).end()
+    if text[pos] != char:
+        raise json.JSONDecodeError(f"Expecting '{char}'", text, pos)
+    return _WHITESPACE.match(text, pos + 1).end()
+
+
+def _extract(text: str, spec: Projection, pos: int, last: bool = False) -> tuple[Any, int | None]:
+    """
+    Extracts the value at `pos`. If `last`, nothing after the value is needed, so once every kept
+    value in it has been found the rest is left unread and None is returned for the position.
+    """
+    pos = _WHITESPACE.match(text, pos).end()
+    char = text[pos]
+    # Whole values and scalars are left to the C decoder.
+    if spec is True or char not in '{[':
+        return _DECODER.raw_decode(text, pos)
+    assert isinstance(spec, dict)
+
+    if char == '{' and '*' not in spec and all(child is True for child in spec.values()) and not last:
+        # Picking a few fields out of a small object is faster done by the C decoder followed by a
+        # dict lookup than by walking it key by key here.
+        value, pos = _DECODER.raw_decode(text, pos)
+        if not isinstance(value, dict):
+            return prune(value, spec), pos
+        return {key: value[key] for key in spec if key in value}, pos
+
+    if char == '{':
+        data = {}
+        # The keys still to be found, if only named keys are kept and nothing after this is needed.
+        remaining = set(spec) if last and '*' not in spec else None
+        pos = _WHITESPACE.match(text, pos + 1).end()
+        if text[pos] == '}':
+            return data, pos + 1
+        while True:
+            if text[pos] != '"':
+                raise json.JSONDecodeError("Expecting property name", text, pos)
+            key, pos = scanstring(text, pos + 1)
+            pos = _expect(text, pos, ':')
+            child = _child(spec, key)
+            if child is None:
+                # Decoded values are dropped straight away, so only one is ever held at a time.
+                pos = _DECODER.raw_decode(text, pos)[1]
+            elif remaining is not None:
+                remaining.discard(key)
+                data[key], pos = _extract(text, child, pos, len(remaining) == 0)
+                if pos is None or len(remaining) == 0:
+                    return data, None
+            else:
+                data[key], pos = _extract(text, child, pos)
+            pos = _WHITESPACE.match(text, pos).end()
+            if text[pos] == '}':
+                return data, pos + 1
+            pos = _expect(text, pos, ',')
+
+    data = []
+    child = spec.get('*')
+    pos = _WHITESPACE.match(text, pos + 1).end()
+    if text[pos] == ']':
+        return data, pos + 1
+    while True:
+        if child is None:
+            pos = _DECODER.raw_decode(text, pos)[1]
+        else:
+            value, pos = _extract(text, child, pos)
+            data.append(value)
+        pos = _WHITESPACE.match(text, pos).end()
+        if text[pos] == ']':
+            return data, pos + 1
+        pos = _expect(text, pos, ',')
+
+
+def prune(data: Any, spec: Projection) -> Any:
+    """Applies a projection to data that was already decoded, such as an old shard on disk."""
+    if spec is True:
+        return data
+    if isinstance(data, dict):
+        pruned = {}
+        for key, value in data.items():
+            child = _child(spec, key)
+            if child is not None:
+                pruned[key] = prune(value, child)
+        return pruned
+    if isinstance(data, list):
+        child = spec.get('*')
+        return [] if child is None else [prune(value, child) for value in data]
+    return data
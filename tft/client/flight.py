@@ -0,0 +1,66 @@
+"""
+Single flight coalescing. Concurrent calls for the same key share one call instead of each making
+their own, which stops a burst of requests for an uncached champ from all hitting metatft.com.
+"""
+import threading
+from typing import Any, Callable, Hashable
+import attrs
+
+
+@attrs.define
+class _Call:
+    """A call in flight. Followers wait on `done` and then read the leader's result."""
+    done: threading.Event = attrs.field(factory=threading.Event)
+    result: Any = attrs.field(default=None)
+    error: BaseException | None = attrs.field(default=None)
+
+
+@attrs.define
+class SingleFlight:
+    """
+    Runs at most one call per key at a time. The first caller for a key makes the call and every
+    caller that arrives while it is in flight gets the same result (or exception). Calls are not
+    cached, once a call finishes the next caller for that key makes a new one.
+    """
+    # Number of calls actually made.
+    calls: int = attrs.field(default=0)
+    # Number of callers that waited on another caller's call instead of making their own.
+    coalesced: int = attrs.field(default=0)
+    _lock: threading.Lock = attrs.field(factory=threading.Lock, init=False)
+    _in_flight: dict[Hashable, _Call] = attrs.field(factory=dict, init=False)
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._in_flight[key] = call
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._in_flight),
+            }
@@ -0,0 +1,102 @@
+"""
+Guards around calls to metatft.com: a shared rate limiter, a retry policy with jittered backoff and
+a circuit breaker that stops calling the website after repeated failures.
+"""
+from enum import Enum
+import random
+import threading
+import time
+import attrs
+
+
+class CircuitOpenException(Exception):
+    pass
+
+
+@attrs.define
+class TokenBucket:
+    """
+    Allows `rate` calls per second on average with bursts of up to `burst` calls. Shared by every
+    thread, callers block in `acquire()` until they are allowed to go.
+    """
+    rate: float = attrs.field()
+    burst: int = attrs.field()
+    _tokens: float = attrs.field(init=False)
+    _updated: float = attrs.field(factory=time.monotonic, init=False)
+    _lock: threading.Lock = attrs.field(factory=threading.Lock, init=False)
+
+    def __attrs_post_init__(self):
+        self._tokens = self.burst
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Take the token now, even if that goes negative, and wait until it would have refilled.
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+@attrs.define
+class RetryPolicy:
+    """
+    How many times a failed call is attempted and how long to wait in between. Waits use full
+    jitter, a random time up to an exponentially growing cap, so throttled threads spread out.
+    """
+    attempts: int = attrs.field(default=3)
+    base_delay: float = attrs.field(default=0.5)
+    max_delay: float = attrs.field(default=8.0)
+
+    def delay(self, attempt: int, retry_after: float | None = None) -> float:
+        """Seconds to wait after the given (zero indexed) failed attempt."""
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class BreakerState(Enum):
+    # Calls go through.
+    CLOSED = 'closed'
+    # Calls are rejected until `reset_timeout` passes.
+    OPEN = 'open'
+    # A single trial call is let through to see if the website recovered.
+    HALF_OPEN = 'half_open'
+
+
+@attrs.define
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` calls fail in a row and rejects calls while open. After
+    `reset_timeout` seconds one trial call is allowed, which closes the breaker if it succeeds and
+    opens it again if it fails.
+    """
+    failure_threshold: int = attrs.field(default=5)
+    reset_timeout: float = attrs.field(default=60.0)
+    state: BreakerState = attrs.field(default=BreakerState.CLOSED, init=False)
+    failures: int = attrs.field(default=0, init=False)
+    _opened_at: float = attrs.field(default=0.0, init=False)
+    _lock: threading.Lock = attrs.field(factory=threading.Lock, init=False)
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == BreakerState.CLOSED:
+                return True
+            if self.state == BreakerState.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = BreakerState.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = BreakerState.CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == BreakerState.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = BreakerState.OPEN
+                self._opened_at = time.monotonic()
@@ -1,12 +1,22 @@
-
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 import json
-from pathlib import Path
+import threading
+import time
+import traceback
+from typing import Callable, Iterable, Mapping
 import attrs
 import requests
+from requests.adapters import HTTPAdapter
 import tft.ql.expr as ql
-import multiprocessing
-from tft.config import CLUSTER_ID, TFT_SET, DAYS, RANK
+from tft.client.disk import DiskCache
+from tft.client.extract import Projection, extract, projection
+from tft.client.flight import SingleFlight
+from tft.client.limits import CircuitBreaker, CircuitOpenException, RetryPolicy, TokenBucket
+from tft.client.stats import FetchSource, FetchStats, Span
+from tft.ql.record import freeze
+from tft.config import CLUSTER_ID, REFRESH_INTERVAL, TFT_SET, DAYS, RANK
 
 
 class MetaTFTApis(Enum):
@@ -25,22 +35,330 @@ class MetaTFTClientType(Enum):
     OFFLINE_ONLY = 'offline'
     # Will cache the data in memory and also propagate it to disk.
     ONLINE_AND_OFFLINE = 'online_and_offline'
+    # Same as online only, but also saves every response as a fixture for the stand-in server.
+    RECORD = 'record'
 
 URLS = {
     MetaTFTApis.COMPS_DATA: "https://api-hc.metatft.com/tft-comps-api/comps_data",
-    MetaTFTApis.SET_DATA: f"https://data.metatft.com/lookups/{TFT_SET}_latest_en_us.json",
+    # Formatted with the set of the dataset being fetched.
+    MetaTFTApis.SET_DATA: "https://data.metatft.com/lookups/{tft_set}_latest_en_us.json",
     MetaTFTApis.CHAMP_ITEMS: "https://api-hc.metatft.com/tft-stat-api/unit_detail",
     MetaTFTApis.COMP_DETAILS: "https://api-hc.metatft.com/tft-comps-api/comp_details"
 }
 
-# Location to cache data on disk.
-CACHE_PATH = 'res/cache/cache.json'
+# Location to cache data on disk. Each dataset gets a directory in here, and each API (and each champ
+# and comp) gets its own shard in that.
+CACHE_DIR = 'res/cache'
+# Location a RECORD client saves responses to, laid out the same as one dataset of the disk cache.
+FIXTURE_DIR = 'res/fixtures'
+
+# Ranks metatft.com accepts.
+RANKS = ['IRON', 'BRONZE', 'SILVER', 'GOLD', 'PLATINUM', 'EMERALD', 'DIAMOND', 'MASTER', 'GRANDMASTER', 'CHALLENGER', 'RANKUNKNOWN']
+
+# Bounds on the datasets kept in memory. Once either is passed the least recently used datasets are
+# dropped, and are fetched again the next time they are asked for.
+MAX_DATASETS = 8
+MAX_CACHED_BYTES = 512 * 1024 * 1024
+
+# Max number of in flight requests when fetching every champ or comp.
+FANOUT_WORKERS = 20
+
+# Limits on requests to metatft.com. Throttled and failed requests are retried per `RETRY_POLICY`,
+# and after enough failures in a row `BREAKER` stops requests and the disk cache is used instead.
+RATE_LIMIT = 50 # Requests per second, shared by all threads.
+REQUEST_TIMEOUT = (5, 30) # Seconds to connect and to read.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Request errors worth retrying, anything else fails the request straight away.
+RETRY_ERRORS = (requests.Timeout, requests.ConnectionError, requests.exceptions.ChunkedEncodingError)
+LIMITER = TokenBucket(RATE_LIMIT, FANOUT_WORKERS)
+RETRY_POLICY = RetryPolicy()
+BREAKER = CircuitBreaker()
+
+# How long the data of each API stays fresh, in seconds. Once it expires the refresher revalidates it.
+TTLS = {
+    MetaTFTApis.SET_DATA: 24 * 60 * 60, # Only changes with patches.
+    MetaTFTApis.COMPS_DATA: 60 * 60,
+    MetaTFTApis.COMP_DETAILS: 60 * 60,
+    MetaTFTApis.CHAMP_ITEMS: 60 * 60,
+}
+
+# The parts of each API's response that are actually read. Only these are decoded and kept, see
+# `extract`. APIs without an entry are decoded whole. Add a path here before querying a new field.
+PROJECTIONS: dict[MetaTFTApis, Projection] = {
+    MetaTFTApis.COMPS_DATA: projection([
+        'tft_set',
+        'results.data.cluster_details.*.Cluster',
+        'results.data.cluster_details.*.units_string',
+        'results.data.cluster_details.*.name',
+        'results.data.cluster_details.*.overall',
+        'results.data.cluster_details.*.builds',
+        'results.data.cluster_details.*.stars',
+    ]),
+    MetaTFTApis.COMP_DETAILS: projection([
+        'results.early_options',
+        'results.options',
+        'results.placements',
+        'results.unit_stats',
+        'results.builds',
+        'results.overall',
+        'results.augments',
+        'results.levels',
+        'results.rerolls',
+    ]),
+    MetaTFTApis.SET_DATA: projection(['items', 'units', 'augments', 'traits']),
+}
+
+def decode(api: MetaTFTApis, body: bytes) -> dict:
+    """
+    Decodes a response body, keeping only the API's projection, and freezes it since it is shared by
+    every request, see `tft.ql.record`. Raises `requests.JSONDecodeError` so a bad body, including
+    one that isn't UTF-8, is handled like any other failed request.
+    """
+    try:
+        if api not in PROJECTIONS:
+            return freeze(json.loads(body))
+        return freeze(extract(body.decode('utf-8'), PROJECTIONS[api]))
+    except json.JSONDecodeError as e:
+        raise requests.JSONDecodeError(e.msg, e.doc, e.pos) from e
+    except ValueError as e:
+        # Bodies that aren't UTF-8, and anything else `extract` can't read.
+        raise requests.JSONDecodeError(str(e), '', 0) from e
+
+def read_shard(disk: DiskCache, api: MetaTFTApis, key: str | None = None) -> dict | None:
+    """
+    Reads a shard from disk keeping only the API's projection, including from shards written before
+    it was added. Only the projection is decoded, see `tft.ql.source`, and it is frozen like `decode`
+    does. None if it was never written.
+    """
+    source = disk.source(api.value, key)
+    if source is None:
+        return None
+    with source:
+        return freeze(source.extract(PROJECTIONS[api]) if api in PROJECTIONS else source.load())
+
+@attrs.define
+class Validators:
+    """
+    HTTP validators of a cached response. Sent back on the next request for the same data so
+    the website can answer with a 304 instead of the whole payload.
+    """
+    etag: str | None = attrs.field(default=None)
+    last_modified: str | None = attrs.field(default=None)
+    fetched_at: float = attrs.field(factory=time.time)
+    # Size of the response body, used to bound how much is kept in memory.
+    size: int = attrs.field(default=0)
+
+    @classmethod
+    def from_response(cls, response: requests.Response) -> 'Validators':
+        return cls(response.headers.get('ETag'), response.headers.get('Last-Modified'), size=len(response.content))
+
+    def headers(self) -> dict[str, str]:
+        headers = {}
+        if self.etag is not None:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified is not None:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+def _normalize_ranks(ranks: Iterable[str] | str) -> tuple[str, ...]:
+    if isinstance(ranks, str):
+        ranks = ranks.split(',')
+    return tuple(sorted({rank.strip().upper() for rank in ranks if rank.strip()}))
+
+@attrs.frozen
+class Dataset:
+    """
+    Which slice of the stats on metatft.com to use: the set, the ranks and number of days games are
+    taken from, and the cluster id comps are requested with. Snapshots, disk shards and all the
+    getters are keyed by a dataset, so several can be served side by side. Defaults to the config.
+    """
+    tft_set: str = attrs.field(default=TFT_SET)
+    rank: tuple[str, ...] = attrs.field(default=RANK, converter=_normalize_ranks)
+    days: int = attrs.field(default=DAYS, converter=int)
+    cluster_id: int = attrs.field(default=CLUSTER_ID, converter=int)
+
+    @classmethod
+    def from_args(cls, args: Mapping[str, str]) -> 'Dataset':
+        """
+        Builds a dataset from request args named `set`, `rank` (comma separated), `days` and
+        `cluster_id`. Anything missing comes from the config. Raises ValueError if an arg is invalid.
+        """
+        default = cls()
+        tft_set = args.get('set') or default.tft_set
+        if not tft_set.isalnum():
+            raise ValueError(f"Invalid set: {tft_set}")
+        rank = _normalize_ranks(args.get('rank') or default.rank)
+        unknown = [r for r in rank if r not in RANKS]
+        if len(rank) == 0 or len(unknown) > 0:
+            raise ValueError(f"Invalid ranks: {', '.join(unknown)}. Must be some of: {', '.join(RANKS)}")
+        days = int(args.get('days') or default.days)
+        if days <= 0:
+            raise ValueError(f"Invalid days: {days}")
+        return cls(tft_set, rank, days, int(args.get('cluster_id') or default.cluster_id))
+
+    def name(self) -> str:
+        """A readable name that is unique to this dataset, used as its directory in the disk cache."""
+        return f"{self.tft_set}_{'-'.join(self.rank).lower()}_{self.days}d_{self.cluster_id}"
+
+    def url(self, api: MetaTFTApis) -> str:
+        return URLS[api].format(tft_set=self.tft_set)
 
-# Singletons for caching data in memory.
-CACHE = {}
-CHAMP_CACHE = {}
-COMP_CACHE = {}
+    def params(self, api: MetaTFTApis) -> dict:
+        """Query params selecting this dataset, on top of any id param."""
+        if api in [MetaTFTApis.CHAMP_ITEMS, MetaTFTApis.COMPS_DATA]:
+            return {
+                "queue": 1100, # Not sure what this does.
+                "patch": "current",
+                "days": self.days,
+                "rank": ','.join(self.rank),
+                "permit_filter_adjustment": True, # No clue here either.
+            }
+        if api == MetaTFTApis.COMP_DETAILS:
+            return {'cluster_id': str(self.cluster_id)}
+        return {}
+
+DEFAULT_DATASET = Dataset()
+
+@attrs.define
+class Snapshot:
+    """
+    Everything fetched from metatft.com for one dataset at one point in time. `apis` holds the raw
+    response of each API keyed by `MetaTFTApis.value`, while `champs` and `comps` hold the per champ
+    and per comp responses. A refresh builds a new snapshot and swaps it in whole.
+    """
+    apis: dict = attrs.field(factory=dict)
+    champs: dict = attrs.field(factory=dict)
+    comps: dict = attrs.field(factory=dict)
+    version: int = attrs.field(default=0)
+    # Validators of every response fetched, keyed by (api, id).
+    validators: dict[tuple[str, str | None], Validators] = attrs.field(factory=dict)
+    dataset: Dataset = attrs.field(default=DEFAULT_DATASET)
+
+    def nbytes(self) -> int:
+        """Roughly how much memory the snapshot holds, going by the size of the responses in it."""
+        return sum(validators.size for validators in list(self.validators.values()))
+
+    def get(self, api: MetaTFTApis, key: str | None = None) -> dict | None:
+        """Looks up a single response, either a whole API or one champ or comp."""
+        if api == MetaTFTApis.CHAMP_ITEMS and key is not None:
+            return self.champs.get(key)
+        if api == MetaTFTApis.COMP_DETAILS and key is not None:
+            return self.comps.get(key)
+        return self.apis.get(api.value)
+
+# Singletons for caching data in memory. Snapshots are kept in least recently used order.
+SNAPSHOTS: OrderedDict[Dataset, Snapshot] = OrderedDict()
 CLIENT = None
+_SWAP_LOCK = threading.RLock()
+_REFRESH_LISTENERS: list[Callable[[], None]] = []
+REFRESHER = None
+DISK_CACHE = DiskCache(CACHE_DIR)
+FIXTURES = DiskCache(FIXTURE_DIR)
+# Coalesces concurrent requests for the same API, id and params.
+FLIGHTS = SingleFlight()
+# Timings and hit counts of every fetch, see `get_stats`.
+STATS = FetchStats()
+SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+def get_session() -> requests.Session:
+    """
+    Gets or creates the HTTP session shared by all fetches. The session keeps connections to
+    metatft.com alive, and its pool is sized so every fan out worker can hold one.
+    """
+    global SESSION
+    with _SESSION_LOCK:
+        if SESSION is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=len(URLS), pool_maxsize=FANOUT_WORKERS)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            SESSION = session
+    return SESSION
+
+def get_snapshot(dataset: Dataset = DEFAULT_DATASET) -> Snapshot:
+    """
+    Gets the snapshot being served for a dataset, creating an empty one if there is none, and marks
+    it as the most recently used.
+    """
+    with _SWAP_LOCK:
+        snapshot = SNAPSHOTS.get(dataset)
+        if snapshot is None:
+            snapshot = SNAPSHOTS[dataset] = Snapshot(dataset=dataset)
+            evict_snapshots()
+        else:
+            SNAPSHOTS.move_to_end(dataset)
+        return snapshot
+
+def evict_snapshots() -> None:
+    """
+    Drops the least recently used snapshots until there are at most `MAX_DATASETS` of them and they
+    fit in `MAX_CACHED_BYTES`. The most recently used snapshot is always kept.
+    """
+    with _SWAP_LOCK:
+        while len(SNAPSHOTS) > 1:
+            if len(SNAPSHOTS) <= MAX_DATASETS and sum(snapshot.nbytes() for snapshot in SNAPSHOTS.values()) <= MAX_CACHED_BYTES:
+                break
+            dataset, _ = SNAPSHOTS.popitem(last=False)
+            print(f"Evicted MetaTFT data for {dataset.name()}.")
+
+def guarded_get(url: str, params: dict | None = None, headers: dict | None = None) -> requests.Response:
+    """
+    Makes a GET request through the rate limiter and circuit breaker. Timeouts, connection errors,
+    cut off bodies and throttling or server errors are retried with backoff, honoring Retry-After.
+    Any other response is returned as is, and any other error is raised straight away. Every call
+    the breaker lets through records a success or a failure on it, so a failed trial call opens it
+    again. Raises `CircuitOpenException` if the breaker is open.
+    """
+    if not BREAKER.allow():
+        raise CircuitOpenException(f"Circuit breaker is open, not requesting {url}")
+    error: Exception | None = None
+    try:
+        for attempt in range(RETRY_POLICY.attempts):
+            if attempt > 0:
+                retry_after = None
+                if isinstance(error, requests.HTTPError) and error.response is not None:
+                    header = error.response.headers.get('Retry-After')
+                    retry_after = float(header) if header is not None and header.isdigit() else None
+                time.sleep(RETRY_POLICY.delay(attempt - 1, retry_after))
+            LIMITER.acquire()
+            try:
+                response = get_session().get(url, params=params, headers=headers, timeout=REQUEST_TIMEOUT)
+            except RETRY_ERRORS as e:
+                error = e
+                continue
+            if response.status_code in RETRY_STATUSES:
+                error = requests.HTTPError(f"{response.status_code} from {url}", response=response)
+                continue
+            BREAKER.record_success()
+            return response
+    except BaseException:
+        BREAKER.record_failure()
+        raise
+    BREAKER.record_failure()
+    assert error is not None
+    raise error
+
+def fan_out(fetch_one: Callable[[str], dict], ids: Iterable[str], workers: int = FANOUT_WORKERS) -> None:
+    """
+    Calls `fetch_one` for every id using a bounded pool of threads. Fetch functions are expected to
+    write their results into the in-memory caches themselves, so nothing is returned or pickled.
+    Exceptions from any fetch are re-raised.
+    """
+    ids = list(ids)
+    if len(ids) == 0:
+        return
+    # Nest the fetches under the span of whoever is fanning out.
+    parent = STATS.current()
+    def run(id: str) -> dict:
+        with STATS.attach(parent):
+            return fetch_one(id)
+    with ThreadPoolExecutor(max_workers=min(workers, len(ids))) as executor:
+        for _ in executor.map(run, ids):
+            pass
 
 @attrs.define
 class MetaTFTClient:
@@ -48,107 +366,347 @@ class MetaTFTClient:
     A client for fetching data from metatft.com. It is heavily cached so that we don't constantly make
     expensive API requests. Here are the components:
 
-    In-memory Cache: The is the `CACHE` global variable and the specific ones like `COMP_CACHE`. This
-    stores the raw contents of requests made to the website in memory. ONLINE_ONLY and ONLINE_AND_OFFLINE
-    make requests and store them in this cache. OFFLINE_ONLY reads a file and writes its contents into
-    here and makes no API requests. NO_CACHE ignores this.
+    Every client fetches one `Dataset`, use `get_client(dataset)` to get a client for another one.
+
+    In-memory Cache: The is the `SNAPSHOTS` global variable, one `Snapshot` per dataset. This stores
+    the raw contents of requests made to the website in memory. ONLINE_ONLY and ONLINE_AND_OFFLINE make
+    requests and store them in this cache. OFFLINE_ONLY reads shards from disk into here as they are
+    asked for and makes no API requests. NO_CACHE ignores this. A client can also be given its own
+    snapshot to fill, which is how the `Refresher` stages new data.
+
+    Disk Cache: The shards under `CACHE_DIR`, in a directory per dataset, see `DiskCache`. OFFLINE_ONLY lazily reads only the
+    shards it is asked for, so `bis` only loads a single champion. ONLINE_AND_OFFLINE writes each
+    shard as soon as it is fetched.
 
-    Disk Cache: The file indicated by `CACHE_PATH`. This is loaded on start up by OFFLINE_ONLY, and written
-    to if ONLINE_AND_OFFLINE is specified. 
+    Fixtures: RECORD saves every response under `FIXTURE_DIR` so `StandIn` can replay them.
     """
 
     client_type: MetaTFTClientType = attrs.field(default=MetaTFTClientType.ONLINE_ONLY)
+    snapshot: Snapshot | None = attrs.field(default=None)
+    # When set, responses still within their TTL are carried over from here and expired ones are
+    # revalidated with conditional requests.
+    previous: Snapshot | None = attrs.field(default=None)
+    # Number of responses that came back with new data rather than being carried over or a 304.
+    changed: int = attrs.field(default=0)
+    dataset: Dataset = attrs.field(default=DEFAULT_DATASET)
 
-    def __attrs_post_init__(self):
-        """Maybe load caches."""
-        global CACHE
-        global CHAMP_CACHE
-        global COMP_CACHE
-        path = Path(CACHE_PATH)
-        if self.client_type in [MetaTFTClientType.OFFLINE_ONLY] and path.exists():
-            with open(path, 'r') as f:
-                CACHE = json.load(f)
-            if MetaTFTApis.CHAMP_ITEMS in CACHE:
-                CHAMP_CACHE = CACHE[MetaTFTApis.CHAMP_ITEMS.value]
-            if MetaTFTApis.COMP_DETAILS in CACHE:
-                COMP_CACHE = CACHE[MetaTFTApis.COMP_DETAILS.value]
-
-    def fetch(self, api: MetaTFTApis, cluster_id: int = CLUSTER_ID) -> dict:
-        global CACHE
-        global CHAMP_CACHE
+    def cache(self) -> Snapshot:
+        """The snapshot this client reads and writes, which is the dataset's global one unless it was given its own."""
+        return self.snapshot if self.snapshot is not None else get_snapshot(self.dataset)
+
+    def disk(self) -> DiskCache:
+        return DISK_CACHE.sub(self.dataset.name())
+
+    def reads_disk(self) -> bool:
+        return self.client_type in [MetaTFTClientType.OFFLINE_ONLY]
+
+    def writes_disk(self) -> bool:
+        return self.client_type in [MetaTFTClientType.ONLINE_AND_OFFLINE]
+
+    def records(self) -> bool:
+        return self.client_type in [MetaTFTClientType.RECORD]
+
+    def fetch(self, api: MetaTFTApis) -> dict:
         """
         Fetches given API and returns a dict. Subsequent requests are cached.
         """
+        cache = self.cache()
         # Check cache for value. No cache options means we never check memory cache.
-        if api.value in CACHE and self.client_type not in [MetaTFTClientType.NO_CACHE]:
-            return CACHE[api.value]
-        
-        # Offline only means a file must already exist, so thereforce if its not in the cache, then no file exists.
-        if self.client_type in [MetaTFTClientType.OFFLINE_ONLY]:
-            print("ERROR: Offline only client was not able to fetch data set.")
-            return dict()
+        if api.value in cache.apis and self.client_type not in [MetaTFTClientType.NO_CACHE]:
+            STATS.record(api.value, None, FetchSource.MEMORY)
+            return cache.apis[api.value]
+        with STATS.span(api.value):
+            return self._fetch(api)
+
+    def _fetch(self, api: MetaTFTApis) -> dict:
+        cache = self.cache()
+        # Offline only means everything comes from the disk shards.
+        if self.reads_disk():
+            return self.load(api)
 
         # Perform appropriate lookup.
         if api == MetaTFTApis.CHAMP_ITEMS:
             champ_ids = ql.query(self.fetch(MetaTFTApis.SET_DATA)).idx('units').filter(ql.idx('traits').len().gt(0)).map(ql.idx('apiName')).eval()
-            champ_ids = {champ_id for champ_id in champ_ids if champ_id not in CHAMP_CACHE}
-            with multiprocessing.Pool(20) as pool:
-                all_champ_data = pool.map(self.fetch_champ, champ_ids)
-            for champ_id, champ_data in zip(champ_ids, all_champ_data):
-                CHAMP_CACHE[champ_id] = champ_data
-            data = CHAMP_CACHE
+            champ_ids = {champ_id for champ_id in champ_ids if champ_id not in cache.champs}
+            fan_out(self.fetch_champ, champ_ids)
+            data = cache.champs
         elif api == MetaTFTApis.COMP_DETAILS:
             results_q = ql.query(self.fetch(MetaTFTApis.COMPS_DATA)).idx('results.data')
             cids = results_q.idx('cluster_details').map(ql.idx('Cluster')).values().eval()
             # internal_cid = results_q.idx('cluster_id').eval()
             # Need internal CID and cluster id to query.
-            cids = {str(cid) for cid in cids if cid not in COMP_CACHE}
-            with multiprocessing.Pool(20) as pool:
-                all_comp_data = pool.map(self.fetch_comp, cids)
-            for cid, comp_data in zip(cids, all_comp_data):
-                COMP_CACHE[cid] = comp_data
-            data = COMP_CACHE
+            cids = {str(cid) for cid in cids if cid not in cache.comps}
+            fan_out(self.fetch_comp, cids)
+            data = cache.comps
         else:
-            data = requests.get(URLS[api]).json()
+            data = self.request(api)
         
         # Do not add to cache if you are running no cache set up. This ensures no staleness at the cost of speed.
         if self.client_type not in [MetaTFTClientType.NO_CACHE]:
-            CACHE[api.value] = data
-        
-        # Online and offline option stores what we fetched back to disk.
-        if self.client_type in [MetaTFTClientType.ONLINE_AND_OFFLINE]:
-            path = Path(CACHE_PATH)
-            path.parent.mkdir(parents=True, exist_ok=True)
-            with open(path, 'w') as f:
-                json.dump(CACHE, f)
+            cache.apis[api.value] = data
+        return data
+
+    def request(self, api: MetaTFTApis, key: str | None = None, params: dict | None = None) -> dict:
+        """
+        Requests an API for the client's dataset from metatft.com and writes it to disk if needed.
+        Concurrent requests with the same URL, id and params are coalesced into one, so callers must
+        not mutate the result.
+
+        If the client has a previous snapshot, its copy is reused while it is younger than the API's
+        TTL. After that a conditional request is made, and a 304 reuses the previous copy without
+        downloading or decoding it again.
+
+        If the request fails even after retries, or the circuit breaker is open, the previous copy or
+        else the last copy on disk is returned.
+        """
+        url = self.dataset.url(api)
+        params = self.dataset.params(api) | (params if params is not None else {})
+        disk = self.disk()
+        previous_data = self.previous.get(api, key) if self.previous is not None else None
+        previous_validators = self.previous.validators.get((api.value, key)) if self.previous is not None else None
+        if previous_data is not None and previous_validators is not None and previous_validators.age() < TTLS[api]:
+            self.cache().validators[(api.value, key)] = previous_validators
+            STATS.record(api.value, key, FetchSource.CARRIED_OVER)
+            return previous_data
+
+        def do_request() -> tuple[dict, Validators, bool]:
+            headers = previous_validators.headers() if previous_data is not None and previous_validators is not None else {}
+            start = time.perf_counter()
+            response = guarded_get(url, params=params, headers=headers)
+            latency = time.perf_counter() - start
+            if response.status_code == 304:
+                STATS.record(api.value, key, FetchSource.NOT_MODIFIED, latency)
+                return previous_data, attrs.evolve(previous_validators, fetched_at=time.time()), False
+            response.raise_for_status()
+            start = time.perf_counter()
+            data = decode(api, response.content)
+            STATS.record(api.value, key, FetchSource.NETWORK, latency, len(response.content), time.perf_counter() - start)
+            validators = Validators.from_response(response)
+            if self.writes_disk():
+                disk.write(api.value, data, key)
+                disk.write_validators(api.value, attrs.asdict(validators), key)
+            if self.records():
+                FIXTURES.write(api.value, data, key)
+            return data, validators, True
+
+        try:
+            data, validators, changed = FLIGHTS.do((url, key, tuple(sorted(params.items()))), do_request)
+        except (CircuitOpenException, requests.RequestException) as e:
+            # Serve the last copy we have rather than failing.
+            name = api.value if key is None else f"{api.value} {key}"
+            STATS.record(api.value, key, FetchSource.FALLBACK)
+            if previous_data is not None and previous_validators is not None:
+                print(f"WARNING: Keeping previous {name} data: {e}")
+                self.cache().validators[(api.value, key)] = previous_validators
+                return previous_data
+            data = read_shard(disk, api, key)
+            if data is None:
+                raise
+            print(f"WARNING: Using {name} data from disk: {e}")
+            return data
+        self.cache().validators[(api.value, key)] = validators
+        if changed:
+            self.changed += 1
+            evict_snapshots()
+        return data
+
+    def load(self, api: MetaTFTApis) -> dict:
+        """
+        Loads an API from the disk shards into the in-memory cache. For champ and comp details this
+        loads every id that has a shard.
+        """
+        cache = self.cache()
+        disk = self.disk()
+        if api == MetaTFTApis.CHAMP_ITEMS:
+            for champ_id in disk.keys(api.value):
+                self.fetch_champ(champ_id)
+            data = cache.champs
+        elif api == MetaTFTApis.COMP_DETAILS:
+            for cid in disk.keys(api.value):
+                self.fetch_comp(cid)
+            data = cache.comps
+        else:
+            data = self.read_disk(api)
+            if data is None:
+                print(f"ERROR: Offline only client has no data on disk for {api.value}.")
+                return dict()
+        cache.apis[api.value] = data
+        return data
+
+    def read_disk(self, api: MetaTFTApis, key: str | None = None) -> dict | None:
+        """Reads a single shard of the client's dataset from disk, counting it towards the memory bound."""
+        disk = self.disk()
+        start = time.perf_counter()
+        data = read_shard(disk, api, key)
+        if data is None:
+            STATS.record(api.value, key, FetchSource.DISK_MISS)
+            return None
+        size = disk.size(api.value, key)
+        STATS.record(api.value, key, FetchSource.DISK, time.perf_counter() - start, size)
+        self.cache().validators[(api.value, key)] = Validators(size=size)
         return data
-        
     
     def fetch_champ(self, champ_id: str) -> dict:
         """Fetches champ data for a particular champion."""
-        global CHAMP_CACHE
-        if champ_id not in CHAMP_CACHE:
-            params = {
-                "queue": 1100, # Not sure what this does.
-                "patch": "current",
-                "days": DAYS,
-                "rank": ','.join(RANK),
-                "permit_filter_adjustment": True, # No clue here either.
-                "unit": champ_id
-            }
-            CHAMP_CACHE[champ_id] = requests.get(URLS[MetaTFTApis.CHAMP_ITEMS], params=params).json()
-        return CHAMP_CACHE[champ_id]
+        champs = self.cache().champs
+        if champ_id in champs:
+            STATS.record(MetaTFTApis.CHAMP_ITEMS.value, champ_id, FetchSource.MEMORY)
+            return champs[champ_id]
+        with STATS.span(f"{MetaTFTApis.CHAMP_ITEMS.value} {champ_id}"):
+            if self.reads_disk():
+                data = self.read_disk(MetaTFTApis.CHAMP_ITEMS, champ_id)
+                if data is None:
+                    print(f"ERROR: Offline only client has no data on disk for champ {champ_id}.")
+                    return dict()
+                champs[champ_id] = data
+                return data
+            champs[champ_id] = self.request(MetaTFTApis.CHAMP_ITEMS, champ_id, {"unit": champ_id})
+        return champs[champ_id]
     
-    def fetch_comp(self, comp_id: str, cluster_id: str = str(CLUSTER_ID)) -> dict:
-        global COMP_CACHE
-        if comp_id not in COMP_CACHE:
-            params = {
-                'comp': comp_id,
-                'cluster_id': cluster_id,
-            }
-            res = requests.get(URLS[MetaTFTApis.COMP_DETAILS], params=params)
-            COMP_CACHE[comp_id] = res.json()
-        return COMP_CACHE[comp_id]
+    def fetch_comp(self, comp_id: str) -> dict:
+        comps = self.cache().comps
+        if comp_id in comps:
+            STATS.record(MetaTFTApis.COMP_DETAILS.value, comp_id, FetchSource.MEMORY)
+            return comps[comp_id]
+        with STATS.span(f"{MetaTFTApis.COMP_DETAILS.value} {comp_id}"):
+            if self.reads_disk():
+                data = self.read_disk(MetaTFTApis.COMP_DETAILS, comp_id)
+                if data is None:
+                    print(f"ERROR: Offline only client has no data on disk for comp {comp_id}.")
+                    return dict()
+                comps[comp_id] = data
+                return data
+            comps[comp_id] = self.request(MetaTFTApis.COMP_DETAILS, comp_id, {'comp': comp_id})
+        return comps[comp_id]
+
+def on_refresh(listener: Callable[[], None]) -> Callable[[], None]:
+    """
+    Registers a function to call whenever a new snapshot is swapped in, for any dataset. Modules that cache values
+    derived from the snapshot use this to drop them. Can be used as a decorator.
+    """
+    _REFRESH_LISTENERS.append(listener)
+    return listener
+
+def swap_snapshot(snapshot: Snapshot) -> None:
+    """
+    Replaces the in-memory snapshot of the snapshot's dataset and invalidates everything derived from
+    the old one. Requests that already grabbed the old snapshot finish on it.
+    """
+    with _SWAP_LOCK:
+        SNAPSHOTS[snapshot.dataset] = snapshot
+        SNAPSHOTS.move_to_end(snapshot.dataset)
+        evict_snapshots()
+        for listener in _REFRESH_LISTENERS:
+            listener()
+
+def get_version(dataset: Dataset = DEFAULT_DATASET) -> int:
+    """Returns the version of the snapshot currently being served for a dataset."""
+    return get_snapshot(dataset).version
+
+def refresh(client: MetaTFTClient | None = None, dataset: Dataset = DEFAULT_DATASET) -> Snapshot:
+    """
+    Re-fetches everything in the current snapshot of a dataset into a new one and swaps it in.
+    Requests keep being served from the current snapshot until the new one is complete. If anything
+    fails the current snapshot is kept. Only data past its TTL is re-requested, and if none of it
+    changed there is nothing to swap.
+    """
+    client = client if client is not None else get_client()
+    current = get_snapshot(dataset)
+    staging = MetaTFTClient(client.client_type, Snapshot(version=current.version + 1, dataset=dataset), previous=current, dataset=dataset)
+    with STATS.span(f"refresh {dataset.name()}"):
+        for api in MetaTFTApis:
+            if api.value in current.apis:
+                staging.fetch(api)
+        # Pick up anything that was fetched one at a time.
+        fan_out(staging.fetch_champ, [champ_id for champ_id in current.champs if champ_id not in staging.cache().champs])
+        fan_out(staging.fetch_comp, [cid for cid in current.comps if cid not in staging.cache().comps])
+    if staging.changed == 0:
+        # Nothing new, so keep the current snapshot and everything derived from it.
+        current.validators.update(staging.cache().validators)
+        return current
+    swap_snapshot(staging.cache())
+    return staging.cache()
+
+def refresh_all(client: MetaTFTClient | None = None) -> list[Snapshot]:
+    """Refreshes every dataset currently in memory, see `refresh`."""
+    with _SWAP_LOCK:
+        datasets = list(SNAPSHOTS.keys())
+    return [refresh(client, dataset) for dataset in datasets]
+
+@attrs.define
+class Refresher:
+    """
+    Checks the snapshot of every dataset for expired data on a background thread every `interval`
+    seconds. Offline clients never refresh since the disk is their only source.
+    """
+    interval: float = attrs.field(default=REFRESH_INTERVAL)
+    _stop: threading.Event = attrs.field(factory=threading.Event, init=False)
+    _thread: threading.Thread | None = attrs.field(default=None, init=False)
+
+    def start(self) -> None:
+        if self.interval <= 0 or get_client().reads_disk():
+            return
+        self._thread = threading.Thread(target=self.run, name='meta-refresher', daemon=True)
+        self._thread.start()
+
+    def run(self) -> None:
+        while not self._stop.wait(self.interval):
+            start = time.time()
+            try:
+                snapshots = refresh_all()
+                versions = ', '.join(f"{snapshot.dataset.name()} v{snapshot.version}" for snapshot in snapshots)
+                print(f"Refreshed MetaTFT data ({versions}) in {time.time() - start:.1f}s.")
+            except Exception:
+                # Keep serving the old snapshot and try again next interval.
+                traceback.print_exc()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+def start_refresher(interval: float = REFRESH_INTERVAL) -> Refresher:
+    """
+    Starts the background refresher singleton.
+    """
+    global REFRESHER
+    if REFRESHER is not None:
+        REFRESHER.stop()
+    REFRESHER = Refresher(interval)
+    REFRESHER.start()
+    return REFRESHER
+
+def warm_up(dataset: Dataset | None = None) -> Span:
+    """
+    Fetches everything a dataset needs so later requests are served from memory, and returns the
+    span timing it.
+    """
+    with STATS.span('warm') as span:
+        get_comp_data(dataset)
+        get_champ_item_data(dataset=dataset)
+        get_set_data(dataset)
+        get_comp_details(dataset=dataset)
+    return span
+
+def get_stats(entities: bool = False) -> dict:
+    """
+    Returns the fetch stats: totals per API (and per champ and comp if `entities`), the recent span
+    trees and the critical path of the last warm up, along with the state of the request guards and
+    of every dataset in memory.
+    """
+    stats = STATS.summary(entities)
+    warm = STATS.last_span('warm')
+    if warm is not None:
+        stats['warm_up'] = {
+            'duration_ms': warm.duration() * 1000,
+            'critical_path': [{'depth': depth, 'name': span.name, 'duration_ms': span.duration() * 1000} for depth, span in warm.critical_tree()],
+        }
+    stats['flights'] = FLIGHTS.stats()
+    stats['breaker'] = BREAKER.state.value
+    with _SWAP_LOCK:
+        stats['datasets'] = [{'name': dataset.name(), 'version': snapshot.version, 'bytes': snapshot.nbytes()} for dataset, snapshot in SNAPSHOTS.items()]
+    return stats
 
 def create_client(client_type: MetaTFTClientType = MetaTFTClientType.ONLINE_ONLY):
     """
@@ -158,42 +716,56 @@ def create_client(client_type: MetaTFTClientType = MetaTFTClientType.ONLINE_ONLY
     global CLIENT
     CLIENT = MetaTFTClient(client_type)
 
-def get_client():
+def get_client(dataset: Dataset | None = None):
     """
-    Gets or creates a singleton of the MetaTFT client and returns it.
+    Gets or creates a singleton of the MetaTFT client and returns it. If a dataset is passed, the
+    returned client fetches that dataset instead of the default one.
     """
-    if CLIENT is not None:
-        return CLIENT
-    return MetaTFTClient()
+    client = CLIENT if CLIENT is not None else MetaTFTClient()
+    if dataset is not None and dataset != client.dataset:
+        return attrs.evolve(client, dataset=dataset)
+    return client
 
-def get_set_data():
+def get_set_data(dataset: Dataset | None = None):
     """
     Fetches raw JSON set data via MetaTFT client singleton.
     """
-    return get_client().fetch(MetaTFTApis.SET_DATA)
+    return get_client(dataset).fetch(MetaTFTApis.SET_DATA)
 
-def get_comp_data():
+def get_comp_data(dataset: Dataset | None = None):
     """
     Fetches raw JSON comp data via MetaTFT client singleton.
     """
-    return get_client().fetch(MetaTFTApis.COMPS_DATA)
+    return get_client(dataset).fetch(MetaTFTApis.COMPS_DATA)
+
+def get_champ_ids(dataset: Dataset | None = None) -> set[str]:
+    """The API names of the units in the dataset's set data, the only champ ids there is data for."""
+    return {unit['apiName'] for unit in get_set_data(dataset).get('units', [])}
+
+def get_comp_ids(dataset: Dataset | None = None) -> set[str]:
+    """The ids of the clusters in the dataset's comp data, the only comp ids there are details for."""
+    return {str(cid) for cid in ql.query(get_comp_data(dataset)).idx('results.data.cluster_details').map(ql.idx('Cluster')).values().eval()}
 
-def get_champ_item_data(champ_id: str | None = None):
+def get_champ_item_data(champ_id: str | None = None, dataset: Dataset | None = None):
     """
-    Fetches raw JSON chamption specific data via MetaTFT client singleton.
+    Fetches raw JSON chamption specific data via MetaTFT client singleton. Raises ValueError for a
+    champ id that isn't in the set data, so unknown ids are never requested or written to disk.
     """
-    client = get_client()
+    client = get_client(dataset)
     if champ_id is None:
         return client.fetch(MetaTFTApis.CHAMP_ITEMS)
-    else:
-        return {champ_id: client.fetch_champ(champ_id)}
+    if champ_id not in client.cache().champs and champ_id not in get_champ_ids(dataset):
+        raise ValueError(f"Unknown champ: {champ_id}")
+    return {champ_id: client.fetch_champ(champ_id)}
 
-def get_comp_details(comp_id: str | int | None = None, cluster_id: int = CLUSTER_ID):
+def get_comp_details(comp_id: str | int | None = None, dataset: Dataset | None = None):
     """
-    Fetches raw JSON composition (or cluster) data via MetaTFT client singleton.
+    Fetches raw JSON composition (or cluster) data via MetaTFT client singleton. Raises ValueError
+    for a comp id that isn't in the comp data.
     """
-    client = get_client()
+    client = get_client(dataset)
     if comp_id is None:
         return client.fetch(MetaTFTApis.COMP_DETAILS)
-    else:
-        return {str(comp_id): client.fetch_comp(str(comp_id), str(CLUSTER_ID))}
\ No newline at end of file
+    if str(comp_id) not in client.cache().comps and str(comp_id) not in get_comp_ids(dataset):
+        raise ValueError(f"Unknown comp: {comp_id}")
+    return {str(comp_id): client.fetch_comp(str(comp_id))}
\ No newline at end of file
@@ -0,0 +1,204 @@
+"""
+A local stand-in for the metatft.com APIs. It replays fixtures recorded with a RECORD client (see
+`scripts/record_fixtures.py`) over HTTP so the client can be exercised and benchmarked without
+touching the real website. Anything without a fixture is served from the snapshots in `res/`.
+
+Usage:
+    with StandIn(fixture_dir=FIXTURE_DIR, latency=0.05) as server:
+        meta.URLS.update(server.urls())
+        ...
+"""
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import threading
+import time
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+import attrs
+from tft.client.disk import DiskCache
+from tft.client.meta import MetaTFTApis
+
+SET_DATA_FILE = 'res/set_data.json'
+COMP_DATA_FILE = 'res/comp_data.json'
+CHAMP_DATA_FILE = 'res/morg.json'
+
+# Paths the stand-in serves each API on.
+PATHS = {
+    MetaTFTApis.COMPS_DATA: '/tft-comps-api/comps_data',
+    MetaTFTApis.SET_DATA: '/lookups/set_data.json',
+    MetaTFTApis.CHAMP_ITEMS: '/tft-stat-api/unit_detail',
+    MetaTFTApis.COMP_DETAILS: '/tft-comps-api/comp_details',
+}
+APIS_BY_PATH = {path: api for api, path in PATHS.items()}
+
+# The query param holding the id for per champ and per comp APIs.
+ID_PARAMS = {
+    MetaTFTApis.CHAMP_ITEMS: 'unit',
+    MetaTFTApis.COMP_DETAILS: 'comp',
+}
+
+def read_snapshot(path: str) -> dict:
+    """
+    Reads one of the JSON snapshots in `res/`. Some of them were dumped from python, so `None` is
+    converted back to `null` first.
+    """
+    with open(path, 'r') as f:
+        return json.loads(f.read().replace(': None', ': null'))
+
+def build_defaults() -> dict[MetaTFTApis, Any]:
+    """
+    Builds the payload served for each API when there is no fixture. Champ and comp details are
+    the same for every id.
+    """
+    comp_data = read_snapshot(COMP_DATA_FILE)
+    cluster = next(iter(comp_data['results']['data']['cluster_details'].values()))
+    comp_details = {'results': {
+        'early_options': {},
+        'options': {},
+        'placements': [],
+        'unit_stats': [],
+        'builds': cluster['builds'],
+        'overall': cluster['overall'],
+        'augments': cluster['top_augments'],
+        'levels': cluster['levelling'],
+        'rerolls': {},
+    }}
+    return {
+        MetaTFTApis.COMPS_DATA: comp_data,
+        MetaTFTApis.SET_DATA: read_snapshot(SET_DATA_FILE),
+        MetaTFTApis.CHAMP_ITEMS: read_snapshot(CHAMP_DATA_FILE),
+        MetaTFTApis.COMP_DETAILS: comp_details,
+    }
+
+def scale_payload(data: Any, scale: int) -> Any:
+    """
+    Makes a payload roughly `scale` times bigger by repeating the outermost lists in it. Used to
+    benchmark how the client copes with bigger responses.
+    """
+    if scale == 1:
+        return data
+    if isinstance(data, dict):
+        return {key: scale_payload(val, scale) for key, val in data.items()}
+    if isinstance(data, list):
+        return data * scale
+    return data
+
+@attrs.define
+class StandIn:
+    """
+    Serves `PATHS` on localhost from a background thread. Responses come from the fixtures in
+    `fixture_dir`, keyed by the `ID_PARAMS` of the request, and are scaled by `scale`.
+
+    Every response is delayed by `latency` seconds to mimic the round trip to the real website.
+    Responses carry an ETag, and a request whose If-None-Match matches it gets a 304. A `throttle`
+    fraction of requests are rejected with a 429 and a Retry-After of `retry_after` seconds, to
+    exercise the client's retries.
+    """
+    fixture_dir: str | None = attrs.field(default=None)
+    latency: float = attrs.field(default=0.0)
+    throttle: float = attrs.field(default=0.0)
+    retry_after: int = attrs.field(default=1)
+    scale: int = attrs.field(default=1)
+    host: str = attrs.field(default='127.0.0.1')
+    port: int = attrs.field(default=0)
+    requests_served: int = attrs.field(default=0, init=False)
+    not_modified_served: int = attrs.field(default=0, init=False)
+    throttled_served: int = attrs.field(default=0, init=False)
+    _defaults: dict[MetaTFTApis, Any] = attrs.field(factory=dict, init=False)
+    _bodies: dict[tuple[MetaTFTApis, str | None], tuple[bytes, str]] = attrs.field(factory=dict, init=False)
+    _server: ThreadingHTTPServer | None = attrs.field(default=None, init=False)
+    _thread: threading.Thread | None = attrs.field(default=None, init=False)
+    _lock: threading.Lock = attrs.field(factory=threading.Lock, init=False)
+
+    def body(self, api: MetaTFTApis, key: str | None) -> tuple[bytes, str]:
+        """Returns the encoded body and ETag served for an API and id."""
+        with self._lock:
+            if (api, key) in self._bodies:
+                return self._bodies[(api, key)]
+        data = None
+        if self.fixture_dir is not None:
+            data = DiskCache(self.fixture_dir).read(api.value, key)
+        if data is None:
+            data = self._defaults[api]
+        body = json.dumps(scale_payload(data, self.scale)).encode()
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        with self._lock:
+            self._bodies[(api, key)] = (body, etag)
+        return body, etag
+
+    def reload(self) -> None:
+        """Serves the fixtures as they are now, for when they were changed after being served."""
+        with self._lock:
+            self._bodies.clear()
+
+    def start(self) -> None:
+        self._defaults = build_defaults()
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Needed so clients can keep connections alive.
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path not in APIS_BY_PATH:
+                    self.send_error(404)
+                    return
+                if standin.latency > 0:
+                    time.sleep(standin.latency)
+                if random.random() < standin.throttle:
+                    with standin._lock:
+                        standin.throttled_served += 1
+                    self.send_response(429)
+                    self.send_header('Retry-After', str(standin.retry_after))
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                api = APIS_BY_PATH[url.path]
+                params = parse_qs(url.query)
+                key = params[ID_PARAMS[api]][0] if api in ID_PARAMS and ID_PARAMS[api] in params else None
+                body, etag = standin.body(api, key)
+                not_modified = self.headers.get('If-None-Match') == etag
+                with standin._lock:
+                    standin.requests_served += 1
+                    standin.not_modified_served += int(not_modified)
+                if not_modified:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def urls(self) -> dict[MetaTFTApis, str]:
+        """The URL of each API on this server, in the same form as `meta.URLS`."""
+        return {api: f"http://{self.host}:{self.port}{path}" for api, path in PATHS.items()}
+
+    def __enter__(self) -> 'StandIn':
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
@@ -0,0 +1,208 @@
+"""
+Instrumentation for fetches from metatft.com. Every fetch that isn't served from memory is recorded
+as a `Span`, with where its data came from, how long the request took, how big the response was and
+how long it took to decode. Spans nest, so a warm up is a tree of API fetches and the per champ and
+per comp fetches they fan out to, from which the critical path is worked out.
+
+Memory hits are only counted, since they happen on nearly every query.
+"""
+from collections import deque
+from contextlib import contextmanager
+from enum import Enum
+import threading
+import time
+from typing import Iterator
+import attrs
+
+
+class FetchSource(Enum):
+    # Already in the in-memory snapshot.
+    MEMORY = 'memory'
+    # Read from the disk cache by an offline client.
+    DISK = 'disk'
+    # Offline client with nothing on disk.
+    DISK_MISS = 'disk_miss'
+    # Downloaded from the website.
+    NETWORK = 'network'
+    # The website answered a conditional request with a 304.
+    NOT_MODIFIED = 'not_modified'
+    # Reused from the previous snapshot because it was still within its TTL.
+    CARRIED_OVER = 'carried_over'
+    # The request failed, so the previous snapshot or disk cache was used.
+    FALLBACK = 'fallback'
+
+
+@attrs.define(eq=False)
+class Span:
+    """A timed fetch. `latency`, `size` and `decode` are only set for fetches that made a request."""
+    name: str = attrs.field()
+    start: float = attrs.field(factory=time.perf_counter)
+    end: float | None = attrs.field(default=None)
+    source: FetchSource | None = attrs.field(default=None)
+    latency: float = attrs.field(default=0.0)
+    size: int = attrs.field(default=0)
+    decode: float = attrs.field(default=0.0)
+    children: list['Span'] = attrs.field(factory=list)
+
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def critical_path(self) -> list['Span']:
+        """
+        The chain of children that gated when this span finished. Walks back from the child that
+        finished last to the child that finished before it started, and so on, so for a fan out
+        only the slowest fetch is on the path.
+        """
+        path = []
+        until = self.end if self.end is not None else time.perf_counter()
+        for child in sorted(self.children, key=lambda child: child.end or until, reverse=True):
+            if child.end is not None and child.end <= until:
+                path.append(child)
+                until = child.start
+        path.reverse()
+        return path
+
+    def critical_tree(self, depth: int = 0) -> list[tuple[int, 'Span']]:
+        """The critical path expanded into every span on it, paired with how deep it is nested."""
+        tree = []
+        for child in self.critical_path():
+            tree.append((depth, child))
+            tree.extend(child.critical_tree(depth + 1))
+        return tree
+
+    def to_dict(self, origin: float | None = None) -> dict:
+        """Serializes the span tree with times in milliseconds, relative to `origin`."""
+        origin = origin if origin is not None else self.start
+        return {
+            'name': self.name,
+            'start_ms': (self.start - origin) * 1000,
+            'duration_ms': self.duration() * 1000,
+            'source': self.source.value if self.source is not None else None,
+            'latency_ms': self.latency * 1000,
+            'bytes': self.size,
+            'decode_ms': self.decode * 1000,
+            'children': [child.to_dict(origin) for child in self.children],
+        }
+
+
+@attrs.define
+class FetchTotals:
+    """Totals for a single API or entity."""
+    sources: dict[str, int] = attrs.field(factory=dict)
+    requests: int = attrs.field(default=0)
+    latency: float = attrs.field(default=0.0)
+    max_latency: float = attrs.field(default=0.0)
+    size: int = attrs.field(default=0)
+    decode: float = attrs.field(default=0.0)
+
+    def add(self, source: FetchSource, latency: float, size: int, decode: float) -> None:
+        self.sources[source.value] = self.sources.get(source.value, 0) + 1
+        if source in [FetchSource.NETWORK, FetchSource.NOT_MODIFIED]:
+            self.requests += 1
+            self.latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            self.size += size
+            self.decode += decode
+
+    def hit_ratio(self) -> float:
+        """Fraction of fetches that were served without downloading anything."""
+        total = sum(self.sources.values())
+        misses = self.sources.get(FetchSource.NETWORK.value, 0) + self.sources.get(FetchSource.DISK_MISS.value, 0)
+        return (total - misses) / total if total > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            'sources': dict(self.sources),
+            'hit_ratio': self.hit_ratio(),
+            'requests': self.requests,
+            'avg_latency_ms': self.latency / self.requests * 1000 if self.requests > 0 else 0.0,
+            'max_latency_ms': self.max_latency * 1000,
+            'bytes': self.size,
+            'decode_ms': self.decode * 1000,
+        }
+
+
+@attrs.define
+class FetchStats:
+    """
+    Collects fetch totals per API and per entity (an API and an id, like one champ), along with the
+    most recent `max_spans` top level spans. Thread safe. Spans opened on a thread nest under the
+    span that is open on it, use `attach` to nest work on other threads.
+    """
+    max_spans: int = attrs.field(default=32)
+    apis: dict[str, FetchTotals] = attrs.field(factory=dict, init=False)
+    entities: dict[tuple[str, str], FetchTotals] = attrs.field(factory=dict, init=False)
+    spans: deque[Span] = attrs.field(init=False)
+    _lock: threading.Lock = attrs.field(factory=threading.Lock, init=False)
+    _local: threading.local = attrs.field(factory=threading.local, init=False)
+
+    def __attrs_post_init__(self):
+        self.spans = deque(maxlen=self.max_spans)
+
+    def current(self) -> Span | None:
+        """The span open on this thread."""
+        return getattr(self._local, 'span', None)
+
+    @contextmanager
+    def attach(self, span: Span | None) -> Iterator[None]:
+        """Makes spans opened on this thread nest under `span`, which was opened on another thread."""
+        previous = self.current()
+        self._local.span = span
+        try:
+            yield
+        finally:
+            self._local.span = previous
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[Span]:
+        """Times the block as a span nested under the span open on this thread."""
+        span = Span(name)
+        parent = self.current()
+        with self._lock:
+            if parent is not None:
+                parent.children.append(span)
+            else:
+                self.spans.append(span)
+        self._local.span = span
+        try:
+            yield span
+        finally:
+            span.end = time.perf_counter()
+            self._local.span = parent
+
+    def record(self, api: str, key: str | None, source: FetchSource, latency: float = 0.0, size: int = 0, decode: float = 0.0) -> None:
+        """Records a fetch against its totals, and against the open span unless it came from memory."""
+        with self._lock:
+            self.apis.setdefault(api, FetchTotals()).add(source, latency, size, decode)
+            if key is not None:
+                self.entities.setdefault((api, key), FetchTotals()).add(source, latency, size, decode)
+        span = self.current()
+        if span is not None and source != FetchSource.MEMORY:
+            span.source = source
+            span.latency += latency
+            span.size += size
+            span.decode += decode
+
+    def last_span(self, name: str | None = None) -> Span | None:
+        """The most recent top level span, optionally only those with the given name."""
+        with self._lock:
+            for span in reversed(self.spans):
+                if name is None or span.name == name:
+                    return span
+        return None
+
+    def summary(self, entities: bool = False) -> dict:
+        with self._lock:
+            summary = {
+                'apis': {api: totals.to_dict() for api, totals in self.apis.items()},
+                'spans': [span.to_dict() for span in self.spans],
+            }
+            if entities:
+                summary['entities'] = {f"{api} {key}": totals.to_dict() for (api, key), totals in self.entities.items()}
+        return summary
+
+    def reset(self) -> None:
+        with self._lock:
+            self.apis.clear()
+            self.entities.clear()
+            self.spans.clear()
@@ -8,6 +8,7 @@ import yaml
 DB = "mongodb://127.0.0.1:32769/?directConnection=true"
 IP = "0.0.0.0"
 PORT = 10000
+REFRESH_INTERVAL = 300
 
 # Alias configs.
 CHAMP_ALIAS_FILE = "config/champ_aliases.csv"
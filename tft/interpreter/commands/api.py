@@ -9,4 +9,5 @@ from tft.interpreter.commands.help import *
 from tft.interpreter.commands.warm import *
 from tft.interpreter.commands.match import *
 from tft.interpreter.commands.comp import *
-from tft.interpreter.commands.top import *
\ No newline at end of file
+from tft.interpreter.commands.top import *
+from tft.interpreter.commands.query import *
\ No newline at end of file
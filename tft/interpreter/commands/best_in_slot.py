@@ -1,12 +1,12 @@
 import tft.ql.expr as ql
-import tft.client.meta as meta
 
 from typing import Any, override
 from tft.interpreter.commands.registry import Command, ValidationException, register
 from tft.ql.table import AvgPlaceField, GamesPlayedField, ItemNameField, Table
-from tft.ql.util import avg_place, count_match_score
+from tft.ql.util import avg_place, components_or_self, count_match_score
 from tft.queries.aliases import get_champ_aliases
-from tft.queries.items import ItemType, get_item_name_map, get_recipes
+from tft.queries.champs import query_champ_builds
+from tft.queries.items import ItemType, get_item_name_map
 import tft.interpreter.validation as valid
 
 @register(name='bis')
@@ -24,23 +24,15 @@ class BestInSlotCommand(Command):
     @override
     def execute(self, inputs: Any = None) -> Any:
         champ, components = inputs
-        q = ql.query(meta.get_champ_item_data(champ)).idx(f"{champ}.builds").map(ql.sub({
-            'items': ql.idx('buildNames').split('|'),
-            'places': ql.idx('places')
-        }))
+        q = query_champ_builds(champ)
         # Items are in the item name map and builds have 3 items.
         q = q.filter(ql.all([
             ql.idx('items').map(ql.in_set(get_item_name_map())).unary(all),
             ql.idx('items').len().eq(3)
         ]))
-        # Converts item to components if it has components.
-        def components_or_self(item: str) -> list[str]:
-            if item in get_recipes():
-                return get_recipes()[item]
-            return [item]
         # Items have the components passed.
         q = q.map(ql.extend({
-            'matched_components': ql.idx('items').map(ql.unary(components_or_self)).flatten().unary(count_match_score(components))
+            'matched_components': ql.idx('items').map(ql.unary(components_or_self())).flatten().unary(count_match_score(components))
         }))
         q = q.filter(ql.idx('matched_components').eq(len(components)))
         
@@ -34,13 +34,11 @@ class EarlyCommand(Command):
         q_comp_details = query_comp_details().idx(f"{inputs}")
         # Get augment info and append percentage.
         q_aug_info = q_comp_details.idx('augments').map(ql.select(['aug', 'count']))
-        total_augs = q_aug_info.map(ql.idx('count')).unary(sum).eval()
-        q_aug_info = q_aug_info.map(ql.extend({'percent': ql.idx('count').unary(lambda x: x / total_augs)}).select(['aug', 'percent']))
+        q_aug_info = q_aug_info.share(ql.idx('count'), 'percent').map(ql.select(['aug', 'percent']))
 
         # Get reroll info and append percentage.
         q_reroll_info = q_comp_details.idx('rerolls').explode('level')
-        total_rerolls = q_reroll_info.map(ql.idx('rerolls')).unary(sum).eval()
-        q_reroll_info = q_reroll_info.map(ql.extend({'percent': ql.idx('rerolls').unary(lambda x: x / total_rerolls)}).select(['level', 'percent']))
+        q_reroll_info = q_reroll_info.share(ql.idx('rerolls'), 'percent').map(ql.select(['level', 'percent']))
 
         # Get level info.
         q_level_info = q_comp_details.idx('levels').select(['level', 'stage', 'round'])
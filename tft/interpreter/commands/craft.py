@@ -20,7 +20,7 @@ class CraftCommand(Command):
     @override
     def execute(self, inputs: Any = None) -> Any:
         components = query_component_items().eval()
-        buildable_items = query_buildable_items().eval()
+        buildable_items = query_buildable_items().eval_cached()
         if inputs in components:
             recipes = [item for item in buildable_items.values() if inputs in item['composition']]
             return {
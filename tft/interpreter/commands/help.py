@@ -30,6 +30,7 @@ class HelpCommand(Command):
             output += "Available commands:\n"
             for command in sorted(COMMAND_REGISTRY.keys()):
                 output += f"  {command:10} {COMMAND_REGISTRY[command].name()}\n"
+            output += "Prefix a command with --profile to see what its queries cost.\n"
         else:
             command = outputs[0]
             command_name = COMMAND_REGISTRY[command].name()
@@ -3,10 +3,10 @@
 from typing import Any, override
 from tft.interpreter.commands.registry import Command, ValidationException, register
 from tft.ql.table import AvgPlaceField, ChampionListField, CompClusterField, Field, GamesPlayedField, Table
-from tft.ql.util import match_score
+from tft.ql.util import match_rank
 from tft.queries.aliases import get_champ_aliases
 import tft.ql.expr as ql
-from tft.queries.comps import query_comps
+from tft.queries.comps import query_indexed_comps
 import tft.interpreter.validation as valid
 
 
@@ -32,14 +32,13 @@ class MatchCommand(Command):
     @override
     def execute(self, inputs: Any = None) -> Any:
         level_filter, cluster_filter, field_filter, champs = inputs
-        scoring_function = match_score(champs)
-        early_comps = query_comps()
+        early_comps = query_indexed_comps()
         if level_filter is not None:
             early_comps = early_comps.filter(ql.idx('level').in_set(level_filter))
         if cluster_filter is not None:
             early_comps = early_comps.filter(ql.idx('cluster').in_set(cluster_filter))
         early_comps = early_comps.map(ql.extend({
-            'match_score': ql.unary(lambda x: scoring_function(x['units']) * 10000000 + x['games'])
+            'match_score': ql.unary(match_rank(champs))
         })).sort_by(ql.idx('match_score'), True)
         if field_filter is not None and field_filter['value'] in ['match_score', 'games', 'level', 'avg_place']:
             early_comps = early_comps.sort_by(ql.idx(field_filter['value']), field_filter['direction'] == 'DES')
@@ -0,0 +1,39 @@
+import json
+from typing import Any, override
+from tft.interpreter.commands.registry import Command, ValidationException, register
+from tft.ql.budget import BudgetExceeded
+from tft.ql.parse import ParseError
+from tft.queries.adhoc import DATASETS, run_query
+
+
+@register(name='ql')
+class QueryCommand(Command):
+    """Runs an ad hoc QL query, see `tft.ql.parse`."""
+
+    @override
+    def validate(self, inputs: list | None = None) -> Any:
+        if inputs is None or len(inputs) == 0:
+            raise ValidationException("Pass a query, e.g. ql comps.top(5)")
+        return ' '.join(inputs)
+
+    @override
+    def execute(self, inputs: Any = None) -> Any:
+        try:
+            return run_query(inputs)
+        except (ParseError, BudgetExceeded) as e:
+            raise ValidationException(str(e))
+
+    @override
+    def render(self, outputs: Any = None) -> str:
+        output = json.dumps(outputs['result'], indent=2, default=str)
+        if outputs['truncated']:
+            output += f"\nShowing {len(outputs['result'])} of {outputs['rows']} rows."
+        return output
+
+    @override
+    def name(self) -> str:
+        return "Ad Hoc Query"
+
+    @override
+    def description(self) -> str:
+        return f"Runs a QL query written like it is in Python, without the ql. prefix.\nDatasets: {', '.join(DATASETS)}\nUsage: ql comps.filter(idx('units').contains('TFT12_Ahri')).sort_by(idx('games'), True).top(5)"
@@ -3,10 +3,9 @@
 from typing import Any, override
 from tft.interpreter.commands.registry import Command, ValidationException, register
 from tft.ql.table import AvgPlaceField, ChampionListField, CompClusterField, CompNameField, Field, GamesPlayedField, ItemListField, Table, coerce_champ_name
-from tft.ql.util import match_score
 from tft.queries.aliases import get_champ_aliases
 import tft.ql.expr as ql
-from tft.queries.comps import query_comps, query_top_comps
+from tft.queries.comps import has_champs, query_comps, query_indexed_top_comps
 import tft.interpreter.validation as valid
 from tft.interpreter.validation import EntityType
 
@@ -29,9 +28,8 @@ class TopCommand(Command):
         cluster_id = inputs['cluster_id'] if 'cluster_id' in inputs else None
         filter_field = inputs['field'][0] if 'field' in inputs else None
 
-        scoring_function = match_score(champs)
-        top_comps = query_top_comps()
-        top_comps = top_comps.filter(ql.idx('units').unary(scoring_function).eq(len(champs)))
+        top_comps = query_indexed_top_comps()
+        top_comps = top_comps.filter(has_champs(champs))
         if cluster_id is not None:
             top_comps = top_comps.filter(ql.idx('cluster').in_set(cluster_id))
         if filter_field is not None and filter_field['value'] in ['games', 'avg_place']:
@@ -25,7 +25,7 @@ class TraitCommand(Command):
     def execute(self, inputs: Any = None) -> Any:
         trait = inputs
         return {
-            'champs': query_champs().filter(ql.idx('traits').contains(trait)).sort_by(ql.idx('cost')).eval(),
+            'champs': query_champs().indexed(['traits']).filter(ql.idx('traits').contains(trait)).sort_by(ql.idx('cost')).eval(),
             'info': query_traits().filter(ql.idx('name').eq(trait)).only().eval()
         }
 
@@ -1,14 +1,14 @@
-
-
-
 from typing import Any, override
 import tft.client.meta as meta
+from tft.client.stats import Span
 from tft.interpreter.commands.registry import Command, ValidationException, register
+from tft.ql.table import Field, Table
+import tft.ql.expr as ql
 
 
 @register(name='warm')
 class WarmUpCommand(Command):
-    
+
     @override
     def validate(self, inputs: list | None = None) -> Any:
         if inputs is None:
@@ -16,23 +16,43 @@ class WarmUpCommand(Command):
         if len(inputs) != 0:
             raise ValidationException("No params should be passed.")
         return None
-    
+
     @override
     def execute(self, inputs: Any = None) -> Any:
-        meta.get_comp_data()
-        meta.get_champ_item_data()
-        meta.get_set_data()
-        meta.get_comp_details()
-    
+        return meta.warm_up()
+
     @override
-    def render(self, outputs: Any = None) -> str:
-        return 'Caches are warm.'
-    
+    def render(self, outputs: Span | None = None) -> str:
+        output = 'Caches are warm.'
+        if outputs is None:
+            return output
+        output += f" Took {outputs.duration():.2f}s.\n\n"
+
+        stats = meta.get_stats()
+        rows = [{'api': api} | totals for api, totals in stats['apis'].items()]
+        api_table = Table([
+            Field('API', ql.idx('api'), 14),
+            Field('Requests', ql.idx('requests'), 8),
+            Field('Hit %', ql.idx('hit_ratio').unary(lambda x: f"{x * 100:.1f}"), 6),
+            Field('Avg ms', ql.idx('avg_latency_ms').unary(lambda x: f"{x:.1f}"), 8),
+            Field('Max ms', ql.idx('max_latency_ms').unary(lambda x: f"{x:.1f}"), 8),
+            Field('KB', ql.idx('bytes').unary(lambda x: f"{x / 1024:.0f}"), 8),
+            Field('Decode ms', ql.idx('decode_ms').unary(lambda x: f"{x:.1f}"), 9),
+        ])
+        output += api_table.render(rows)
+
+        output += "\nCritical path:\n"
+        for depth, span in outputs.critical_tree():
+            source = f" ({span.source.value})" if span.source is not None else ''
+            output += f"{'  ' * depth}{span.name}: {span.duration() * 1000:.1f}ms{source}\n"
+        flights = stats['flights']
+        output += f"\n{flights['calls']} requests made, {flights['coalesced']} coalesced. Breaker is {stats['breaker']}."
+        return output
+
     @override
     def name(self) -> str:
         return "Warmup Caches"
-    
+
     @override
     def description(self) -> str:
-        return "This command downloads all info locally, so that futures requests are fast.\nUsage: warm"
-        
\ No newline at end of file
+        return "This command downloads all info locally, so that futures requests are fast. Prints where the time went.\nUsage: warm"
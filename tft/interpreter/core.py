@@ -7,9 +7,12 @@ import readline
 import tft.client.meta as meta
 import tft.interpreter.commands.api as commands
 from tft.interpreter.commands.registry import ValidationException
+from tft.ql.profiling import profiling, render
 
 PROMPT = "\n> "
 BLANK_COMMAND = ''
+# Prefix to a command that prints what each query it ran cost, e.g. `--profile match ahri`.
+PROFILE_PREFIX = '--profile'
 
 class Interpreter:
     """This is an interpreter for command line commands."""
@@ -26,6 +29,12 @@ class Interpreter:
             elif inp in commands.QUIT_COMMANDS:
                 break
             parts = [part for part in inp.split(' ') if part != ''] # We shouldn't break with multiple spaces.
+            profile = parts[0] == PROFILE_PREFIX
+            if profile:
+                parts = parts[1:]
+                if len(parts) == 0:
+                    print(f"Usage: {PROFILE_PREFIX} <command>")
+                    continue
             command_name = parts[0]
             args = parts[1:]
 
@@ -35,9 +44,17 @@ class Interpreter:
             command = commands.COMMAND_REGISTRY[command_name]
 
             try:
-                validated_outputs = command.validate(args)
-                outputs = command.execute(validated_outputs)
-                print(command.render(outputs))
+                if profile:
+                    with profiling() as profiles:
+                        validated_outputs = command.validate(args)
+                        outputs = command.execute(validated_outputs)
+                        print(command.render(outputs))
+                    print('\nProfile:')
+                    print(render(profiles) if len(profiles) > 0 else 'No queries were evaluated.')
+                else:
+                    validated_outputs = command.validate(args)
+                    outputs = command.execute(validated_outputs)
+                    print(command.render(outputs))
             except ValidationException as e:
                 print(e)
             # except Exception as e:
@@ -10,16 +10,22 @@ import tft.client.meta as meta
 import tft.interpreter.commands.api as commands
 from tft.interpreter.commands.registry import ValidationException
 import tft.ql.expr as ql
+import tft.ql.profiling as profiling
 
-from flask import Flask, request
+from flask import Flask, Response, g, request
 from flask_cors import CORS, cross_origin
 
 from tft.config import DB, IP, PORT
+from tft.ql.budget import BudgetExceeded
+from tft.ql.parse import ParseError
+from tft.ql.views import VIEWS
+from tft.queries.adhoc import DEFAULT_MAX_ROWS, DEFAULT_SECONDS, run_query
 from tft.queries.aliases import add_alias
-from tft.queries.comps import query_top_comps
+from tft.queries.champs import query_champ_builds
+from tft.queries.comps import has_champs, query_indexed_top_comps
 from tft.queries.comp_traits import compute_comp_traits
 from tft.queries.items import get_item_name_map, get_recipes
-from tft.ql.util import built_from, match_score, count_match_score
+from tft.ql.util import avg_place, built_from, match_score, count_match_score
 
 app = Flask(__name__)
 cors = CORS(app) # allow CORS for all domains on all routes.
@@ -40,6 +46,29 @@ def create_event(session_id: str, user_id: str, tool: str, data: str):
         'data': data
     })
 
+@app.before_request
+def start_profiling():
+    '''Profiles the QL queries a request runs if it passes `profile=1`.'''
+    if request.args.get('profile') == '1':
+        g.profiles = profiling.start()
+
+@app.after_request
+def add_profile(response: Response) -> Response:
+    '''Adds the profile of a profiled request to its JSON response, see `tft.ql.profiling`.'''
+    profiles = g.pop('profiles', None)
+    if profiles is not None:
+        profiling.stop()
+        data = response.get_json(silent=True)
+        if isinstance(data, dict):
+            data['profile'] = [profile.to_dict() for profile in profiles]
+            response.set_data(app.json.dumps(data))
+    return response
+
+@app.teardown_request
+def stop_profiling(error: BaseException | None = None):
+    '''Stops profiling a request that failed before its response was made.'''
+    profiling.stop()
+
 @app.route('/set_info')
 @cross_origin()
 def get_set_info():
@@ -57,20 +86,19 @@ def get_set_info():
     )).eval()
 
     # Traits.
-    traits = all_set_data.idx('traits').filter(ql.contains('units')).map(ql.sub({
+    q_traits = all_set_data.idx('traits').filter(ql.contains('units')).map(ql.sub({
         'apiName': ql.idx('apiName'),
         'name': ql.idx('name'),
         'tiers': ql.idx('effects').map(ql.idx('minUnits')),
         'units': ql.idx('units').map(ql.idx('unit'))
-    })).eval()
-    # The champs data doesn't use the api name for traits.
-    soft_to_hard_traits = {x['name']: x['apiName'] for x in traits}
+    }))
+    traits = q_traits.eval()
 
-    # Units.
+    # Units. The champs data doesn't use the api name for traits, so they are joined to the traits by name.
     champs = all_set_data.idx('units').filter(ql.idx('traits').length().gt(0)).map(ql.sub({
         'apiName': ql.idx('apiName'),
         'name': ql.idx('name'),
-        'traits': ql.idx('traits').map(ql.replace(soft_to_hard_traits)),
+        'traits': ql.idx('traits').join(q_traits, ql.query(), ql.idx('name')).map(ql.idx('apiName')),
         'cost': ql.idx('cost')
     })).eval()
 
@@ -261,27 +289,28 @@ def get_top_comps():
 
     Args:
         champ_ids: Comma-separated list of champion API IDs (e.g., TFT14_Vayne,TFT14_Jhin)
+        set, rank, days, cluster_id: Optional dataset to use, see `meta.Dataset.from_args`
 
     Returns:
         dict: Contains 'comps' list with composition data
     """
     champ_ids_param = request.args.get('champ_ids', '')
     champ_ids: list[str] = [c.strip() for c in champ_ids_param.split(',') if c.strip()]
+    try:
+        dataset = meta.Dataset.from_args(request.args)
+    except ValueError as e:
+        return {'comps': [], 'error': str(e)}
 
-    top_comps = query_top_comps()
+    top_comps = query_indexed_top_comps(dataset)
 
     if len(champ_ids) > 0:
-        scoring_function = match_score(champ_ids)
-        top_comps = top_comps.filter(ql.idx('units').unary(scoring_function).eq(len(champ_ids)))
+        top_comps = top_comps.filter(has_champs(champ_ids))
 
     top_comps = top_comps.sort_by(ql.idx('games'), True).top(50)
-    result = top_comps.eval()
-
     # Add traits to each composition
-    for comp in result:
-        comp['traits'] = compute_comp_traits(comp['units'])
+    top_comps = top_comps.map(ql.extend({'traits': ql.idx('units').unary(compute_comp_traits)}))
 
-    return {'comps': result}
+    return {'comps': top_comps.eval()}
 
 
 @app.route('/bis', methods=['GET'])
@@ -294,21 +323,28 @@ def get_best_in_slot():
     Args:
         champ_id: Champion API ID (e.g., TFT16_Teemo)
         item_ids: Comma-separated list of component item API IDs
+        set, rank, days, cluster_id: Optional dataset to use, see `meta.Dataset.from_args`
 
     Returns:
-        dict: Contains 'builds' list with item build data
+        dict: Contains 'builds' list with item build data, or an 'error' with a 400 for an unknown champ_id
     """
     champ_id = request.args.get('champ_id', '')
     if not champ_id:
         return {'builds': [], 'error': 'champ_id is required'}
+    try:
+        dataset = meta.Dataset.from_args(request.args)
+    except ValueError as e:
+        return {'builds': [], 'error': str(e)}
+    # Only champs in the set data are fetched, so unknown ids never reach MetaTFT or the disk cache.
+    if champ_id not in meta.get_champ_ids(dataset):
+        return {'builds': [], 'error': f"Unknown champ_id: {champ_id}"}, 400
 
     item_ids_param = request.args.get('item_ids', '')
     item_ids: list[str] = [i.strip() for i in item_ids_param.split(',') if i.strip()]
 
-    # Query champion build data
-    q = ql.query(meta.get_champ_item_data(champ_id)).idx(f"{champ_id}.builds").map(ql.sub({
-        'items': ql.idx('buildNames').split('|'),
-        'places': ql.idx('places')
+    # Query champion build data, with games and avg_place computed from the places array.
+    q = query_champ_builds(champ_id, dataset).map(ql.extend({
+        'games': ql.idx('places').unary(sum)
     }))
 
     # Filter for valid builds (items in name map, 1-3 items)
@@ -327,27 +363,72 @@ def get_best_in_slot():
         
         q = q.filter(ql.idx('items').unary(built_from(item_ids))).filter(ql.idx('items').len().eq(3))
 
-    # Sort by total games and get top 20
-    result = q.sort_by(ql.idx('places').unary(sum), True).top(100).eval()
-
-    # Compute avg_place and games from places array
-    for build in result:
-        places = build['places']
-        total = sum(places)
-        build['games'] = total
-        build['avg_place'] = sum((i + 1) * x / total for i, x in enumerate(places)) if total > 0 else 0
+    # Sort by total games and get top 100
+    result = q.sort_by(ql.idx('games'), True).top(100).map(ql.extend({
+        'avg_place': ql.unary(lambda build: avg_place(build['places']) if build['games'] > 0 else 0)
+    })).eval()
 
     return {'builds': result}
 
 
+@app.route('/ql', methods=['GET'])
+@cross_origin()
+def run_ql():
+    """
+    Endpoint to run an ad hoc QL query over the cached MetaTFT data, see `tft.ql.parse` for the syntax.
+
+    Args:
+        q: The query, e.g. comps.filter(idx('units').contains('TFT12_Ahri')).sort_by(idx('games'), True)
+        max_rows: How many rows of the result to return at most
+        seconds: How long the query can run for
+        set, rank, days, cluster_id: Optional dataset to use, see `meta.Dataset.from_args`
+
+    Returns:
+        dict: See `run_query`, or an 'error' if the query is invalid, fails or runs out of time
+    """
+    text = request.args.get('q', '')
+    try:
+        dataset = meta.Dataset.from_args(request.args)
+        max_rows = int(request.args.get('max_rows', DEFAULT_MAX_ROWS))
+        seconds = float(request.args.get('seconds', DEFAULT_SECONDS))
+    except ValueError as e:
+        return {'error': str(e)}
+    if max_rows < 0 or not seconds > 0:
+        return {'error': 'max_rows must be at least 0 and seconds more than 0'}
+
+    try:
+        return run_query(text, dataset, max_rows, seconds)
+    except (ParseError, BudgetExceeded) as e:
+        return {'error': str(e)}
+    except Exception as e:
+        # Queries that parse can still fail on the data, like indexing a field a row doesn't have.
+        return {'error': f"Query failed: {type(e).__name__}: {e}"}
+
+
+@app.route('/stats', methods=['GET'])
+@cross_origin()
+def get_stats():
+    """
+    Endpoint to fetch instrumentation of fetches from MetaTFT, and the versions of the materialized
+    views derived from them.
+
+    Args:
+        entities: Pass 1 to include totals for every champ and comp
+
+    Returns:
+        dict: See `meta.get_stats`, with the views under 'views', see `ViewRegistry.stats`
+    """
+    return meta.get_stats(entities=request.args.get('entities') == '1') | {'views': VIEWS.stats()}
+
+
 if __name__ == '__main__':
-    # Flask server hates multiprocessing's pool.
-    print('Warming caches. Flask server hates multiprocessing otherwise.')
+    # Warm up front so the first requests don't pay for the fan out.
+    print('Warming caches.')
     meta.create_client(meta.MetaTFTClientType.ONLINE_AND_OFFLINE)
-    meta.get_comp_data()
-    meta.get_champ_item_data()
-    meta.get_set_data()
-    meta.get_comp_details()
-    print('Caches warmed, starting server.')
+    span = meta.warm_up()
+    print(f"Warmed caches in {span.duration():.2f}s, see /stats for where the time went.")
+    # Keep serving the warm data while fresh data is fetched in the background.
+    meta.start_refresher()
+    print('Starting server.')
 
     app.run(host=IP, port=PORT)
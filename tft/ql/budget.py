@@ -0,0 +1,93 @@
+"""
+Time budgets for QL queries, for queries written by users, see `tft.ql.parse`, that could otherwise
+run for as long as they like. A query compiled with `checked` checks the deadline of the budget its
+thread is running under before every transform, every call of a nested query, like the predicate of
+a `filter` for each row, and every row streamed between transforms, and raises `BudgetExceeded`
+once it has passed. Work between two checks, like sorting a long list, isn't interrupted, so a
+query can overrun its budget by that much.
+
+Checked queries work like any other outside of a budget, the checks just find no deadline.
+
+Usage:
+    fn = query.compile_checked()
+    with limit(0.5):
+        fn(m)
+"""
+from contextlib import contextmanager
+import threading
+import time
+from typing import Any, Callable, Iterator
+
+
+class BudgetExceeded(Exception):
+    """Raised by a checked query that runs past the deadline of its budget."""
+    pass
+
+
+class _State(threading.local):
+    def __init__(self):
+        # When the budget this thread is running under runs out, by `time.perf_counter`.
+        self.deadline: float | None = None
+        self.seconds: float = 0.0
+        # Whether queries compiled on this thread are checked.
+        self.checking = False
+
+
+_state = _State()
+
+
+def checking() -> bool:
+    """Whether queries compiled on this thread are checked against budgets."""
+    return _state.checking
+
+
+@contextmanager
+def compiling_checked() -> Iterator[None]:
+    """Checks every query compiled in the block, including the queries nested in it."""
+    previous = _state.checking
+    _state.checking = True
+    try:
+        yield
+    finally:
+        _state.checking = previous
+
+
+def check() -> None:
+    """Raises `BudgetExceeded` if this thread is running under a budget that has run out."""
+    deadline = _state.deadline
+    if deadline is not None and time.perf_counter() > deadline:
+        raise BudgetExceeded(f"Query ran past its budget of {_state.seconds:g}s.")
+
+
+def _check_each(it: Iterator) -> Iterator:
+    for item in it:
+        check()
+        yield item
+
+
+def checked(fn: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    """Wraps a compiled query or transform to check the budget before it runs."""
+    def run(m: Any) -> Any:
+        check()
+        return fn(m)
+    return run
+
+
+def checked_stream(fn: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    """Wraps a compiled transform that may return an iterator to also check the budget for every item."""
+    def run(m: Any) -> Any:
+        check()
+        out = fn(m)
+        return _check_each(out) if isinstance(out, Iterator) else out
+    return run
+
+
+@contextmanager
+def limit(seconds: float) -> Iterator[None]:
+    """Runs the checked queries evaluated in the block under a budget of `seconds`."""
+    previous = (_state.deadline, _state.seconds)
+    _state.deadline, _state.seconds = time.perf_counter() + seconds, seconds
+    try:
+        yield
+    finally:
+        _state.deadline, _state.seconds = previous
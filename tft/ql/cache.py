@@ -0,0 +1,125 @@
+"""
+Memoized query results. A query's fingerprint describes what it computes: the transforms and their
+arguments, the functions passed to `unary` and the like by their code and the values they close
+over, and the datasets it runs on by identity. Two queries built the same way over the same data get
+the same fingerprint, so the second can reuse the first one's result.
+
+Results are keyed by (fingerprint, version), where the version is bumped by `invalidate` whenever the
+MetaTFT data is refreshed. Results on a view are keyed by the view's version instead, which changes
+with the data they were computed from, so `invalidate` keeps them, see `tft.ql.views`. Cached results
+are shared between callers and must be treated as read only, like the rows of `ql.extend`.
+
+Functions are fingerprinted by their code, defaults and closure, not by the globals they read, so
+only functions that depend on nothing but their arguments and the data should be cached.
+"""
+from collections import OrderedDict
+import functools
+import threading
+import types
+from typing import Any, Callable
+from attrs import define, field
+
+MAX_CACHED_RESULTS = 256
+
+
+class Unfingerprintable(Exception):
+    """Raised for values a fingerprint can't be made of, which makes a query uncacheable."""
+    pass
+
+
+def fingerprint_value(v: Any, seen: frozenset = frozenset()) -> Any:
+    """
+    Returns a hashable value that is equal for equal arguments to a transform. Raises
+    `Unfingerprintable` if there is none.
+    """
+    if v is None or isinstance(v, (bool, int, float, complex, str, bytes)):
+        # Keep the type so 1, 1.0 and True don't collide.
+        return (type(v), v)
+    if hasattr(type(v), 'fingerprint'):
+        fp = v.fingerprint()
+        if fp is None:
+            raise Unfingerprintable(f"Can't fingerprint {type(v).__name__}")
+        return fp
+    if isinstance(v, dict):
+        return (dict, tuple((fingerprint_value(k, seen), fingerprint_value(x, seen)) for k, x in v.items()))
+    if isinstance(v, (list, tuple)):
+        return (type(v), tuple(fingerprint_value(x, seen) for x in v))
+    if isinstance(v, (set, frozenset)):
+        return (type(v), frozenset(fingerprint_value(x, seen) for x in v))
+    if isinstance(v, types.FunctionType):
+        if id(v) in seen:
+            # Recursive function, its code is enough.
+            return (types.FunctionType, v.__code__)
+        seen = seen | {id(v)}
+        cells = []
+        for cell in v.__closure__ or ():
+            try:
+                cells.append(fingerprint_value(cell.cell_contents, seen))
+            except ValueError:
+                # Cell that hasn't been assigned yet.
+                cells.append(None)
+        return (types.FunctionType, v.__code__, fingerprint_value(v.__defaults__, seen), tuple(cells))
+    if isinstance(v, functools.partial):
+        return (functools.partial, fingerprint_value(v.func, seen), fingerprint_value(v.args, seen), fingerprint_value(v.keywords, seen))
+    if isinstance(v, (types.BuiltinFunctionType, type)):
+        # Builtins and classes are the same object for the life of the process.
+        return v
+    raise Unfingerprintable(f"Can't fingerprint {type(v).__name__}")
+
+
+@define
+class QueryCache:
+    """
+    A least recently used cache of query results, keyed by fingerprint and version. Thread safe. Each
+    entry keeps its query alive, so the datasets in the fingerprint can't be replaced by other
+    objects with the same id.
+    """
+    max_entries: int = field(default=MAX_CACHED_RESULTS)
+    version: int = field(default=0, init=False)
+    hits: int = field(default=0, init=False)
+    misses: int = field(default=0, init=False)
+    # What each entry keeps alive, its result and whether it is kept by `invalidate`.
+    _entries: OrderedDict[tuple, tuple[Any, Any, bool]] = field(factory=OrderedDict, init=False)
+    _lock: threading.Lock = field(factory=threading.Lock, init=False)
+
+    def get(self, fingerprint: tuple, compute: Callable[[], Any], keep: Any = None, version: int | None = None) -> Any:
+        """
+        Returns the cached result for the fingerprint, calling `compute` for it on a miss. With a
+        `version`, like a view's, the result is kept by it rather than the cache's own version.
+        """
+        pinned = version is not None
+        with self._lock:
+            key = (fingerprint, ('view', version) if pinned else self.version)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        result = compute()
+        with self._lock:
+            # Dropped if the cache was invalidated while computing.
+            if pinned or key[1] == self.version:
+                self._entries[key] = (keep, result, pinned)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return result
+
+    def invalidate(self) -> None:
+        """
+        Drops every result, for when the data they were computed from changes, except those kept by
+        their own version.
+        """
+        with self._lock:
+            self.version += 1
+            for key in [key for key, entry in self._entries.items() if not entry[2]]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'version': self.version, 'hits': self.hits, 'misses': self.misses}
+
+
+# Singleton used by `BaseQuery.eval_cached`.
+RESULTS = QueryCache()
@@ -1,10 +1,27 @@
 from abc import abstractmethod
+from contextlib import nullcontext
 from enum import Enum
 import json
-import copy
-from typing import Any, Callable, Iterable, Self, override
-from attrs import define, field, evolve
+import heapq
+from itertools import islice
+import operator
+import pickle
+from types import BuiltinFunctionType
+from typing import Any, Callable, Iterable, Iterator, Self, override
+from attrs import define, field, evolve, fields
+from tft.client.extract import Projection, projection
+from tft.ql.cache import RESULTS, Unfingerprintable, fingerprint_value
+from tft.ql.columns import NUMERIC_KINDS, Column, Columns, MissingField, is_table
+from tft.ql.index import INDEXES, MULTI_VALUED, HashIndex, intersect, union
+import numpy as np
+import tft.ql.budget as budget
+import tft.ql.parallel as parallel
+from tft.ql.profiling import Profile
+import tft.ql.profiling as profiling
+from tft.ql.record import with_field, with_fields
+from tft.ql.source import RAW_TYPES, JsonSource
 from tft.ql.util import splay
+from tft.ql.views import ViewSource
 import pandas as pd
 
 def identity(x: Any) -> Any:
@@ -12,22 +29,90 @@ def identity(x: Any) -> Any:
 
 _all = all
 _any = any
+_sum = sum
+
+# Kinds of `join`: `inner` drops the rows that match nothing, `left` keeps them as they are.
+JOIN_HOWS = ('inner', 'left')
 
 # Forward declaration.
 class Query:
     def eval(self, m: Any) -> Any:
         raise NotImplemented('Need to implement query')
 
+    def interpret(self, m: Any) -> Any:
+        return self.eval(m)
+
+    def fingerprint(self) -> tuple | None:
+        """Describes what the query computes, see `tft.ql.cache`. None if it can't be cached."""
+        return None
+
 class TransformType(Enum):
     SINGLE = 'single'
     MULTI = 'multi'
 
 @define
 class Transform:
+    # Whether a long list of records is worth viewing as columns for this transform alone.
+    starts_columns = True
+
     @abstractmethod
     def transform(self, m: Any) -> Any:
         raise NotImplemented('Need to implement transform')
 
+    def compile(self) -> Callable[[Any], Any]:
+        """
+        Returns a function that does the same as `transform`. Transforms that hold sub queries or
+        repeat work on every call override this to hoist it out of the function.
+        """
+        return self.transform
+
+    def compile_stream(self) -> Callable[[Iterator], Any] | None:
+        """
+        For transforms on lists. Returns a function that does the same as `transform` but is given
+        the list as an iterator. Returning an iterator keeps the list lazy, anything else is a sink
+        that materializes it. None if the transform needs the whole list at once.
+        """
+        return None
+
+    def compile_source(self) -> Callable[[Any], Iterator] | None:
+        """
+        For transforms that output a list. Returns a function that does the same as `transform` but
+        yields the list lazily.
+        """
+        return None
+
+    def compile_columns(self) -> Callable[[Columns], Any] | None:
+        """
+        For transforms on lists of records. Returns a function that does the same as `transform` on
+        the list viewed as columns, returning a view of the rows it keeps or a value. None if the
+        transform can't run on columns.
+        """
+        return None
+
+    def compile_vector(self) -> Callable[[Columns | Column], Column]:
+        """
+        Returns a function that applies the transform to every row of a view, or every value of a
+        column, and returns the results as a column. Transforms that can run on NumPy arrays
+        override this, the rest are applied a value at a time.
+        """
+        fn = self.compile()
+        return lambda x: x.map(fn)
+
+    def compile_fold(self) -> tuple[Any, Callable[[Any, Any], Any], Callable[[Any], Any]] | None:
+        """
+        For aggregates of a list, like `sum`. Returns the starting value, a function that adds a
+        row to it and a function that turns it into the aggregate, so `agg` and `group_by` can
+        compute every aggregate in one pass. None if the transform isn't an aggregate.
+        """
+        return None
+
+    def fingerprint(self) -> tuple | None:
+        """The transform's type and arguments, see `tft.ql.cache`. None if it can't be cached."""
+        try:
+            return (type(self),) + tuple(fingerprint_value(getattr(self, attr.name)) for attr in fields(type(self)))
+        except Unfingerprintable:
+            return None
+
     @abstractmethod
     def get_type(self) -> TransformType:
         return TransformType.SINGLE
@@ -38,10 +123,52 @@ class Noop(Transform):
     def transform(self, m: dict | list) -> Any:
         return m
 
+    @override
+    def compile(self) -> Callable[[Any], Any]:
+        return identity
+
+def _to_index(field: str) -> int | None:
+    try:
+        return int(field)
+    except ValueError:
+        return None
+
 @define
 class Index(Transform):
     path: list[str] = field(converter=lambda x: x.split('.'))
 
+    @override
+    def compile(self) -> Callable[[Any], Any]:
+        # Skip the checks on the happy path, and fall back to `transform` for its error messages.
+        parts = [(field, _to_index(field)) for field in self.path]
+        transform = self.transform
+        def index(m: Any) -> Any:
+            output = m
+            try:
+                for key, idx in parts:
+                    if isinstance(output, dict):
+                        output = output[key]
+                    elif idx is not None and isinstance(output, (list, tuple)):
+                        output = output[idx]
+                    else:
+                        return transform(m)
+            except (KeyError, IndexError):
+                return transform(m)
+            return output
+        return index
+
+    @override
+    def compile_vector(self) -> Callable[[Columns | Column], Column]:
+        fn = self.compile()
+        first = self.path[0]
+        rest = Index('.'.join(self.path[1:])).compile() if len(self.path) > 1 else None
+        def index(x: Columns | Column) -> Column:
+            if type(x) is Columns:
+                column = x.column(first)
+                return column if rest is None else column.map(rest)
+            return x.map(fn)
+        return index
+
     @override
     def transform(self, m: dict | list) -> Any:
         assert isinstance(m, dict) or isinstance(m, list) or isinstance(m, tuple), f"Is not of type dict or list: {type(m)}"
@@ -70,17 +197,82 @@ class Map(Transform):
             if self.key_query is not None:
                 if self.on_key:
                     raise Exception("Can only use on_key flag on dicts.")
-                return {self.key_query.eval(i): self.query.eval(i) for i in m}
+                return {self.key_query.interpret(i): self.query.interpret(i) for i in m}
             else:
-                return [self.query.eval(i) for i in m]
+                return [self.query.interpret(i) for i in m]
         elif isinstance(m, dict):
             if self.key_query is not None:
-                return {self.key_query.eval(key if self.on_key else val): self.query.eval(val) for key, val in m.items()}
+                return {self.key_query.interpret(key if self.on_key else val): self.query.interpret(val) for key, val in m.items()}
             else:
-                return {key: self.query.eval(val) for key, val in m.items()}
+                return {key: self.query.interpret(val) for key, val in m.items()}
         else:
             raise Exception(f"Mapping incorrect type: {type(m)}")
 
+    @override
+    def compile(self) -> Callable[[Any], Any]:
+        fn = compile_query(self.query)
+        if self.key_query is None:
+            run_parallel = self.compile_parallel()
+            def map_values(m: Any) -> Any:
+                if isinstance(m, list):
+                    if run_parallel is not None and (values := run_parallel(m)) is not None:
+                        return values
+                    return [fn(i) for i in m]
+                if isinstance(m, dict):
+                    return {key: fn(val) for key, val in m.items()}
+                raise Exception(f"Mapping incorrect type: {type(m)}")
+            return map_values
+        key_fn = compile_query(self.key_query)
+        on_key = self.on_key
+        def map_items(m: Any) -> Any:
+            if isinstance(m, list):
+                if on_key:
+                    raise Exception("Can only use on_key flag on dicts.")
+                return {key_fn(i): fn(i) for i in m}
+            if isinstance(m, dict):
+                return {key_fn(key if on_key else val): fn(val) for key, val in m.items()}
+            raise Exception(f"Mapping incorrect type: {type(m)}")
+        return map_items
+
+    @override
+    def compile_stream(self) -> Callable[[Iterator], Any] | None:
+        if self.key_query is not None:
+            return None
+        fn = compile_query(self.query)
+        return lambda it: (fn(i) for i in it)
+
+    def compile_parallel(self) -> Callable[[list], list | None] | None:
+        """
+        Returns a function that maps a long list in worker processes, or returns None for the caller
+        to map it, see `tft.ql.parallel`. An `extend` only has the fields it adds computed there, so
+        the rows aren't pickled back. None if the query isn't worth running in workers.
+        """
+        query = self.query
+        if isinstance(query, BaseQuery) and len(query.transforms) == 1 and isinstance(query.transforms[0], Extend) and (query.empty() or query.m is None):
+            run_fields = _compile_parallel(BaseQuery(None, [query.transforms[0].sub_query]), parallel.MAP)
+            if run_fields is None:
+                return None
+            def extend(m: list) -> list | None:
+                values = run_fields(m)
+                return [with_fields(row, fields) for row, fields in zip(m, values)] if values is not None else None
+            return extend
+        return _compile_parallel(query, parallel.MAP)
+
+    @override
+    def compile_source(self) -> Callable[[Any], Iterator] | None:
+        run_parallel = self.compile_parallel() if self.key_query is None else None
+        if run_parallel is None:
+            return None
+        # Long lists are mapped in workers before streaming on, see `tft.ql.parallel`.
+        fn = compile_query(self.query)
+        eager = self.compile()
+        def source(m: Any) -> Any:
+            if isinstance(m, list):
+                values = run_parallel(m)
+                return iter(values) if values is not None else (fn(i) for i in m)
+            return eager(m)
+        return source
+
 @define
 class Top(Transform):
     num: int = field(default=1)
@@ -91,6 +283,25 @@ class Top(Transform):
         assert isinstance(m, list), "Can only use top() on a list"
         return m[0:self.num] if not self.reverse else m[-self.num:]
 
+    @override
+    def compile_stream(self) -> Callable[[Iterator], Any] | None:
+        # Stops pulling from upstream once it has enough. The last n needs the whole list.
+        if self.reverse or self.num < 0:
+            return None
+        num = self.num
+        return lambda it: islice(it, num)
+
+    starts_columns = False
+
+    @override
+    def compile_columns(self) -> Callable[[Columns], Any] | None:
+        num = self.num
+        reverse = self.reverse
+        def top(view: Columns) -> Columns:
+            positions = np.arange(len(view))
+            return view.take(positions[0:num] if not reverse else positions[-num:])
+        return top
+
 @define
 class Split(Transform):
     delim: str = field(default=',')
@@ -111,8 +322,13 @@ class SubQuery(Transform):
     def transform(self, m: dict) -> Any:
         output = {}
         for key, query in self.query_map.items():
-            output[key] = query.eval(m)
+            output[key] = query.interpret(m)
         return output
+
+    @override
+    def compile(self) -> Callable[[Any], Any]:
+        fns = [(key, compile_query(query)) for key, query in self.query_map.items()]
+        return lambda m: {key: fn(m) for key, fn in fns}
     
     def get_type(self) -> TransformType:
         return TransformType.SINGLE
@@ -122,15 +338,23 @@ class Extend(Transform):
     sub_query: SubQuery = field()
 
     def transform(self, m: Any) -> Any:
-        output = copy.deepcopy(m)
-        sub_output = self.sub_query.transform(m)
-        for k, v in sub_output.items():
-            output[k] = v
-        return output
+        assert isinstance(m, dict), f"Can only extend dicts: {type(m)}"
+        return with_fields(m, self.sub_query.transform(m))
+
+    @override
+    def compile(self) -> Callable[[Any], Any]:
+        sub = self.sub_query.compile()
+        def extend(m: Any) -> Any:
+            assert isinstance(m, dict), f"Can only extend dicts: {type(m)}"
+            return with_fields(m, sub(m))
+        return extend
 
 @define
 class Explode(Transform):
     to_field: str = field()
+    # Only items this is true for are exploded. Set by the optimizer from a filter after the explode
+    # that doesn't read `to_field`, so dropped items are never copied.
+    where: Query | None = field(default=None)
 
     def transform(self, m: Any) -> Any:
         assert isinstance(m, dict), "Can only explode on a dict field"
@@ -139,17 +363,52 @@ class Explode(Transform):
             if isinstance(m[field], list):
                 for item in m[field]:
                     assert isinstance(item, dict), f"Internal item not of type dict: {type(item)}"
-                    new_item = copy.deepcopy(item)
-                    new_item[self.to_field] = field
-                    output.append(new_item)
+                    if self.where is None or self.where.interpret(item):
+                        output.append(with_field(item, self.to_field, field))
             elif isinstance(m[field], dict):
-                new_item = copy.deepcopy(m[field])
-                new_item[self.to_field] = field
-                output.append(new_item)
+                if self.where is None or self.where.interpret(m[field]):
+                    output.append(with_field(m[field], self.to_field, field))
             else:
                 assert False, f"Bad internal dict type for explode: {type(m[field])}"
         return output
 
+    @override
+    def compile(self) -> Callable[[Any], Any]:
+        source = self.compile_source()
+        return lambda m: list(source(m))
+
+    @override
+    def compile_source(self) -> Callable[[Any], Iterator] | None:
+        to_field = self.to_field
+        where = compile_query(self.where) if self.where is not None else None
+        def explode(m: Any) -> Iterator:
+            for field, val in m.items():
+                if isinstance(val, list):
+                    for item in val:
+                        assert isinstance(item, dict), f"Internal item not of type dict: {type(item)}"
+                        if where is None or where(item):
+                            yield with_field(item, to_field, field)
+                elif isinstance(val, dict):
+                    if where is None or where(val):
+                        yield with_field(val, to_field, field)
+                else:
+                    assert False, f"Bad internal dict type for explode: {type(val)}"
+        def source(m: Any) -> Iterator:
+            assert isinstance(m, dict), "Can only explode on a dict field"
+            return explode(m)
+        return source
+
+def _compare_vector(compare: Callable[[Any, Any], Any], other: Any) -> Callable[[Columns | Column], Column]:
+    """Compares a column to a number or a string on its array when the column holds the same kind."""
+    kinds = NUMERIC_KINDS if isinstance(other, (int, float)) else 'U' if isinstance(other, str) else None
+    def vector(x: Columns | Column) -> Column:
+        if kinds is not None and type(x) is Column:
+            array = x.array()
+            if array.dtype.kind in kinds:
+                return Column(array=compare(array, other))
+        return x.map(lambda m: compare(m, other))
+    return vector
+
 @define
 class LessThan(Transform):
     other: Any = field()
@@ -157,6 +416,15 @@ class LessThan(Transform):
     def transform(self, m: Any) -> bool:
         return m < self.other
 
+    @override
+    def compile(self) -> Callable[[Any], Any]:
+        other = self.other
+        return lambda m: m < other
+
+    @override
+    def compile_vector(self) -> Callable[[Columns | Column], Column]:
+        return _compare_vector(operator.lt, self.other)
+
 @define
 class LessThanEqual(Transform):
     other: Any = field()
@@ -164,12 +432,30 @@ class LessThanEqual(Transform):
     def transform(self, m: Any) -> bool:
         return m <= self.other
 
+    @override
+    def compile(self) -> Callable[[Any], Any]:
+        other = self.other
+        return lambda m: m <= other
+
+    @override
+    def compile_vector(self) -> Callable[[Columns | Column], Column]:
+        return _compare_vector(operator.le, self.other)
+
 @define
 class GreaterThan(Transform):
     other: Any = field()
 
     def transform(self, m: Any) -> bool:
         return m > self.other
+
+    @override
+    def compile(self) -> Callable[[Any], Any]:
+        other = self.other
+        return lambda m: m > other
+
+    @override
+    def compile_vector(self) -> Callable[[Columns | Column], Column]:
+        return _compare_vector(operator.gt, self.other)
     
 @define
 class GreaterThanEqual(Transform):
@@ -178,6 +464,15 @@ class GreaterThanEqual(Transform):
     def transform(self, m: Any) -> bool:
         return m >= self.other
 
+    @override
+    def compile(self) -> Callable[[Any], Any]:
+        other = self.other
+        return lambda m: m >= other
+
+    @override
+    def compile_vector(self) -> Callable[[Columns | Column], Column]:
+        return _compare_vector(operator.ge, self.other)
+
 @define
 class Equal(Transform):
     other: Any = field()
@@ -185,6 +480,15 @@ class Equal(Transform):
     def transform(self, m: Any) -> bool:
         return m == self.other
 
+    @override
+    def compile(self) -> Callable[[Any], Any]:
+        other = self.other
+        return lambda m: m == other
+
+    @override
+    def compile_vector(self) -> Callable[[Columns | Column], Column]:
+        return _compare_vector(operator.eq, self.other)
+
 @define
 class NotEqual(Transform):
     other: Any = field()
@@ -192,18 +496,60 @@ class NotEqual(Transform):
     def transform(self, m: Any) -> bool:
         return m != self.other
 
+    @override
+    def compile(self) -> Callable[[Any], Any]:
+        other = self.other
+        return lambda m: m != other
+
+    @override
+    def compile_vector(self) -> Callable[[Columns | Column], Column]:
+        return _compare_vector(operator.ne, self.other)
+
 @define
 class Negate(Transform):
     def transform(self, m: Any) -> Any:
         return not m
 
+    @override
+    def compile(self) -> Callable[[Any], Any]:
+        return lambda m: not m
+
+    @override
+    def compile_vector(self) -> Callable[[Columns | Column], Column]:
+        def negate(x: Columns | Column) -> Column:
+            if type(x) is Column:
+                return Column(array=~x.truthy())
+            return x.map(lambda m: not m)
+        return negate
+
 @define
 class _Any(Transform):
     queries: Iterable[Query] = field()
 
     @override
     def transform(self, m: Any) -> bool:
-        return _any(query.eval(m) for query in self.queries)
+        return _any(query.interpret(m) for query in self.queries)
+
+    @override
+    def compile(self) -> Callable[[Any], Any]:
+        fns = [compile_query(query) for query in self.queries]
+        return lambda m: _any(fn(m) for fn in fns)
+
+    @override
+    def compile_vector(self) -> Callable[[Columns | Column], Column]:
+        fns = [vectorize_query(query) for query in self.queries]
+        def any_(x: Columns | Column) -> Column:
+            result = np.zeros(len(x), dtype=bool)
+            # Like `any`, later queries only see the values no earlier query was true for.
+            pending = np.arange(len(x))
+            for fn in fns:
+                if len(pending) == 0:
+                    break
+                true = fn(x.take(pending)).truthy()
+                result[pending[true]] = True
+                pending = pending[~true]
+            return Column(array=result)
+        return any_
 
 @define
 class All(Transform):
@@ -211,7 +557,28 @@ class All(Transform):
 
     @override
     def transform(self, m: Any) -> bool:
-        return _all(query.eval(m) for query in self.queries)
+        return _all(query.interpret(m) for query in self.queries)
+
+    @override
+    def compile(self) -> Callable[[Any], Any]:
+        fns = [compile_query(query) for query in self.queries]
+        return lambda m: _all(fn(m) for fn in fns)
+
+    @override
+    def compile_vector(self) -> Callable[[Columns | Column], Column]:
+        fns = [vectorize_query(query) for query in self.queries]
+        def all_(x: Columns | Column) -> Column:
+            result = np.ones(len(x), dtype=bool)
+            # Like `all`, later queries only see the values every earlier query was true for.
+            pending = np.arange(len(x))
+            for fn in fns:
+                if len(pending) == 0:
+                    break
+                true = fn(x.take(pending)).truthy()
+                result[pending[~true]] = False
+                pending = pending[true]
+            return Column(array=result)
+        return all_
 
 @define
 class Filter(Transform):
@@ -219,20 +586,135 @@ class Filter(Transform):
 
     def transform(self, m: Any) -> Any:
         if isinstance(m, list):
-            return [val for val in m if bool(self.query.eval(val))]
+            return [val for val in m if bool(self.query.interpret(val))]
         elif isinstance(m, dict):
-            return {k: v for k, v in m.items() if bool(self.query.eval(v))}
+            return {k: v for k, v in m.items() if bool(self.query.interpret(v))}
         else:
             raise Exception(f"Can only filter on list or dict: {type(m)}")
 
+    def compile_lookup(self) -> Callable[[list], list | None] | None:
+        """
+        Returns a function that answers the filter on an indexed list from its indexes, or returns
+        None if the list doesn't have the indexes. None if the query can't be looked up, see
+        `tft.ql.index`.
+        """
+        plan = _index_lookup(self.query)
+        if plan is None:
+            return None
+        positions_of, residual = plan
+        rest = compile_query(residual) if residual is not None else None
+        def lookup(m: list) -> list | None:
+            indexes = INDEXES.get(m)
+            positions = positions_of(indexes) if indexes is not None else None
+            if positions is None:
+                return None
+            rows = [m[i] for i in positions.tolist()]
+            return rows if rest is None else [row for row in rows if rest(row)]
+        return lookup
+
+    @override
+    def compile_stream(self) -> Callable[[Iterator], Any] | None:
+        fn = compile_query(self.query)
+        return lambda it: (val for val in it if fn(val))
+
+    @override
+    def compile_source(self) -> Callable[[Any], Iterator] | None:
+        lookup = self.compile_lookup()
+        run_parallel = _compile_parallel(self.query, parallel.FILTER)
+        if lookup is None and run_parallel is None:
+            return None
+        # Indexed lists are looked up, and long ones filtered in workers, before streaming on.
+        # Anything else is filtered as usual.
+        fn = compile_query(self.query)
+        eager = self.compile()
+        def source(m: Any) -> Any:
+            if isinstance(m, list):
+                if lookup is not None and (rows := lookup(m)) is not None:
+                    return iter(rows)
+                if run_parallel is not None and (positions := run_parallel(m)) is not None:
+                    return (m[i] for i in positions)
+                return (val for val in m if fn(val))
+            return eager(m)
+        return source
+
+    @override
+    def compile(self) -> Callable[[Any], Any]:
+        fn = compile_query(self.query)
+        lookup = self.compile_lookup()
+        run_parallel = _compile_parallel(self.query, parallel.FILTER)
+        def filter(m: Any) -> Any:
+            if isinstance(m, list):
+                if lookup is not None and (rows := lookup(m)) is not None:
+                    return rows
+                if run_parallel is not None and (positions := run_parallel(m)) is not None:
+                    return [m[i] for i in positions]
+                return [val for val in m if fn(val)]
+            if isinstance(m, dict):
+                return {k: v for k, v in m.items() if fn(v)}
+            raise Exception(f"Can only filter on list or dict: {type(m)}")
+        return filter
+
+    @override
+    def compile_columns(self) -> Callable[[Columns], Any] | None:
+        vector = vectorize_query(self.query)
+        run_parallel = _compile_parallel(self.query, parallel.FILTER)
+        def scan(view: Columns) -> Columns:
+            if run_parallel is not None and (positions := run_parallel(view.rows, view.positions)) is not None:
+                return view.take(np.array(positions, dtype=np.intp))
+            return view.take(np.flatnonzero(vector(view).truthy()))
+        plan = _index_lookup(self.query)
+        if plan is None:
+            return scan
+        positions_of, residual = plan
+        rest = vectorize_query(residual) if residual is not None else None
+        def filter(view: Columns) -> Columns:
+            indexes = INDEXES.get(view.rows) if view.positions is None else None
+            positions = positions_of(indexes) if indexes is not None else None
+            if positions is None:
+                return scan(view)
+            view = view.take(positions)
+            return view if rest is None else view.take(np.flatnonzero(rest(view).truthy()))
+        return filter
+
     # def get_type(self) -> TransformType:
     #     return TransformType.MULTI
 
+@define
+class FilterKeys(Transform):
+    """Keeps the items of a dict whose key the query is true for. Made by the optimizer."""
+    query: Query = field()
+
+    def transform(self, m: Any) -> Any:
+        assert isinstance(m, dict), f"Can only filter keys of a dict: {type(m)}"
+        return {k: v for k, v in m.items() if bool(self.query.interpret(k))}
+
+    @override
+    def compile(self) -> Callable[[Any], Any]:
+        fn = compile_query(self.query)
+        def filter_keys(m: Any) -> Any:
+            assert isinstance(m, dict), f"Can only filter keys of a dict: {type(m)}"
+            return {k: v for k, v in m.items() if fn(k)}
+        return filter_keys
+
 @define
 class Length(Transform):
     def transform(self, m: Any) -> Any:
         return len(m)
 
+    @override
+    def compile_stream(self) -> Callable[[Iterator], Any] | None:
+        return lambda it: _sum(1 for _ in it)
+
+    @override
+    def compile_fold(self) -> tuple[Any, Callable[[Any, Any], Any], Callable[[Any], Any]] | None:
+        return 0, lambda count, row: count + 1, identity
+
+    starts_columns = False
+
+    @override
+    def compile_columns(self) -> Callable[[Columns], Any] | None:
+        return len
+
 @define
 class Contains(Transform):
     other: Any = field()
@@ -240,6 +722,11 @@ class Contains(Transform):
     def transform(self, m: Any) -> bool:
         return self.other in m
 
+    @override
+    def compile(self) -> Callable[[Any], Any]:
+        other = self.other
+        return lambda m: other in m
+
 @define
 class InSet(Transform):
     other: Any = field()
@@ -247,6 +734,11 @@ class InSet(Transform):
     def transform(self, m: Any) -> Any:
         return m in self.other
 
+    @override
+    def compile(self) -> Callable[[Any], Any]:
+        other = self.other
+        return lambda m: m in other
+
 @define
 class Select(Transform):
     fields: Iterable = field()
@@ -287,24 +779,68 @@ class Flatten(Transform):
         recurse(m, 0)
         return output
 
+    def _flatten(self, it: Iterator) -> Iterator:
+        layers = self.layers
+        def recurse(v: Any, level: int) -> Iterator:
+            if level > layers or not isinstance(v, list):
+                yield v
+                return
+            for i in v:
+                yield from recurse(i, level + 1)
+        if layers < 0:
+            # The list itself is the only element.
+            yield list(it)
+            return
+        for v in it:
+            yield from recurse(v, 1)
+
+    @override
+    def compile_stream(self) -> Callable[[Iterator], Any] | None:
+        return self._flatten
+
+    @override
+    def compile_source(self) -> Callable[[Any], Iterator] | None:
+        def source(m: Any) -> Iterator:
+            assert isinstance(m, list), "Can only flatten a list"
+            return self._flatten(iter(m))
+        return source
+
 @define
 class Unique(Transform):
     def transform(self, m: Any) -> list[Any]:
         assert isinstance(m, list), f"Can only use unique on lists: {type(m)}"
         return list(set(m))
 
+    @override
+    def compile_stream(self) -> Callable[[Iterator], Any] | None:
+        return lambda it: list(set(it))
+
 @define
 class Keys(Transform):
     def transform(self, m: Any) -> list[Any]:
         assert isinstance(m, dict), f"Can only use keys on dicts: {type(m)}"
         return list(m.keys())
 
+    @override
+    def compile_source(self) -> Callable[[Any], Iterator] | None:
+        def source(m: Any) -> Iterator:
+            assert isinstance(m, dict), f"Can only use keys on dicts: {type(m)}"
+            return iter(m.keys())
+        return source
+
 @define
 class Values(Transform):
     def transform(self, m: Any) -> list[Any]:
         assert isinstance(m, dict), f"Can only use values on dicts: {type(m)}"
         return list(m.values())
 
+    @override
+    def compile_source(self) -> Callable[[Any], Iterator] | None:
+        def source(m: Any) -> Iterator:
+            assert isinstance(m, dict), f"Can only use values on dicts: {type(m)}"
+            return iter(m.values())
+        return source
+
 @define
 class Only(Transform):
     def transform(self, m: Any) -> Any:
@@ -321,7 +857,405 @@ class SortBy(Transform):
 
     def transform(self, m: Any) -> Any:
         assert isinstance(m, list), f"Can only sort lists {type(m)}"
-        return sorted(m, key=lambda x: self.query.eval(x), reverse=self.reverse)
+        return sorted(m, key=lambda x: self.query.interpret(x), reverse=self.reverse)
+
+    @override
+    def compile(self) -> Callable[[Any], Any]:
+        fn = compile_query(self.query)
+        reverse = self.reverse
+        def sort_by(m: Any) -> Any:
+            assert isinstance(m, list), f"Can only sort lists {type(m)}"
+            return sorted(m, key=fn, reverse=reverse)
+        return sort_by
+
+    @override
+    def compile_stream(self) -> Callable[[Iterator], Any] | None:
+        fn = compile_query(self.query)
+        reverse = self.reverse
+        return lambda it: sorted(it, key=fn, reverse=reverse)
+
+    @override
+    def compile_columns(self) -> Callable[[Columns], Any] | None:
+        vector = vectorize_query(self.query)
+        reverse = self.reverse
+        return lambda view: view.take(vector(view).order(reverse))
+
+@define
+class TopBy(Transform):
+    """
+    The first `num` of a list sorted by `query`, found with a heap instead of sorting the whole list.
+    Same result as `sort_by(query, reverse).top(num)`, ties included.
+    """
+    query: Query = field()
+    num: int = field(default=1)
+    reverse: bool = field(default=False)
+
+    def _top(self, it: Iterable, key: Callable[[Any], Any]) -> list:
+        # Both are stable, and nlargest keeps ties in the same order as a reversed sort.
+        if self.reverse:
+            return heapq.nlargest(self.num, it, key=key)
+        return heapq.nsmallest(self.num, it, key=key)
+
+    def transform(self, m: Any) -> Any:
+        assert isinstance(m, list), f"Can only sort lists {type(m)}"
+        return self._top(m, lambda x: self.query.interpret(x))
+
+    @override
+    def compile(self) -> Callable[[Any], Any]:
+        fn = compile_query(self.query)
+        def top_by(m: Any) -> Any:
+            assert isinstance(m, list), f"Can only sort lists {type(m)}"
+            return self._top(m, fn)
+        return top_by
+
+    @override
+    def compile_stream(self) -> Callable[[Iterator], Any] | None:
+        fn = compile_query(self.query)
+        return lambda it: self._top(it, fn)
+
+    @override
+    def compile_columns(self) -> Callable[[Columns], Any] | None:
+        vector = vectorize_query(self.query)
+        num = self.num
+        reverse = self.reverse
+        # A stable sort of the keys gives the same ties as the heap.
+        return lambda view: view.take(vector(view).order(reverse)[:num])
+
+@define
+class Sum(Transform):
+    """The sum of `query` over the rows of a list. An aggregate, see `Agg`."""
+    query: Query = field()
+
+    def transform(self, m: Any) -> Any:
+        return _sum(self.query.interpret(row) for row in m)
+
+    @override
+    def compile(self) -> Callable[[Any], Any]:
+        fn = compile_query(self.query)
+        return lambda m: _sum(fn(row) for row in m)
+
+    @override
+    def compile_stream(self) -> Callable[[Iterator], Any] | None:
+        return self.compile()
+
+    @override
+    def compile_fold(self) -> tuple[Any, Callable[[Any, Any], Any], Callable[[Any], Any]] | None:
+        fn = compile_query(self.query)
+        return 0, lambda total, row: total + fn(row), identity
+
+@define
+class Mean(Transform):
+    """
+    The average of `query` over the rows of a list, weighted by `weight` if given. 0 if there are no
+    rows or the weights add up to 0. An aggregate, see `Agg`.
+    """
+    query: Query = field()
+    weight: Query | None = field(default=None)
+
+    def transform(self, m: Any) -> Any:
+        if self.weight is None:
+            values = [self.query.interpret(row) for row in m]
+            return _sum(values) / len(values) if len(values) > 0 else 0
+        pairs = [(self.query.interpret(row), self.weight.interpret(row)) for row in m]
+        weights = _sum(weight for _, weight in pairs)
+        return _sum(value * weight for value, weight in pairs) / weights if weights != 0 else 0
+
+    @override
+    def compile(self) -> Callable[[Any], Any]:
+        start, step, finish = self.compile_fold()
+        def mean(m: Any) -> Any:
+            acc = start
+            for row in m:
+                acc = step(acc, row)
+            return finish(acc)
+        return mean
+
+    @override
+    def compile_stream(self) -> Callable[[Iterator], Any] | None:
+        return self.compile()
+
+    @override
+    def compile_fold(self) -> tuple[Any, Callable[[Any, Any], Any], Callable[[Any], Any]] | None:
+        fn = compile_query(self.query)
+        if self.weight is None:
+            step = lambda acc, row: (acc[0] + fn(row), acc[1] + 1)
+        else:
+            weight_fn = compile_query(self.weight)
+            def step(acc: tuple, row: Any) -> tuple:
+                weight = weight_fn(row)
+                return (acc[0] + fn(row) * weight, acc[1] + weight)
+        return (0, 0), step, lambda acc: acc[0] / acc[1] if acc[1] != 0 else 0
+
+def _compile_folds(aggregates: dict[Any, Query]) -> tuple[list, Callable[[list, Any], None], Callable[[list], dict]] | None:
+    """
+    Compiles aggregates that are each a single aggregate transform, see `Transform.compile_fold`,
+    into the starting values of all of them, a function that adds a row to a list of those and a
+    function that turns the list into a dict of the aggregates. None if any of them isn't.
+    """
+    folds = []
+    for name, query in aggregates.items():
+        if not isinstance(query, BaseQuery) or not (query.empty() or query.m is None) or len(query.transforms) != 1:
+            return None
+        fold = query.transforms[0].compile_fold()
+        if fold is None:
+            return None
+        folds.append((name, *fold))
+    names = [name for name, _, _, _ in folds]
+    steps = list(enumerate(step for _, _, step, _ in folds))
+    finishes = [finish for _, _, _, finish in folds]
+    def add(accs: list, row: Any) -> None:
+        for i, step in steps:
+            accs[i] = step(accs[i], row)
+    def finish(accs: list) -> dict:
+        return {name: finish(acc) for name, finish, acc in zip(names, finishes, accs)}
+    return [start for _, start, _, _ in folds], add, finish
+
+@define
+class Agg(Transform):
+    """
+    Computes named aggregates, like `sum` and `mean`, of a list of rows, or of every list in a dict
+    of them like the groups `group_by` makes. Aggregates made by `count`, `sum` and `mean` are all
+    computed in one pass, any other query is run on the whole list.
+    """
+    aggregates: dict[Any, Query] = field()
+
+    def transform(self, m: Any) -> Any:
+        if isinstance(m, list):
+            return {name: query.interpret(m) for name, query in self.aggregates.items()}
+        if isinstance(m, dict):
+            return {key: {name: query.interpret(rows) for name, query in self.aggregates.items()} for key, rows in m.items()}
+        raise Exception(f"Can only aggregate a list or dict of lists: {type(m)}")
+
+    def _compile_rows(self) -> Callable[[Iterable], dict]:
+        folds = _compile_folds(self.aggregates)
+        if folds is not None:
+            starts, add, finish = folds
+            def fold(rows: Iterable) -> dict:
+                accs = list(starts)
+                for row in rows:
+                    add(accs, row)
+                return finish(accs)
+            return fold
+        fns = [(name, compile_query(query)) for name, query in self.aggregates.items()]
+        def aggregate(rows: Iterable) -> dict:
+            rows = rows if isinstance(rows, list) else list(rows)
+            return {name: fn(rows) for name, fn in fns}
+        return aggregate
+
+    @override
+    def compile(self) -> Callable[[Any], Any]:
+        aggregate = self._compile_rows()
+        def agg(m: Any) -> Any:
+            if isinstance(m, list):
+                return aggregate(m)
+            if isinstance(m, dict):
+                return {key: aggregate(rows) for key, rows in m.items()}
+            raise Exception(f"Can only aggregate a list or dict of lists: {type(m)}")
+        return agg
+
+    @override
+    def compile_stream(self) -> Callable[[Iterator], Any] | None:
+        return self._compile_rows()
+
+@define
+class GroupBy(Transform):
+    """
+    Groups the rows of a list by `query` into a dict of lists, in the order each key is first seen.
+    With `aggregates`, each group is aggregated like `Agg` instead, which the optimizer does for a
+    `group_by` followed by an `agg`. Aggregates made by `count`, `sum` and `mean` are then computed
+    as the rows are grouped, without keeping them.
+    """
+    query: Query = field()
+    aggregates: dict[Any, Query] | None = field(default=None)
+
+    def transform(self, m: Any) -> Any:
+        assert isinstance(m, list), f"Can only group lists: {type(m)}"
+        groups: dict[Any, list] = {}
+        for row in m:
+            groups.setdefault(self.query.interpret(row), []).append(row)
+        return groups if self.aggregates is None else Agg(self.aggregates).transform(groups)
+
+    def _compile_rows(self) -> Callable[[Iterable], dict]:
+        key_fn = compile_query(self.query)
+        def group(rows: Iterable) -> dict:
+            groups: dict[Any, list] = {}
+            for row in rows:
+                key = key_fn(row)
+                rows_of_key = groups.get(key)
+                if rows_of_key is None:
+                    groups[key] = [row]
+                else:
+                    rows_of_key.append(row)
+            return groups
+        if self.aggregates is None:
+            return group
+        folds = _compile_folds(self.aggregates)
+        if folds is None:
+            aggregate = Agg(self.aggregates).compile()
+            return lambda rows: aggregate(group(rows))
+        starts, add, finish = folds
+        def group_fold(rows: Iterable) -> dict:
+            accs_of_key: dict[Any, list] = {}
+            for row in rows:
+                key = key_fn(row)
+                accs = accs_of_key.get(key)
+                if accs is None:
+                    accs = accs_of_key[key] = list(starts)
+                add(accs, row)
+            return {key: finish(accs) for key, accs in accs_of_key.items()}
+        return group_fold
+
+    @override
+    def compile(self) -> Callable[[Any], Any]:
+        rows_fn = self._compile_rows()
+        def group_by(m: Any) -> Any:
+            assert isinstance(m, list), f"Can only group lists: {type(m)}"
+            return rows_fn(m)
+        return group_by
+
+    @override
+    def compile_stream(self) -> Callable[[Iterator], Any] | None:
+        return self._compile_rows()
+
+@define
+class Share(Transform):
+    """
+    Adds `to_field` to every record in a list, or every value of a dict, with its share of the
+    total of `query` over all of them. 0 if the total is 0.
+    """
+    query: Query = field()
+    to_field: str = field()
+
+    def _share(self, m: Any, values: list) -> Any:
+        total = _sum(values)
+        to_field = self.to_field
+        if isinstance(m, dict):
+            return {key: with_field(row, to_field, value / total if total != 0 else 0) for (key, row), value in zip(m.items(), values)}
+        return [with_field(row, to_field, value / total if total != 0 else 0) for row, value in zip(m, values)]
+
+    def transform(self, m: Any) -> Any:
+        assert isinstance(m, (list, dict)), f"Can only share over a list or dict: {type(m)}"
+        rows = m.values() if isinstance(m, dict) else m
+        assert _all(isinstance(row, dict) for row in rows), "Can only share over records"
+        return self._share(m, [self.query.interpret(row) for row in rows])
+
+    @override
+    def compile(self) -> Callable[[Any], Any]:
+        fn = compile_query(self.query)
+        def share(m: Any) -> Any:
+            assert isinstance(m, (list, dict)), f"Can only share over a list or dict: {type(m)}"
+            rows = m.values() if isinstance(m, dict) else m
+            assert _all(isinstance(row, dict) for row in rows), "Can only share over records"
+            return self._share(m, [fn(row) for row in rows])
+        return share
+
+@define
+class Join(Transform):
+    """
+    Joins every row of a list to the rows of `other`, a query on its own dataset, whose `right_key`
+    matches the row's `left_key`. A key that is a list, like the `units` of a comp, matches on each
+    of its values. Every match gives a row: the left record with the right record's fields added,
+    or the right record itself if the left row isn't a record, like a list of names. Matches come in
+    the order of the left key's values, then of the right rows. Left rows that match nothing are
+    dropped, or kept as they are with `how='left'`.
+
+    The right rows are hashed once per version of the data: `other` is memoized like `eval_cached`
+    and its hash table is kept with the indexes of `tft.ql.index`, both dropped when the data is
+    refreshed. If `other` or `right_key` can't be fingerprinted, the rows are hashed on every call.
+    """
+    other: Query = field()
+    left_key: Query = field()
+    right_key: Query = field()
+    how: str = field(default='inner')
+
+    def __attrs_post_init__(self):
+        assert self.how in JOIN_HOWS, f"Join must be one of {JOIN_HOWS}: {self.how}"
+
+    def _merge(self, row: Any, right: Any) -> Any:
+        return with_fields(row, right) if isinstance(row, dict) and isinstance(right, dict) else right
+
+    def transform(self, m: Any) -> Any:
+        assert isinstance(m, list), f"Can only join a list: {type(m)}"
+        rows = self.other.interpret(None)
+        assert isinstance(rows, list), f"Can only join to a list: {type(rows)}"
+        table: dict[Any, list[int]] = {}
+        for i, right in enumerate(rows):
+            key = self.right_key.interpret(right)
+            for value in (set(key) if isinstance(key, MULTI_VALUED) else (key,)):
+                table.setdefault(value, []).append(i)
+        output = []
+        for row in m:
+            key = self.left_key.interpret(row)
+            positions = [i for value in (key if isinstance(key, MULTI_VALUED) else (key,)) for i in table.get(value, [])]
+            if len(positions) == 0 and self.how == 'left':
+                output.append(row)
+            output.extend(self._merge(row, rows[i]) for i in positions)
+        return output
+
+    def _table_key(self) -> Any:
+        """What the hash table is kept under with the indexes on `other`, None if it can't be kept."""
+        key = self.right_key
+        if not isinstance(key, BaseQuery) or not (key.empty() or key.m is None):
+            return None
+        if len(key.transforms) == 1 and isinstance(key.transforms[0], Index):
+            # The same table as `indexed` builds for the path.
+            return '.'.join(key.transforms[0].path)
+        return key.fingerprint()
+
+    def _compile_table(self) -> Callable[[], tuple[list, HashIndex]]:
+        """Compiles a function that gives the right rows and their hash table."""
+        other = self.other
+        get = compile_query(self.right_key)
+        key = self._table_key()
+        memoized = key is not None and isinstance(other, BaseQuery) and other.fingerprint() is not None
+        other_fn = compile_query(other)
+        def table() -> tuple[list, HashIndex]:
+            rows = other.eval_cached() if memoized else other_fn(None)
+            assert isinstance(rows, list), f"Can only join to a list: {type(rows)}"
+            indexes = INDEXES.get(rows) if memoized else None
+            if memoized and (indexes is None or key not in indexes):
+                INDEXES.declare(rows, {key: get})
+                indexes = INDEXES.get(rows)
+            if indexes is not None and key in indexes:
+                index = indexes[key]
+            else:
+                # Not memoized, or the data was refreshed while hashing, so only for this call.
+                index = HashIndex.build(rows, get)
+            if index is None:
+                raise Exception("Can't hash the rows to join to by their key, a row doesn't have it or it isn't hashable.")
+            return rows, index
+        return table
+
+    def _compile_rows(self) -> Callable[[Iterable], Iterator]:
+        table = self._compile_table()
+        left_fn = compile_query(self.left_key)
+        merge = self._merge
+        keep = self.how == 'left'
+        def join(m: Iterable) -> Iterator:
+            rows, index = table()
+            for row in m:
+                key = left_fn(row)
+                if isinstance(key, MULTI_VALUED):
+                    positions = [i for value in key for i in index.lookup(value).tolist()]
+                else:
+                    positions = index.lookup(key).tolist()
+                if len(positions) == 0 and keep:
+                    yield row
+                for i in positions:
+                    yield merge(row, rows[i])
+        return join
+
+    @override
+    def compile(self) -> Callable[[Any], Any]:
+        rows_fn = self._compile_rows()
+        def join(m: Any) -> Any:
+            assert isinstance(m, list), f"Can only join a list: {type(m)}"
+            return list(rows_fn(m))
+        return join
+
+    @override
+    def compile_stream(self) -> Callable[[Iterator], Any] | None:
+        return self._compile_rows()
 
 @define
 class Unary(Transform):
@@ -330,6 +1264,10 @@ class Unary(Transform):
     def transform(self, m: Any) -> Any:
         return self.op(m)
 
+    @override
+    def compile(self) -> Callable[[Any], Any]:
+        return self.op
+
 @define
 class Result:
     value: Any | None = field(default=None)
@@ -368,10 +1306,498 @@ class Result:
 class EmptyDataset:
     pass
 
+# Marks a cached value that hasn't been computed yet.
+_UNSET = object()
+
+class _Stream:
+    """A list that is being produced lazily, passed between the steps of a compiled query."""
+    __slots__ = ['it']
+
+    def __init__(self, it: Iterator):
+        self.it = it
+
+def _calls_python(query: Query) -> bool | None:
+    """
+    Whether a query calls a Python function through `unary`, on its own or in a query nested in it.
+    None if it, or a query nested in it, holds its own data, which would be copied to every task.
+    """
+    if not isinstance(query, BaseQuery) or not (query.empty() or query.m is None):
+        return None
+    calls = False
+    for transform in query.transforms:
+        # Builtins like `sum` are too cheap to be worth sending to workers.
+        calls = calls or (isinstance(transform, Unary) and not isinstance(transform.op, BuiltinFunctionType))
+        for _, sub_query in _label(transform)[1]:
+            sub_calls = _calls_python(sub_query)
+            if sub_calls is None:
+                return None
+            calls = calls or sub_calls
+    return calls
+
+def _compile_parallel(query: Query, kind: str) -> Callable[..., list | None] | None:
+    """
+    Returns a function that runs a nested query over a long list in worker processes, see
+    `tft.ql.parallel`, or returns None for the caller to run it. None if the query isn't worth
+    running in workers or can't be pickled, and while profiling or checking a budget, which only
+    see this process.
+    """
+    if not parallel.enabled() or profiling.current() is not None or budget.checking() or not _calls_python(query):
+        return None
+    try:
+        payload = pickle.dumps(query, protocol=pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        # Like a lambda, or a function defined in another function.
+        return None
+    return lambda rows, positions=None: parallel.run(rows, payload, kind, positions)
+
+def _read_paths(transforms: list[Transform], prefix: list[str]) -> list[list[str]]:
+    """
+    The paths of a document, under `prefix`, whose values the transforms read, as far as leading
+    indexes and the maps and subs of indexes that follow them show. Values past them are read whole.
+    """
+    path = list(prefix)
+    for transform in transforms:
+        if isinstance(transform, Index):
+            # List positions are kept as every element, so positions don't shift.
+            path.extend('*' if _to_index(part) is not None else part for part in transform.path)
+        elif isinstance(transform, Noop):
+            continue
+        elif isinstance(transform, Map) and transform.key_query is None and _reads_rows(transform.query):
+            # What comes after the map only reads what the map made.
+            return _read_paths(transform.query.transforms, path + ['*'])
+        elif isinstance(transform, SubQuery) and _all(_reads_rows(query) for query in transform.query_map.values()):
+            return [sub_path for query in transform.query_map.values() for sub_path in _read_paths(query.transforms, path)]
+        else:
+            break
+    return [path]
+
+def _reads_rows(query: Query) -> bool:
+    return isinstance(query, BaseQuery) and (query.empty() or query.m is None)
+
+def json_projection(transforms: list[Transform]) -> Projection:
+    """The parts of a `JsonSource` a query on it decodes, see `tft.ql.source`."""
+    paths = _read_paths(transforms, [])
+    if _any(len(path) == 0 for path in paths):
+        return True
+    return projection(['.'.join(path) for path in paths])
+
+def _resolve(m: Any, transforms: list[Transform]) -> Any:
+    """
+    Decodes a JSON source as far as the transforms read it, and reads a view as it is now. Anything
+    else is returned as it is.
+    """
+    if type(m) is JsonSource:
+        return m.extract(json_projection(transforms))
+    if type(m) is ViewSource:
+        return m.read()[0]
+    return m
+
+def _reads_view(fingerprint: Any) -> bool:
+    """Whether a fingerprint has a view in it, see `tft.ql.views.ViewSource.fingerprint`."""
+    return fingerprint is ViewSource or isinstance(fingerprint, (tuple, frozenset)) and _any(_reads_view(part) for part in fingerprint)
+
+def _row_fields(query: Query) -> set[str] | None:
+    """The fields of a row a predicate reads, or None if it could read anything."""
+    if not isinstance(query, BaseQuery) or not (query.empty() or query.m is None) or len(query.transforms) == 0:
+        return None
+    first = query.transforms[0]
+    if isinstance(first, Index):
+        return {first.path[0]}
+    if isinstance(first, (All, _Any)):
+        fields = set()
+        for sub_query in first.queries:
+            sub_fields = _row_fields(sub_query)
+            if sub_fields is None:
+                return None
+            fields |= sub_fields
+        return fields
+    return None
+
+def _read_from(query: 'BaseQuery', paths: dict[str, list[str]]) -> 'BaseQuery':
+    """Rewrites a predicate `_row_fields` understood so it reads each field from the given path instead."""
+    first = query.transforms[0]
+    if isinstance(first, Index):
+        first = Index('.'.join(paths[first.path[0]] + first.path[1:]))
+    else:
+        first = evolve(first, queries=[_read_from(sub_query, paths) for sub_query in first.queries])
+    return evolve(query, transforms=[first] + query.transforms[1:])
+
+def _on_field(query: 'BaseQuery', field: str) -> 'BaseQuery':
+    """Rewrites a predicate that `_row_fields` found only reads `field` so it runs on that field."""
+    first = query.transforms[0]
+    if isinstance(first, Index):
+        assert first.path[0] == field
+        return evolve(query, transforms=([Index('.'.join(first.path[1:]))] if len(first.path) > 1 else []) + query.transforms[1:])
+    return evolve(query, transforms=[evolve(first, queries=[_on_field(sub_query, field) for sub_query in first.queries])] + query.transforms[1:])
+
+def _index_paths(sub_query: SubQuery) -> dict[str, list[str]]:
+    """The fields of a sub query that are just a field of its input, with the path they come from."""
+    paths = {}
+    for key, query in sub_query.query_map.items():
+        if isinstance(key, str) and isinstance(query, BaseQuery) and (query.empty() or query.m is None) \
+                and len(query.transforms) == 1 and isinstance(query.transforms[0], Index):
+            paths[key] = query.transforms[0].path
+    return paths
+
+def _map_sources(transform: Map) -> Callable[[str], list[str] | None] | None:
+    """
+    For a map that builds or extends each row, returns where each field of the output comes from in
+    the input, or None for fields it computes. None if the map doesn't work row by row.
+    """
+    query = transform.query
+    if transform.key_query is not None or not isinstance(query, BaseQuery) or not (query.empty() or query.m is None) or len(query.transforms) != 1:
+        return None
+    inner = query.transforms[0]
+    if isinstance(inner, SubQuery):
+        return _index_paths(inner).get
+    if isinstance(inner, Extend):
+        paths = _index_paths(inner.sub_query)
+        computed = set(inner.sub_query.query_map.keys())
+        return lambda key: paths.get(key) if key in computed else [key]
+    return None
+
+def _index_leaf(query: 'BaseQuery') -> Callable[[dict[str, HashIndex | None]], np.ndarray | None] | None:
+    """Plans `idx(path)` followed by `eq`, `in_set` or `contains` as a lookup, see `_index_lookup`."""
+    transforms = [transform for transform in query.transforms if not isinstance(transform, Noop)]
+    if len(transforms) != 2 or not isinstance(transforms[0], Index):
+        return None
+    path, op = '.'.join(transforms[0].path), transforms[1]
+    if isinstance(op, Equal):
+        fn = lambda index: index.lookup(op.other) if not index.multi else None
+    elif isinstance(op, InSet) and not isinstance(op.other, (str, bytes)):
+        fn = lambda index: index.lookup_any(op.other) if not index.multi else None
+    elif isinstance(op, Contains):
+        fn = lambda index: index.lookup(op.other) if index.multi else None
+    else:
+        return None
+    def lookup(indexes: dict[str, HashIndex | None]) -> np.ndarray | None:
+        index = indexes.get(path)
+        if index is None:
+            return None
+        try:
+            return fn(index)
+        except TypeError:
+            # Unhashable values are compared by scanning.
+            return None
+    return lookup
+
+def _index_lookup(query: Query) -> tuple[Callable[[dict[str, HashIndex | None]], np.ndarray | None], Query | None] | None:
+    """
+    Plans a filter's query as hash index lookups, see `tft.ql.index`. Returns a function from the
+    indexes of a list to the sorted positions of the rows the lookups keep, or None if an index is
+    missing, along with the rest of the query to run on those rows, or None if there is no rest.
+    None if no part of the query can be looked up.
+    """
+    if not isinstance(query, BaseQuery) or not (query.empty() or query.m is None):
+        return None
+    transforms = [transform for transform in query.transforms if not isinstance(transform, Noop)]
+    if len(transforms) != 1 or not isinstance(transforms[0], (All, _Any)):
+        leaf = _index_leaf(query)
+        return (leaf, None) if leaf is not None else None
+    queries = list(transforms[0].queries)
+    plans = [_index_lookup(sub_query) for sub_query in queries]
+    if isinstance(transforms[0], _Any):
+        # Every part has to be looked up in full for the union to be right.
+        if len(plans) == 0 or not _all(plan is not None and plan[1] is None for plan in plans):
+            return None
+        lookups = [plan[0] for plan in plans]
+        def lookup_any(indexes: dict[str, HashIndex | None]) -> np.ndarray | None:
+            postings = [lookup(indexes) for lookup in lookups]
+            return None if _any(positions is None for positions in postings) else union(postings)
+        return lookup_any, None
+    lookups = [plan[0] for plan in plans if plan is not None]
+    if len(lookups) == 0:
+        return None
+    rest = [plan[1] if plan is not None else sub_query for sub_query, plan in zip(queries, plans) if plan is None or plan[1] is not None]
+    def lookup_all(indexes: dict[str, HashIndex | None]) -> np.ndarray | None:
+        postings = [lookup(indexes) for lookup in lookups]
+        return None if _any(positions is None for positions in postings) else intersect(postings)
+    residual = None if len(rest) == 0 else rest[0] if len(rest) == 1 else all(rest)
+    return lookup_all, residual
+
+def _push_filter(below: Transform, filter: Filter | FilterKeys) -> list[Transform] | None:
+    """Moves a filter before the transform it follows, if it gives the same rows."""
+    if isinstance(filter, FilterKeys):
+        # Maps keep the keys of a dict.
+        if isinstance(below, Map) and below.key_query is None:
+            return [filter, below]
+        return None
+    if isinstance(below, SortBy):
+        # Sorts are stable, so filtering first keeps the same order.
+        return [filter, below]
+    fields = _row_fields(filter.query)
+    if fields is None:
+        return None
+    if isinstance(below, Map):
+        sources = _map_sources(below)
+        if sources is None:
+            return None
+        paths = {field: sources(field) for field in fields}
+        if _any(path is None for path in paths.values()):
+            return None
+        return [Filter(_read_from(filter.query, paths)), below]
+    if isinstance(below, Explode) and below.to_field not in fields:
+        where = filter.query if below.where is None else all([below.where, filter.query])
+        return [evolve(below, where=where)]
+    if isinstance(below, Explode) and fields == {below.to_field}:
+        # Only reads the key each item came from, so whole groups can be dropped before exploding.
+        return [FilterKeys(_on_field(filter.query, below.to_field)), below]
+    return None
+
+def _combine(first: Transform, second: Transform) -> list[Transform] | None:
+    """Merges two transforms in a row into one, if they can be."""
+    if isinstance(first, Filter) and isinstance(second, Filter):
+        # `all` stops at the first false query, like the second filter never seeing those rows.
+        return [Filter(all([first.query, second.query]))]
+    if isinstance(first, Map) and isinstance(second, Map) and second.key_query is None \
+            and isinstance(first.query, BaseQuery) and isinstance(second.query, BaseQuery) \
+            and (first.query.empty() or first.query.m is None) and (second.query.empty() or second.query.m is None):
+        return [evolve(first, query=evolve(first.query, transforms=first.query.transforms + second.query.transforms))]
+    if isinstance(first, SortBy) and isinstance(second, Top) and not second.reverse and second.num >= 0:
+        return [TopBy(first.query, second.num, first.reverse)]
+    if isinstance(first, GroupBy) and first.aggregates is None and isinstance(second, Agg):
+        return [GroupBy(first.query, second.aggregates)]
+    return None
+
+def _rewrite(transforms: list[Transform], rule: Callable[[Any, Any], list[Transform] | None]) -> list[Transform]:
+    """Applies a rule to pairs of transforms in a row until it no longer applies."""
+    transforms = list(transforms)
+    i = 0
+    while i + 1 < len(transforms):
+        rewritten = rule(transforms[i], transforms[i + 1])
+        if rewritten is None:
+            i += 1
+            continue
+        transforms[i:i + 2] = rewritten
+        # The rewritten transforms may now combine with the one before them.
+        i = max(i - 1, 0)
+    return transforms
+
+def optimize(transforms: list[Transform]) -> list[Transform]:
+    """
+    Rewrites transforms into ones that give the same result with less work:
+    - Noops are dropped.
+    - Filters are moved before sorts, and before maps and explodes when they only read fields those
+      pass through unchanged. Filters before an explode become its `where`, or a `FilterKeys` of the
+      groups if they only read the field the explode adds.
+    - Filters in a row are merged, as are maps in a row.
+    - A `sort_by` followed by a `top` of the first n becomes a `TopBy`.
+    - A `group_by` followed by an `agg` aggregates the groups as it makes them.
+    """
+    transforms = [transform for transform in transforms if not isinstance(transform, Noop)]
+    transforms = _rewrite(transforms, lambda below, above: _push_filter(below, above) if isinstance(above, (Filter, FilterKeys)) else None)
+    return _rewrite(transforms, _combine)
+
+def _describe(value: Any) -> str:
+    if callable(value) and hasattr(value, '__qualname__'):
+        return value.__qualname__
+    text = repr(value)
+    return text if len(text) <= 60 else text[:57] + '...'
+
+def _label(transform: Transform) -> tuple[str, list[tuple[str, Query]]]:
+    """A transform's name with its arguments, and the queries it holds with what they are for."""
+    args = []
+    nested: list[tuple[str, Query]] = []
+    for attr in fields(type(transform)):
+        value = getattr(transform, attr.name)
+        if isinstance(value, Query):
+            nested.append((attr.name, value))
+        elif isinstance(value, SubQuery):
+            nested.extend((f"{attr.name}.{key}", sub_query) for key, sub_query in value.query_map.items())
+        elif isinstance(value, dict) and len(value) > 0 and _all(isinstance(sub_query, Query) for sub_query in value.values()):
+            nested.extend((str(key), sub_query) for key, sub_query in value.items())
+        elif isinstance(value, (list, tuple)) and len(value) > 0 and _all(isinstance(sub_query, Query) for sub_query in value):
+            nested.extend((f"{attr.name}[{i}]", sub_query) for i, sub_query in enumerate(value))
+        elif value is not None:
+            args.append(f"{attr.name}={_describe(value)}")
+    return type(transform).__name__ + (f"({', '.join(args)})" if args else ''), nested
+
+def _query_label(query: 'BaseQuery') -> str:
+    """The transforms of a query with their arguments, for profiles."""
+    names = [_label(transform)[0] for transform in query.transforms]
+    if not (query.empty() or query.m is None):
+        names.insert(0, f"Dataset({type(query.m).__name__})")
+    return 'Query(' + ' > '.join(names) + ')'
+
+def _plan_lines(query: Query, depth: int) -> list[str]:
+    """The optimized transforms of a query, one per line, with the queries they hold nested under them."""
+    indent = '  ' * depth
+    if not isinstance(query, BaseQuery):
+        return [f"{indent}{type(query).__name__}"]
+    lines = [] if query.empty() or query.m is None else [f"{indent}Dataset({type(query.m).__name__})"]
+    for transform in optimize(query.transforms):
+        label, nested = _label(transform)
+        lines.append(f"{indent}{label}")
+        for name, sub_query in nested:
+            lines.append(f"{indent}  {name}:")
+            lines.extend(_plan_lines(sub_query, depth + 2))
+    return lines
+
+def _lazy(m: Any, lazy: bool) -> Any:
+    """Wraps an iterator a step returned, keeping it lazy if the next step can take it that way."""
+    if isinstance(m, Iterator):
+        return _Stream(m) if lazy else list(m)
+    return m
+
+def _run_columns(columnar: Callable[[Columns], Any], eager: Callable[[Any], Any], m: list | Columns) -> Any:
+    view = m if type(m) is Columns else Columns(m)
+    try:
+        return columnar(view)
+    except MissingField:
+        # Rows without a field a sub query reads, which the row by row path reports with the path.
+        return eager(view.to_rows())
+
+def _profile_step(transform: Transform, profile: Profile, position: int) -> tuple:
+    """Compiles a transform for `_compile_steps` with its functions timed, and no streaming."""
+    label, nested = _label(transform)
+    # Keeps transforms that look the same apart, like two sorts in a row.
+    step = profile.child(label if _all(child.name != label for child in profile.children[:position]) else f"{label} #{position + 1}")
+    with profiling.nested(step, {id(sub_query): name for name, sub_query in nested}):
+        eager, columnar = transform.compile(), transform.compile_columns()
+    return (profiling.timed(step, eager), None, None, profiling.timed(step, columnar) if columnar is not None else None, transform.starts_columns)
+
+def _checked_step(eager: Callable, stream: Callable | None, source: Callable | None, columnar: Callable | None, starts: bool) -> tuple:
+    """Wraps the functions of a compiled transform to check the time budget, see `tft.ql.budget`."""
+    return (budget.checked_stream(eager), budget.checked_stream(stream) if stream is not None else None,
+            budget.checked_stream(source) if source is not None else None, budget.checked(columnar) if columnar is not None else None, starts)
+
+def _compile_steps(transforms: list[Transform], keep_columns: bool = False, profile: Profile | None = None, checked: bool = False) -> Callable[[Any], Any]:
+    """
+    Chains compiled transforms into one function. Where a transform outputs a list that the next
+    transform can take as an iterator, the list is produced lazily instead, so no intermediate
+    list is built and a `top` can stop the upstream transforms early. Lists are materialized at
+    sinks like `sort_by` and at the end. The transforms are optimized first, see `optimize`.
+
+    Long lists of records reaching a transform that can run on columns are viewed as `Columns`
+    until a transform that can't, or the end, where the rows are picked back out unless
+    `keep_columns`.
+
+    With a `profile`, each transform is timed under it, see `tft.ql.profiling`. If `checked`, each
+    transform and each row streamed between them checks the time budget, see `tft.ql.budget`.
+    """
+    fused = optimize(transforms)
+    if profile is not None:
+        steps = [_profile_step(transform, profile, i) for i, transform in enumerate(fused)]
+    else:
+        # Lists streamed into a `top`, directly or through maps and filters, are left for it to
+        # stop early rather than run in workers, which would do every row, see `tft.ql.parallel`.
+        feeds_top = [False] * len(fused)
+        for i in range(len(fused) - 2, -1, -1):
+            after = fused[i + 1]
+            feeds_top[i] = isinstance(after, Top) or (isinstance(after, (Map, Filter)) and feeds_top[i + 1])
+        steps = []
+        for transform, serial in zip(fused, feeds_top):
+            with parallel.serial() if serial else nullcontext():
+                steps.append((transform.compile(), transform.compile_stream(), transform.compile_source(), transform.compile_columns(), transform.starts_columns))
+    if checked:
+        steps = [_checked_step(*step) for step in steps]
+    # Whether each step's output goes to a step that can take it lazily.
+    lazy_out = [i + 1 < len(steps) and steps[i + 1][1] is not None for i in range(len(steps))]
+    streams = _any(lazy and (stream is not None or source is not None) for lazy, (_, stream, source, _, _) in zip(lazy_out, steps))
+    if not streams and not keep_columns and _all(columnar is None for _, _, _, columnar, _ in steps):
+        fns = [eager for eager, _, _, _, _ in steps]
+        if len(fns) == 0:
+            return identity
+        if len(fns) == 1:
+            return fns[0]
+        def run(m: Any) -> Any:
+            for fn in fns:
+                m = fn(m)
+            return m
+        return run
+
+    plan = list(zip(steps, lazy_out))
+    def run_plan(m: Any) -> Any:
+        for (eager, stream, source, columnar, starts), lazy in plan:
+            if type(m) is _Stream:
+                # Sorts and the like are faster on columns than on the stream.
+                if stream is not None and (lazy or columnar is None or not starts):
+                    m = _lazy(stream(m.it), lazy)
+                    continue
+                m = list(m.it)
+            if columnar is not None and (type(m) is Columns or (starts and is_table(m))):
+                m = _run_columns(columnar, eager, m)
+                continue
+            if type(m) is Columns:
+                m = m.to_rows()
+            if lazy and source is not None:
+                m = _lazy(source(m), lazy)
+            elif lazy and stream is not None and isinstance(m, list):
+                m = _lazy(stream(iter(m)), lazy)
+            else:
+                m = eager(m)
+        if type(m) is Columns and not keep_columns:
+            m = m.to_rows()
+        return m
+    return run_plan
+
+def compile_query(query: Query) -> Callable[[Any], Any]:
+    """Compiles a nested query into a function, or falls back to its `eval` if it can't be compiled."""
+    if not isinstance(query, BaseQuery):
+        return query.eval
+    if profiling.current() is not None:
+        # Compiled fresh under the transform holding it, not cached.
+        profile = profiling.node(_query_label(query), query)
+        fn = profiling.timed(profile, _compile_steps(query.transforms, profile=profile, checked=budget.checking()))
+    elif budget.checking():
+        # Compiled fresh for the checked query holding it, not cached.
+        fn = budget.checked(_compile_steps(query.transforms, checked=True))
+    else:
+        fn = query.compile()
+    if query.empty() or query.m is None:
+        return fn
+    # Queries with their own dataset evaluate on it when passed None.
+    m = query.m
+    if type(m) is JsonSource or type(m) is ViewSource:
+        transforms = query.transforms
+        return lambda x: fn(_resolve(m, transforms) if x is None else x)
+    return lambda x: fn(m if x is None else x)
+
+def vectorize_query(query: Query) -> Callable[[Columns | Column], Column]:
+    """
+    Vectorizes a nested query, see `BaseQuery.vectorize`, or applies it a row at a time if it can't
+    be vectorized.
+    """
+    if not isinstance(query, BaseQuery) or not (query.empty() or query.m is None):
+        fn = compile_query(query)
+        return lambda x: x.map(fn)
+    if profiling.current() is not None:
+        profile = profiling.node(_query_label(query), query)
+        return profiling.timed(profile, _vectorize_steps(query.transforms, profile))
+    return query.vectorize()
+
+def _vectorize_steps(transforms: list[Transform], profile: Profile | None = None) -> Callable[[Columns | Column], Column]:
+    """See `BaseQuery.vectorize`. With a `profile`, each transform is timed under it."""
+    fns = []
+    for transform in optimize(transforms):
+        if profile is None:
+            fns.append(transform.compile_vector())
+            continue
+        label, nested = _label(transform)
+        step = profile.child(label)
+        with profiling.nested(step, {id(sub_query): name for name, sub_query in nested}):
+            fns.append(profiling.timed(step, transform.compile_vector()))
+    def vector(x: Columns | Column) -> Column:
+        for fn in fns:
+            x = fn(x)
+        return x if type(x) is Column else Column(x.to_rows())
+    return vector
+
 @define
 class BaseQuery(Query):
     m: Any | EmptyDataset = field(factory=EmptyDataset)
     transforms: list[Transform] = field(factory=list)
+    # Cache for `compile()`. Queries are never changed in place, every transform makes a new one.
+    _compiled: Callable[[Any], Any] | None = field(default=None, init=False, eq=False, repr=False)
+    # Cache for `fingerprint()`.
+    _fingerprint: Any = field(default=_UNSET, init=False, eq=False, repr=False)
+
+    def __getstate__(self) -> dict:
+        # Without the caches, since compiled functions can't be pickled, see `tft.ql.parallel`.
+        return {'m': self.m, 'transforms': self.transforms}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state['m'], state['transforms'])
 
     def empty(self) -> bool:
         return isinstance(self.m, EmptyDataset)
@@ -443,9 +1869,30 @@ class BaseQuery(Query):
     
     def sort_by(self, query: Query, reverse: bool = False) -> Self:
         return self._evolve(SortBy(query, reverse))
+
+    def top_by(self, query: Query, num: int = 1, reverse: bool = False) -> Self:
+        return self._evolve(TopBy(query, num, reverse))
     
     def unary(self, func: Callable) -> Self:
         return self._evolve(Unary(func))
+
+    def group_by(self, query: Query) -> Self:
+        return self._evolve(GroupBy(query))
+
+    def agg(self, aggregates: dict[Any, Query]) -> Self:
+        return self._evolve(Agg(aggregates))
+
+    def sum(self, query: Query) -> Self:
+        return self._evolve(Sum(query))
+
+    def mean(self, query: Query, weight: Query | None = None) -> Self:
+        return self._evolve(Mean(query, weight))
+
+    def share(self, query: Query, to_field: str) -> Self:
+        return self._evolve(Share(query, to_field))
+
+    def join(self, other: Query, left_key: Query, right_key: Query, how: str = 'inner') -> Self:
+        return self._evolve(Join(other, left_key, right_key, how))
     
     def replace(self, mapping: dict) -> Self:
         return self._evolve(Replace(mapping))
@@ -483,17 +1930,133 @@ class BaseQuery(Query):
 
     # END Transforms.
     
+    def compile(self) -> Callable[[Any], Any]:
+        """
+        Lowers the transforms, including any nested queries, into a single function from the
+        dataset to the result. Compiled once and then cached on the query.
+        """
+        if self._compiled is None:
+            # Not profiled, even while profiling, since it is cached.
+            with profiling.nested(None):
+                self._compiled = _compile_steps(self.transforms)
+        return self._compiled
+
+    def compile_checked(self) -> Callable[[Any], Any]:
+        """
+        Same as `compile`, but the function checks the time budget it runs under as it goes, along
+        with every query nested in it, see `tft.ql.budget`. Not cached on the query.
+        """
+        with profiling.nested(None), budget.compiling_checked():
+            return budget.checked(_compile_steps(self.transforms, checked=True))
+
+    def vectorize(self) -> Callable[[Columns | Column], Column]:
+        """
+        Lowers the transforms into a function that runs the query on every row of a view, or every
+        value of a column, and returns the results as a column.
+        """
+        return _vectorize_steps(self.transforms)
+
     def eval(self, m: Any | None = None) -> Any:
         assert not self.empty() or m is not None, "Need dataset to evaluate on."
         # Passed `m` should override.
         if m is None:
             m = self.m
-        result = Result(m)
+        m = _resolve(m, self.transforms)
+        if profiling.active():
+            profile = profiling.node(_query_label(self))
+            return profiling.timed(profile, _compile_steps(self.transforms, profile=profile, checked=budget.checking()))(m)
+        return self.compile()(m)
+
+    @override
+    def fingerprint(self) -> tuple | None:
+        """
+        Describes the transforms and, by identity, the dataset the query was built on, or by name a
+        view it reads. Equal for queries built the same way on the same data. None if any transform
+        can't be fingerprinted.
+        """
+        if self._fingerprint is _UNSET:
+            try:
+                transforms = tuple(fingerprint_value(transform) for transform in self.transforms)
+                if self.empty() or self.m is None:
+                    dataset = None
+                else:
+                    dataset = self.m.fingerprint() if type(self.m) is ViewSource else id(self.m)
+                self._fingerprint = (BaseQuery, transforms, dataset)
+            except Unfingerprintable:
+                self._fingerprint = None
+        return self._fingerprint
+
+    def eval_cached(self, m: Any | None = None) -> Any:
+        """
+        Same as `eval`, but the result is memoized by fingerprint until the data is refreshed. The
+        result is shared with later calls, so it must not be changed. Queries that can't be
+        fingerprinted are evaluated every time.
+
+        A query on a view is memoized by the view's version instead, and kept until the view
+        changes, if nothing else it reads is a view too, see `tft.ql.views`.
+        """
+        fingerprint = self.fingerprint()
+        if fingerprint is None:
+            return self.eval(m)
+        version = None
+        if m is not None:
+            fingerprint = (fingerprint, id(m))
+        elif type(self.m) is ViewSource:
+            m, version = self.m.read()
+            if _reads_view(fingerprint[1]):
+                # Other views can change without this one changing.
+                fingerprint, version = (fingerprint, version), None
+        if profiling.active():
+            # A miss profiles the query under the lookup.
+            lookup = profiling.timed(profiling.node(f"Cached({_query_label(self)})"), lambda m: RESULTS.get(fingerprint, lambda: self.eval(m), keep=(self, m), version=version))
+            return lookup(m)
+        return RESULTS.get(fingerprint, lambda: self.eval(m), keep=(self, m), version=version)
+
+    def cached(self) -> 'BaseQuery':
+        """Returns a query on the memoized result of this one, so queries chained on it reuse it."""
+        return query(self.eval_cached())
+
+    def indexed(self, paths: Iterable[str]) -> 'BaseQuery':
+        """
+        Same as `cached`, with hash indexes on the field paths of the records in the result, which
+        filters chained on it look up instead of scanning. See `tft.ql.index`. Queries that can't
+        be memoized aren't indexed, since the index would be built on every call.
+        """
+        if self.fingerprint() is None:
+            return query(self.eval())
+        rows = self.eval_cached()
+        if isinstance(rows, list):
+            INDEXES.declare(rows, {path: Index(path).compile() for path in paths})
+        return query(rows)
+
+    def interpret(self, m: Any | None = None) -> Any:
+        """
+        Evaluates by applying each transform in turn, interpreting nested queries the same way,
+        without compiling anything. Useful for debugging.
+        """
+        assert not self.empty() or m is not None, "Need dataset to evaluate on."
+        # Passed `m` should override.
+        if m is None:
+            m = self.m
+        result = Result(_resolve(m, self.transforms))
         for transform in self.transforms:
             result.update(transform)
         
         return result.to_dict()
     
+    def explain(self) -> None:
+        """Prints the plan the query is compiled to, after `optimize` rewrites it."""
+        print('\n'.join(_plan_lines(self, 0)))
+
+    def analyze(self, m: Any | None = None) -> None:
+        """
+        Evaluates the query with profiling on and prints what each transform cost, see
+        `tft.ql.profiling`.
+        """
+        with profiling.profiling() as profiles:
+            self.eval(m)
+        print(profiling.render(profiles))
+
     def splay(self, depth: int | None = None) -> None:
         splay(self.eval(), depth=depth)
     
@@ -501,14 +2064,22 @@ class BaseQuery(Query):
         print(json.dumps(self.eval(), indent=indent))
     
     def to_pandas(self) -> pd.DataFrame:
-        return pd.DataFrame(self.eval())
+        """Evaluates the query into a data frame, built from its columns if it ends up as records."""
+        assert not self.empty(), "Need dataset to evaluate on."
+        result = _compile_steps(self.transforms, keep_columns=True)(_resolve(self.m, self.transforms))
+        if type(result) is Columns:
+            return result.to_pandas()
+        if is_table(result):
+            return Columns(result).to_pandas()
+        return pd.DataFrame(result)
 
 # Public functions
 def noop() -> BaseQuery:
     return query().noop()
 
 def query(m: dict | None = None) -> BaseQuery:
-    return BaseQuery(m)
+    """A query on `m`. Raw JSON bytes and memory maps are read as a `JsonSource`, see `tft.ql.source`."""
+    return BaseQuery(JsonSource(m) if isinstance(m, RAW_TYPES) else m)
 
 def idx(path: str) -> BaseQuery:
     return query().idx(path)
@@ -564,6 +2135,9 @@ def any(queries: Iterable[Query]) -> BaseQuery:
 def sort_by(_query: Query, reverse: bool = False) -> BaseQuery:
     return query().sort_by(_query, reverse)
 
+def top_by(_query: Query, num: int = 1, reverse: bool = False) -> BaseQuery:
+    return query().top_by(_query, num, reverse)
+
 def unary(func: Callable) -> BaseQuery:
     return query().unary(func)
 
@@ -577,4 +2151,25 @@ def only() -> BaseQuery:
     return query().only()
 
 def explode(to_field: str) -> BaseQuery:
-    return query().explode(to_field)
\ No newline at end of file
+    return query().explode(to_field)
+
+def group_by(_query: Query) -> BaseQuery:
+    return query().group_by(_query)
+
+def agg(aggregates: dict[Any, Query]) -> BaseQuery:
+    return query().agg(aggregates)
+
+def count() -> BaseQuery:
+    return query().len()
+
+def sum(_query: Query) -> BaseQuery:
+    return query().sum(_query)
+
+def mean(_query: Query, weight: Query | None = None) -> BaseQuery:
+    return query().mean(_query, weight)
+
+def share(_query: Query, to_field: str) -> BaseQuery:
+    return query().share(_query, to_field)
+
+def join(other: Query, left_key: Query, right_key: Query, how: str = 'inner') -> BaseQuery:
+    return query().join(other, left_key, right_key, how)
@@ -0,0 +1,149 @@
+"""
+Hash indexes for QL. An index maps each value of a field path to the positions of the rows that have
+it, a sorted posting list. For multi valued fields, like the `units` of a comp, each row is listed
+under every value in its list instead.
+
+Indexes are declared on a list of records with `BaseQuery.indexed`, which memoizes the query and
+indexes its result. A filter that then runs on that exact list is answered from the indexes when
+its predicate is an `eq` or `in_set` on an indexed single valued path, a `contains` on an indexed
+multi valued path, or an `all` or `any` of those. `all` intersects the posting lists, and any part
+of it that can't be looked up is only run on the rows that are left.
+
+`join` keeps the hash tables of the rows it joins to here as well, under the path of the right key
+if it is a plain `idx`, so it shares them with `indexed`, or under the key query's fingerprint.
+
+Indexes are kept by the identity of the list they were built over and dropped by `invalidate` when
+the MetaTFT data is refreshed, so the next `indexed` call builds them again over the fresh data.
+Indexes on the lists views hold are kept, since a view that changes is a new list, see
+`tft.ql.views`.
+"""
+from collections import OrderedDict
+import threading
+from typing import Any, Callable, Iterable
+from attrs import define, field
+import numpy as np
+
+MAX_INDEXED_DATASETS = 64
+# Field values that are indexed by each of their values.
+MULTI_VALUED = (list, tuple, set, frozenset)
+
+
+class HashIndex:
+    """The positions of the rows with each value of one field path."""
+    __slots__ = ['multi', '_postings']
+
+    def __init__(self, postings: dict[Any, np.ndarray], multi: bool):
+        self.multi = multi
+        self._postings = postings
+
+    @staticmethod
+    def build(rows: list, get: Callable[[Any], Any]) -> 'HashIndex | None':
+        """
+        Indexes the value `get` returns for every row. None if it can't be, because a row doesn't
+        have the field, a value isn't hashable or only some rows have lists of values.
+        """
+        postings: dict[Any, list[int]] = {}
+        multi = None
+        try:
+            for i, row in enumerate(rows):
+                value = get(row)
+                if multi is None:
+                    multi = isinstance(value, MULTI_VALUED)
+                elif multi != isinstance(value, MULTI_VALUED):
+                    return None
+                for key in (set(value) if multi else (value,)):
+                    postings.setdefault(key, []).append(i)
+        except Exception:
+            # Missing fields, unhashable values and the like, which filters report better.
+            return None
+        return HashIndex({key: np.array(positions, dtype=np.intp) for key, positions in postings.items()}, bool(multi))
+
+    def lookup(self, value: Any) -> np.ndarray:
+        """The rows with the value. Raises `TypeError` if it isn't hashable."""
+        positions = self._postings.get(value)
+        return positions if positions is not None else np.empty(0, dtype=np.intp)
+
+    def lookup_any(self, values: Iterable) -> np.ndarray:
+        """The rows with any of the values. Raises `TypeError` if one isn't hashable."""
+        return union([self.lookup(value) for value in values])
+
+
+def intersect(postings: list[np.ndarray]) -> np.ndarray:
+    result = postings[0]
+    for positions in postings[1:]:
+        result = np.intersect1d(result, positions, assume_unique=True)
+    return result
+
+
+def union(postings: list[np.ndarray]) -> np.ndarray:
+    if len(postings) == 0:
+        return np.empty(0, dtype=np.intp)
+    if len(postings) == 1:
+        return postings[0]
+    # Sorting and dropping repeats is faster than `np.unique` on posting lists this short.
+    merged = np.sort(np.concatenate(postings))
+    keep = np.empty(len(merged), dtype=bool)
+    keep[:1] = True
+    np.not_equal(merged[1:], merged[:-1], out=keep[1:])
+    return merged[keep]
+
+
+@define
+class IndexRegistry:
+    """
+    Indexes by field path, or key fingerprint for joins, for the most recently indexed
+    `max_datasets` lists, keyed by the identity of the list. Thread safe. Each entry keeps its list alive, so it can't be replaced by another
+    list with the same id.
+    """
+    max_datasets: int = field(default=MAX_INDEXED_DATASETS)
+    version: int = field(default=0, init=False)
+    _datasets: OrderedDict[int, tuple[list, dict[Any, HashIndex | None]]] = field(factory=OrderedDict, init=False)
+    _lock: threading.Lock = field(factory=threading.Lock, init=False)
+
+    def declare(self, rows: list, getters: dict[Any, Callable[[Any], Any]]) -> None:
+        """Builds the indexes on `rows` for the paths, with `getters` reading each path from a row."""
+        with self._lock:
+            entry = self._datasets.get(id(rows))
+            built = entry[1] if entry is not None and entry[0] is rows else {}
+            version = self.version
+        missing = {path: get for path, get in getters.items() if path not in built}
+        if len(missing) == 0:
+            return
+        # Built outside the lock. Paths that can't be indexed are kept as None so they aren't tried
+        # again, and filters on them scan.
+        indexes = {path: HashIndex.build(rows, get) for path, get in missing.items()}
+        with self._lock:
+            # Dropped if the data was refreshed while building.
+            if version != self.version:
+                return
+            entry = self._datasets.get(id(rows))
+            if entry is None or entry[0] is not rows:
+                entry = self._datasets[id(rows)] = (rows, {})
+            entry[1].update(indexes)
+            self._datasets.move_to_end(id(rows))
+            while len(self._datasets) > self.max_datasets:
+                self._datasets.popitem(last=False)
+
+    def get(self, rows: list) -> dict[Any, HashIndex | None] | None:
+        """The indexes on exactly this list, by path, if it has any. None for paths that couldn't be indexed."""
+        entry = self._datasets.get(id(rows))
+        if entry is None or entry[0] is not rows:
+            return None
+        return entry[1]
+
+    def invalidate(self, keep: Iterable = ()) -> None:
+        """Drops every index but those on the lists in `keep`, for when the data they were built over changes."""
+        kept = {id(rows) for rows in keep}
+        with self._lock:
+            self.version += 1
+            for key in [key for key in self._datasets if key not in kept]:
+                del self._datasets[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            indexes = sum(index is not None for _, built in self._datasets.values() for index in built.values())
+            return {'datasets': len(self._datasets), 'indexes': indexes, 'version': self.version}
+
+
+# Singleton used by `BaseQuery.indexed` and filters.
+INDEXES = IndexRegistry()
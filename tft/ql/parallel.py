@@ -0,0 +1,266 @@
+"""
+Runs a `map` or `filter` over a long list in worker processes, for queries that call Python
+functions on every row through `unary`, like the scores in `tft.ql.util`, which the GIL otherwise
+keeps on one core. Which queries qualify is decided when they are compiled, see `tft.ql.expr`.
+
+The list is pickled once into a snapshot file, in shared memory where there is some, and kept in
+`SNAPSHOTS` while the list holds the same rows, so queries run again on the same dataset don't copy
+it again. Workers in a persistent process pool map the file and unpickle it the first time they see
+it, so each task only names the snapshot, a range of rows and the pickled query. A `filter` sends
+back which rows it keeps rather than the rows, so the caller keeps its own rows.
+
+Running in workers is off until `enable` is called, since it only pays off with CPUs to spare and
+long lists of rows that call Python functions. Even then lists shorter than `MIN_ROWS` run in the
+calling process, since the tasks cost more than they save there, and so does everything when this
+process may only use one CPU.
+"""
+import atexit
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+import mmap
+import multiprocessing
+import operator
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from typing import Any, Callable, Iterable, Iterator
+from attrs import define, field
+import numpy as np
+
+MIN_ROWS = 20000
+# The most workers `enable` starts.
+MAX_WORKERS = 8
+# Workers to run queries in, 0 until `enable` is called.
+WORKERS = 0
+# Tasks per worker, so a worker that gets slow rows doesn't leave the others idle.
+CHUNKS_PER_WORKER = 4
+MAX_SNAPSHOTS = 8
+# What a task does with the rows: `MAP` returns the query's values, `FILTER` the offsets of the
+# rows it is true for.
+MAP = 'map'
+FILTER = 'filter'
+# Kept in each worker.
+MAX_WORKER_SNAPSHOTS = 4
+MAX_WORKER_QUERIES = 32
+
+
+class _State:
+    # Whether this process is a worker, which runs everything itself.
+    worker = False
+    pool: ProcessPoolExecutor | None = None
+
+
+class _Local(threading.local):
+    def __init__(self):
+        # Whether queries compiled on this thread run in this process, see `serial`.
+        self.serial = False
+
+
+_state = _State()
+_local = _Local()
+_pool_lock = threading.Lock()
+
+
+def available_cpus() -> int:
+    """The CPUs this process may run on, which in a container can be fewer than the machine has."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        # Not on every platform.
+        return os.cpu_count() or 1
+
+
+def workers() -> int:
+    """How many workers queries are split across, at most one per CPU this process may use."""
+    return min(WORKERS, available_cpus())
+
+
+def enable(count: int | None = None) -> None:
+    """Runs maps and filters in `count` workers, or one per CPU this process may use up to `MAX_WORKERS`."""
+    global WORKERS
+    WORKERS = count if count is not None else min(MAX_WORKERS, available_cpus())
+
+
+def enabled() -> bool:
+    """Whether queries compiled on this thread can run in workers."""
+    return workers() > 1 and not _state.worker and not _local.serial
+
+
+@contextmanager
+def serial() -> Iterator[None]:
+    """Runs every query compiled in the block in this process."""
+    previous = _local.serial
+    _local.serial = True
+    try:
+        yield
+    finally:
+        _local.serial = previous
+
+
+@define
+class SnapshotRegistry:
+    """
+    Snapshot files of lists, kept until `max_entries` newer ones push them out. Each snapshot keeps
+    a frozen copy of the list it was taken of, a tuple of the same rows, and is only used again for
+    a list that still holds exactly those rows in that order. So a list that was changed, or another
+    list that got its id, gets a new snapshot. The rows themselves are not compared, they must not be
+    changed, which the MetaTFT data can't be, see `tft.ql.record`. Thread safe.
+    """
+    max_entries: int = field(default=MAX_SNAPSHOTS)
+    _directory: str | None = field(default=None, init=False)
+    _entries: OrderedDict[int, tuple[tuple, str]] = field(factory=OrderedDict, init=False)
+    _lock: threading.Lock = field(factory=threading.Lock, init=False)
+
+    def path(self, rows: list) -> str:
+        """The snapshot of the rows in the list, written the first time they are asked for."""
+        with self._lock:
+            entry = self._entries.get(id(rows))
+            if entry is not None and len(entry[0]) == len(rows) and all(map(operator.is_, entry[0], rows)):
+                self._entries.move_to_end(id(rows))
+                return entry[1]
+            if entry is not None:
+                # The list changed since its snapshot.
+                del self._entries[id(rows)]
+                _unlink(entry[1])
+            frozen = tuple(rows)
+            if self._directory is None:
+                self._directory = tempfile.mkdtemp(prefix='ql-snapshots-', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+            fd, path = tempfile.mkstemp(suffix='.pickle', dir=self._directory)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump(frozen, f, protocol=pickle.HIGHEST_PROTOCOL)
+            except BaseException:
+                os.unlink(path)
+                raise
+            self._entries[id(rows)] = (frozen, path)
+            while len(self._entries) > self.max_entries:
+                _, (_, old_path) = self._entries.popitem(last=False)
+                _unlink(old_path)
+            return path
+
+    def invalidate(self, keep: Iterable = ()) -> None:
+        """
+        Deletes every snapshot but those of the lists in `keep`, for when the data they were taken
+        of is refreshed.
+        """
+        kept = {id(rows) for rows in keep}
+        with self._lock:
+            for key in [key for key in self._entries if key not in kept]:
+                _unlink(self._entries.pop(key)[1])
+
+    def close(self) -> None:
+        """Deletes every snapshot and the directory they were in."""
+        self.invalidate()
+        with self._lock:
+            if self._directory is not None:
+                shutil.rmtree(self._directory, ignore_errors=True)
+                self._directory = None
+
+
+def _unlink(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+# Singleton used by `run`.
+SNAPSHOTS = SnapshotRegistry()
+
+
+def _init_worker() -> None:
+    _state.worker = True
+
+
+# Snapshots and compiled queries a worker has loaded, most recently used last.
+_worker_rows: OrderedDict[str, tuple] = OrderedDict()
+_worker_queries: OrderedDict[bytes, Callable[[Any], Any]] = OrderedDict()
+
+
+def _load_rows(path: str) -> tuple:
+    rows = _worker_rows.get(path)
+    if rows is None:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            rows = pickle.loads(data)
+        _worker_rows[path] = rows
+        while len(_worker_rows) > MAX_WORKER_SNAPSHOTS:
+            _worker_rows.popitem(last=False)
+    _worker_rows.move_to_end(path)
+    return rows
+
+
+def _load_query(payload: bytes) -> Callable[[Any], Any]:
+    fn = _worker_queries.get(payload)
+    if fn is None:
+        fn = pickle.loads(payload).compile()
+        _worker_queries[payload] = fn
+        while len(_worker_queries) > MAX_WORKER_QUERIES:
+            _worker_queries.popitem(last=False)
+    _worker_queries.move_to_end(payload)
+    return fn
+
+
+def _run_chunk(path: str, payload: bytes, kind: str, start: int, stop: int, positions: np.ndarray | None) -> list:
+    """Runs in a worker, on rows `start` to `stop` of the snapshot, or of `positions` into it if given."""
+    rows = _load_rows(path)
+    fn = _load_query(payload)
+    chunk = rows[start:stop] if positions is None else [rows[i] for i in positions.tolist()]
+    if kind == MAP:
+        return [fn(row) for row in chunk]
+    return [start + i for i, row in enumerate(chunk) if fn(row)]
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    with _pool_lock:
+        if _state.pool is None:
+            # Spawned rather than forked, since the server forks from threads.
+            _state.pool = ProcessPoolExecutor(max_workers=workers(), mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker)
+        return _state.pool
+
+
+def shutdown() -> None:
+    """Stops the workers and deletes the snapshots. The pool is started again when next needed."""
+    with _pool_lock:
+        pool, _state.pool = _state.pool, None
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+    SNAPSHOTS.close()
+
+
+atexit.register(shutdown)
+
+
+def run(rows: list, payload: bytes, kind: str, positions: np.ndarray | None = None) -> list | None:
+    """
+    Runs a pickled query on every row, or on the rows at `positions`, split across the workers.
+    For a `MAP` returns the values in order, for a `FILTER` the offsets of the rows kept among those
+    run on. None if there are too few rows to be worth it, or the rows can't be pickled or the pool
+    broke, for the caller to run the query itself. Errors raised by the query are raised here.
+    """
+    count = len(rows) if positions is None else len(positions)
+    if count < MIN_ROWS or not enabled():
+        return None
+    try:
+        path = SNAPSHOTS.path(rows)
+    except (pickle.PicklingError, TypeError, AttributeError, OSError):
+        return None
+    size = -(-count // (workers() * CHUNKS_PER_WORKER))
+    try:
+        pool = _get_pool()
+        futures = [
+            pool.submit(_run_chunk, path, payload, kind, start, min(start + size, count), None if positions is None else positions[start:start + size])
+            for start in range(0, count, size)
+        ]
+        out = []
+        for future in futures:
+            out.extend(future.result())
+        return out
+    except BrokenProcessPool:
+        # A worker died, the pool is started again on the next call.
+        with _pool_lock:
+            _state.pool = None
+        return None
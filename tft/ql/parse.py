@@ -0,0 +1,209 @@
+"""
+A text syntax for QL, so queries can be written without Python. A query is written the way it is
+built in Python, without the `ql.` prefix (which is allowed too), starting from a named dataset:
+
+    comps.filter(all([idx('units').contains('TFT12_Ahri'), idx('level').in_set(['7', '8'])])).sort_by(idx('games'), True).top(10)
+    top_comps.filter(idx('units').contains('TFT12_Ahri')).join(champs, idx('units'), idx('apiName')).map(select(['name', 'cost']))
+
+The text is parsed as a Python expression, and only calls of QL transforms, the names of datasets
+and literals are allowed, so nothing else in Python can be reached. `unary` and anything else that
+takes a function can't be written. Which datasets there are is up to the caller, see
+`tft.queries.adhoc`.
+
+Parsed queries are kept in `PLANS` by their text along with their compiled function, so running the
+same text again skips parsing, optimizing and compiling. They hold the data they were parsed on, so
+the plans are dropped by `invalidate` when the MetaTFT data is refreshed.
+"""
+import ast
+from collections import OrderedDict
+import threading
+from typing import Any, Callable, Hashable, Mapping
+from attrs import define, field
+import tft.ql.budget as budget
+import tft.ql.expr as ql
+import tft.ql.profiling as profiling
+
+MAX_QUERY_LENGTH = 2000
+MAX_CACHED_PLANS = 256
+# Transforms that can be chained on a query.
+METHODS = frozenset([
+    'noop', 'idx', 'map', 'top', 'split', 'sub', 'extend', 'explode', 'filter', 'len', 'length',
+    'select', 'contains', 'in_set', 'flatten', 'uniq', 'keys', 'vals', 'values', 'only', 'sort_by',
+    'top_by', 'group_by', 'agg', 'sum', 'mean', 'share', 'join', 'replace', 'lt', 'le', 'gt', 'ge',
+    'eq', 'ne', 'neg', 'all', 'any',
+])
+# Functions of `tft.ql.expr` that start a query on its input.
+FUNCTIONS = frozenset([
+    'query', 'noop', 'idx', 'map', 'top', 'split', 'sub', 'extend', 'explode', 'filter', 'length',
+    'select', 'contains', 'flatten', 'uniq', 'keys', 'vals', 'neg', 'all', 'any', 'sort_by', 'top_by',
+    'replace', 'in_set', 'only', 'group_by', 'agg', 'count', 'sum', 'mean', 'share', 'join',
+])
+# Literal names, as in JSON or Python.
+CONSTANTS = {'true': True, 'false': False, 'null': None, 'True': True, 'False': False, 'None': None}
+
+
+class ParseError(Exception):
+    """Raised for text that isn't a valid query."""
+    pass
+
+
+@define
+class _Parser:
+    # Makes the query for each dataset name.
+    datasets: Mapping[str, Callable[[], ql.BaseQuery]] = field()
+    # Datasets made so far, so a name used twice is one dataset.
+    _made: dict[str, ql.BaseQuery] = field(factory=dict, init=False)
+
+    def dataset(self, name: str) -> ql.BaseQuery:
+        if name not in self._made:
+            self._made[name] = self.datasets[name]()
+        return self._made[name]
+
+    def value(self, node: ast.expr) -> Any:
+        """Turns an expression into a literal or a query."""
+        if isinstance(node, ast.Constant) and (node.value is None or isinstance(node.value, (bool, int, float, str))):
+            return node.value
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) and isinstance(node.operand, ast.Constant) \
+                and isinstance(node.operand.value, (int, float)) and not isinstance(node.operand.value, bool):
+            return -node.operand.value
+        if isinstance(node, (ast.List, ast.Tuple)):
+            return [self.value(item) for item in node.elts]
+        if isinstance(node, ast.Set):
+            values = [self.value(item) for item in node.elts]
+            try:
+                return set(values)
+            except TypeError:
+                raise ParseError("Sets can only hold literals.")
+        if isinstance(node, ast.Dict):
+            if any(key is None for key in node.keys):
+                raise ParseError("Can't unpack into a dict.")
+            keys = [self.value(key) for key in node.keys]
+            if any(isinstance(key, (ql.Query, list, set)) for key in keys):
+                raise ParseError("Dict keys can only be literals.")
+            return {key: self.value(value) for key, value in zip(keys, node.values)}
+        if isinstance(node, ast.Name):
+            if node.id in CONSTANTS:
+                return CONSTANTS[node.id]
+            if node.id in self.datasets:
+                return self.dataset(node.id)
+            raise ParseError(f"Unknown name: {node.id}. Datasets are: {', '.join(sorted(self.datasets))}")
+        if isinstance(node, ast.Call):
+            return self.call(node)
+        raise ParseError(f"Unsupported syntax: {ast.unparse(node)}")
+
+    def call(self, node: ast.Call) -> ql.BaseQuery:
+        """Turns a call of a transform, on a query or as a function, into the query it makes."""
+        target = node.func
+        if isinstance(target, ast.Name) or (isinstance(target, ast.Attribute) and isinstance(target.value, ast.Name) and target.value.id == 'ql'):
+            name = target.id if isinstance(target, ast.Name) else target.attr
+            if name not in FUNCTIONS:
+                raise ParseError(f"Unknown function: {name}")
+            if name == 'query' and (len(node.args) > 0 or len(node.keywords) > 0):
+                raise ParseError("query() can't be given data, start from a dataset instead.")
+            fn = getattr(ql, name)
+        elif isinstance(target, ast.Attribute):
+            on = self.value(target.value)
+            if not isinstance(on, ql.BaseQuery):
+                raise ParseError(f"Transforms can only be chained on a query: {ast.unparse(target.value)}")
+            if target.attr not in METHODS:
+                raise ParseError(f"Unknown transform: {target.attr}")
+            fn = getattr(on, target.attr)
+        else:
+            raise ParseError(f"Unsupported call: {ast.unparse(target)}")
+        if any(isinstance(arg, ast.Starred) for arg in node.args) or any(keyword.arg is None for keyword in node.keywords):
+            raise ParseError("Can't unpack arguments.")
+        args = [self.value(arg) for arg in node.args]
+        kwargs = {keyword.arg: self.value(keyword.value) for keyword in node.keywords}
+        try:
+            return fn(*args, **kwargs)
+        except (TypeError, AssertionError, ValueError, AttributeError) as e:
+            raise ParseError(f"Bad arguments to {ast.unparse(target)}: {e}")
+
+
+def parse(text: str, datasets: Mapping[str, Callable[[], ql.BaseQuery]]) -> ql.BaseQuery:
+    """
+    Parses a query, starting from one of `datasets`, which are made the first time they are named.
+    Raises `ParseError` if the text isn't a valid query.
+    """
+    if len(text) > MAX_QUERY_LENGTH:
+        raise ParseError(f"Queries can be at most {MAX_QUERY_LENGTH} characters.")
+    try:
+        tree = ast.parse(text.strip(), mode='eval')
+    except (SyntaxError, ValueError, RecursionError, MemoryError) as e:
+        raise ParseError(f"Invalid syntax: {e}")
+    try:
+        result = _Parser(datasets).value(tree.body)
+    except RecursionError:
+        raise ParseError("Query is nested too deeply.")
+    if not isinstance(result, ql.BaseQuery) or result.empty() or result.m is None:
+        raise ParseError(f"A query has to start from a dataset: {', '.join(sorted(datasets))}")
+    return result
+
+
+@define
+class Plan:
+    """A parsed query and the function it compiles to, which checks the time budget it runs under."""
+    text: str = field()
+    query: ql.BaseQuery = field()
+    fn: Callable[[Any], Any] = field(repr=False)
+
+    @staticmethod
+    def build(text: str, datasets: Mapping[str, Callable[[], ql.BaseQuery]]) -> 'Plan':
+        query = parse(text, datasets)
+        return Plan(text, query, query.compile_checked())
+
+    def run(self) -> Any:
+        """Evaluates the query on its dataset. Call under `tft.ql.budget.limit` to bound how long it runs."""
+        if profiling.active():
+            # Compiled again with every transform timed, see `tft.ql.profiling`.
+            with budget.compiling_checked():
+                return self.query.eval()
+        return self.fn(self.query.m)
+
+
+@define
+class PlanCache:
+    """
+    A least recently used cache of plans, keyed by the text of the query and what else the caller
+    parsed it with, like the dataset. Thread safe. Text that fails to parse isn't kept.
+    """
+    max_entries: int = field(default=MAX_CACHED_PLANS)
+    version: int = field(default=0, init=False)
+    hits: int = field(default=0, init=False)
+    misses: int = field(default=0, init=False)
+    _entries: OrderedDict[Hashable, Plan] = field(factory=OrderedDict, init=False)
+    _lock: threading.Lock = field(factory=threading.Lock, init=False)
+
+    def get(self, key: Hashable, build: Callable[[], Plan]) -> Plan:
+        """Returns the plan for the key, calling `build` for it on a miss."""
+        with self._lock:
+            plan = self._entries.get(key)
+            if plan is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return plan
+            self.misses += 1
+            version = self.version
+        plan = build()
+        with self._lock:
+            # Dropped if the data was refreshed while parsing.
+            if version == self.version:
+                self._entries[key] = plan
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return plan
+
+    def invalidate(self) -> None:
+        """Drops every plan, for when the data they were parsed on changes."""
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'version': self.version, 'hits': self.hits, 'misses': self.misses}
+
+
+# Singleton used by `tft.queries.adhoc`.
+PLANS = PlanCache()
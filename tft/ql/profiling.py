@@ -0,0 +1,201 @@
+"""
+Profiling for QL queries, like EXPLAIN ANALYZE. While profiling is on for a thread, every query it
+evaluates is compiled again with each transform wrapped to record its wall time, how many rows went
+in and came out, and how much memory was left allocated after it ran. Nested queries, like the one
+passed to a `filter` or a query evaluated inside a `unary`, are recorded under the transform that
+runs them, so the result is a tree of `Profile`s.
+
+Times include everything nested under a transform. Lists aren't streamed between transforms while
+profiling, so each transform's time is its own work, not the work of the transforms before it that
+it pulled rows through. Memory is measured with `tracemalloc`, which slows everything down and sees
+allocations made by other threads, so it is only a rough guide when the server is busy.
+
+Usage:
+    with profiling() as profiles:
+        query_comps().eval()
+    print(render(profiles))
+"""
+from collections.abc import Sized
+from contextlib import contextmanager
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Iterator
+from attrs import define, field
+
+
+@define(eq=False)
+class Profile:
+    """What a query or transform cost, summed over every time it ran."""
+    name: str = field()
+    calls: int = field(default=0)
+    seconds: float = field(default=0.0)
+    rows_in: int = field(default=0)
+    rows_out: int = field(default=0)
+    # Bytes still allocated after the transform ran that weren't before, can be negative.
+    memory: int = field(default=0)
+    children: list['Profile'] = field(factory=list)
+
+    def child(self, name: str) -> 'Profile':
+        """The child with the name, made if there isn't one, so repeated runs add up."""
+        for child in self.children:
+            if child.name == name:
+                return child
+        child = Profile(name)
+        self.children.append(child)
+        return child
+
+    def record(self, seconds: float, rows_in: int, rows_out: int, memory: int) -> None:
+        self.calls += 1
+        self.seconds += seconds
+        self.rows_in += rows_in
+        self.rows_out += rows_out
+        self.memory += memory
+
+    def lines(self, depth: int = 0) -> list[str]:
+        """The tree, one profile per line, indented like `splay`."""
+        stats = f"{self.seconds * 1000:.2f}ms  {self.calls} call{'' if self.calls == 1 else 's'}"
+        if self.calls > 0:
+            stats += f"  {self.rows_in} -> {self.rows_out} rows  {self.memory / 1024:+.0f}KB"
+        lines = ['  ' * depth + f"{self.name}  {stats}"]
+        for child in self.children:
+            lines.extend(child.lines(depth + 1))
+        return lines
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'calls': self.calls,
+            'ms': self.seconds * 1000,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'memory_bytes': self.memory,
+            'children': [child.to_dict() for child in self.children],
+        }
+
+
+class _State(threading.local):
+    def __init__(self):
+        # Queries evaluated at the top level while profiling, None when not profiling.
+        self.roots: list[Profile] | None = None
+        # The query or transform being compiled or run.
+        self.current: Profile | None = None
+        # Names for the queries the transform being compiled holds, by id.
+        self.labels: dict[int, str] = {}
+
+
+_state = _State()
+# How many threads are profiling, `tracemalloc` is stopped when the last one is done.
+_tracing = 0
+_tracing_lock = threading.Lock()
+# Whether `tracemalloc` was started here, and should be stopped here.
+_started_tracing = False
+
+
+def active() -> bool:
+    """Whether queries evaluated on this thread are profiled."""
+    return _state.roots is not None
+
+
+def current() -> Profile | None:
+    """The query or transform being compiled or run on this thread while profiling."""
+    return _state.current
+
+
+def node(name: str, query: Any = None) -> Profile:
+    """
+    The profile for a query about to be compiled, nested under the current one if there is one. If
+    the transform being compiled named the query, that name is used instead.
+    """
+    name = _state.labels.get(id(query), name)
+    if _state.current is not None:
+        return _state.current.child(name)
+    assert _state.roots is not None, "Not profiling."
+    for root in _state.roots:
+        if root.name == name:
+            return root
+    root = Profile(name)
+    _state.roots.append(root)
+    return root
+
+
+@contextmanager
+def nested(profile: Profile | None, labels: dict[int, str] | None = None) -> Iterator[None]:
+    """
+    Nests queries compiled or evaluated in the block under `profile`, or nothing if None. `labels`
+    names the queries a transform holds by their id.
+    """
+    previous = (_state.current, _state.labels)
+    _state.current, _state.labels = profile, labels if labels is not None else {}
+    try:
+        yield
+    finally:
+        _state.current, _state.labels = previous
+
+
+def _rows(m: Any) -> int:
+    """How many rows a value is. Dicts are one record, like anything else that isn't a list."""
+    return len(m) if isinstance(m, Sized) and not isinstance(m, (str, bytes, dict)) else 1
+
+
+def _memory() -> int:
+    return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+
+def timed(profile: Profile, fn: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    """Wraps a compiled query or transform to record every call against `profile`."""
+    def run(m: Any) -> Any:
+        rows_in = _rows(m)
+        memory = _memory()
+        previous = (_state.current, _state.labels)
+        _state.current, _state.labels = profile, {}
+        start = time.perf_counter()
+        try:
+            out = fn(m)
+        finally:
+            _state.current, _state.labels = previous
+        profile.record(time.perf_counter() - start, rows_in, _rows(out), _memory() - memory)
+        return out
+    return run
+
+
+def start() -> list[Profile]:
+    """Profiles queries evaluated on this thread until `stop`, returns the list they are added to."""
+    global _tracing, _started_tracing
+    assert _state.roots is None, "Already profiling."
+    with _tracing_lock:
+        if _tracing == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+        _tracing += 1
+    _state.roots = []
+    return _state.roots
+
+
+def stop() -> None:
+    """Stops profiling on this thread. Does nothing if it isn't."""
+    global _tracing, _started_tracing
+    if _state.roots is None:
+        return
+    _state.roots = None
+    _state.current = None
+    _state.labels = {}
+    with _tracing_lock:
+        _tracing -= 1
+        if _tracing == 0 and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+
+
+@contextmanager
+def profiling() -> Iterator[list[Profile]]:
+    """Profiles the queries evaluated in the block, which are added to the list it gives."""
+    profiles = start()
+    try:
+        yield profiles
+    finally:
+        stop()
+
+
+def render(profiles: list[Profile]) -> str:
+    return '\n'.join(line for profile in profiles for line in profile.lines())
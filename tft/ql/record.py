@@ -0,0 +1,92 @@
+"""
+Read only rows for QL. `extend` and `explode` used to deep copy every row they touched so they
+could add a field without changing the cached MetaTFT data underneath. Instead they now make a
+`Record`, a shallow copy with the new fields that shares every nested list and dict with the row it
+came from. Records can't be changed in place, so a caller can't write through one into the cache.
+To add fields to a record use `ql.extend`, or `dict(record)` for a copy that can be changed.
+
+The MetaTFT data is frozen with `freeze` when it is decoded, every dict in it made a record and
+every list a `FrozenList`, so the nested values a record shares can't be changed in place either.
+"""
+import copy
+from typing import Any
+
+
+class Record(dict):
+    """A dict that can't be changed after it is made."""
+    __slots__ = ()
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("QL records are read only, use ql.extend to add fields or dict(record) to copy one.")
+
+    __setitem__ = _read_only
+    __delitem__ = _read_only
+    __ior__ = _read_only
+    clear = _read_only
+    pop = _read_only
+    popitem = _read_only
+    setdefault = _read_only
+    update = _read_only
+
+    def __copy__(self) -> 'Record':
+        return self
+
+    def __deepcopy__(self, memo: dict) -> dict:
+        # A deep copy shares nothing, so it is safe to hand back something that can be changed.
+        return copy.deepcopy(dict(self), memo)
+
+    def __reduce__(self):
+        return (Record, (dict(self),))
+
+
+class FrozenList(list):
+    """A list that can't be changed after it is made."""
+    __slots__ = ()
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("QL data is read only, use list(value) for a copy that can be changed.")
+
+    __setitem__ = _read_only
+    __delitem__ = _read_only
+    __iadd__ = _read_only
+    __imul__ = _read_only
+    append = _read_only
+    clear = _read_only
+    extend = _read_only
+    insert = _read_only
+    pop = _read_only
+    remove = _read_only
+    reverse = _read_only
+    sort = _read_only
+
+    def __copy__(self) -> 'FrozenList':
+        return self
+
+    def __deepcopy__(self, memo: dict) -> list:
+        return copy.deepcopy(list(self), memo)
+
+    def __reduce__(self):
+        return (FrozenList, (list(self),))
+
+
+def freeze(value: Any) -> Any:
+    """A copy of decoded JSON with every dict made a record and every list a `FrozenList`."""
+    if isinstance(value, dict):
+        return Record({key: freeze(val) for key, val in value.items()})
+    if isinstance(value, list):
+        return FrozenList([freeze(val) for val in value])
+    return value
+
+
+def with_fields(m: dict, fields: dict) -> Record:
+    """A record of `m` with `fields` added or replaced."""
+    record = Record(m)
+    dict.update(record, fields)
+    return record
+
+
+def with_field(m: dict, key: Any, value: Any) -> Record:
+    """A record of `m` with one field added or replaced."""
+    record = Record(m)
+    dict.__setitem__(record, key, value)
+    return record
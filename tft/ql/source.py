@@ -0,0 +1,97 @@
+"""
+JSON documents queried without decoding them whole. A `JsonSource` keeps the raw text, bytes or a
+memory map of a file, and a query on it only decodes the paths its leading `idx`s, and `map`s and
+`sub`s of `idx`s, lead to, see `tft.ql.expr`. Everything past those paths is decoded whole, since
+the transforms after them read it as it is. Skipped values are decoded one at a time and dropped, so
+they are never all held in memory, see `tft.client.extract`.
+
+    >>> source = JsonSource.open('res/comp_data.json')
+    >>> ql.query(source).idx('tft_set').eval()
+    >>> ql.query(source).idx('results.data.cluster_details').map(ql.idx('units_string')).eval()
+
+The parts a query decoded are kept on the source, by what was read, so queries reading the same
+paths again share them and must not change them. The text is decoded from the bytes once, the first
+time a part is asked for, and kept until the source is closed. Sources on files should be closed
+when they are done with, or used in a `with` block, to unmap the file:
+
+    >>> with JsonSource.open('res/comp_data.json') as source:
+    ...     ql.query(source).idx('tft_set').eval()
+"""
+from collections import OrderedDict
+import json
+import mmap
+import os
+import threading
+from typing import Any
+from attrs import define, field
+from tft.client.extract import Projection, extract
+
+# Decoded parts kept per source.
+MAX_PARTS = 8
+# Raw JSON that `ql.query` reads as a `JsonSource`.
+RAW_TYPES = (bytes, bytearray, mmap.mmap)
+
+
+@define(eq=False)
+class JsonSource:
+    """A JSON document that is decoded only as far as it is read. Thread safe."""
+    data: str | bytes | bytearray | mmap.mmap = field(repr=False)
+    _parts: OrderedDict[str, Any] = field(factory=OrderedDict, init=False, repr=False)
+    _text: str | None = field(default=None, init=False, repr=False)
+    _lock: threading.Lock = field(factory=threading.Lock, init=False, repr=False)
+
+    @staticmethod
+    def open(path: str | os.PathLike) -> 'JsonSource':
+        """A source on a memory map of the file, which stays mapped until the source is closed."""
+        with open(path, 'rb') as f:
+            # Empty files can't be mapped.
+            return JsonSource(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if f.seek(0, 2) > 0 else b'')
+
+    def nbytes(self) -> int:
+        return len(self.data)
+
+    def text(self) -> str:
+        """The document as text, decoded the first time it is asked for."""
+        if isinstance(self.data, str):
+            return self.data
+        with self._lock:
+            if self._text is None:
+                if isinstance(self.data, mmap.mmap) and self.data.closed:
+                    raise ValueError("The source is closed.")
+                self._text = str(self.data, 'utf-8')
+            return self._text
+
+    def extract(self, spec: Projection) -> Any:
+        """
+        The parts of the document kept by the projection, see `tft.client.extract`, decoded the
+        first time they are asked for. Raises `json.JSONDecodeError` if the document is not valid.
+        """
+        key = json.dumps(spec, sort_keys=True)
+        with self._lock:
+            if key in self._parts:
+                self._parts.move_to_end(key)
+                return self._parts[key]
+        value = json.loads(self.text()) if spec is True else extract(self.text(), spec, partial=True)
+        with self._lock:
+            self._parts[key] = value
+            while len(self._parts) > MAX_PARTS:
+                self._parts.popitem(last=False)
+        return value
+
+    def load(self) -> Any:
+        """The whole document."""
+        return self.extract(True)
+
+    def close(self) -> None:
+        """Drops the decoded text and parts, and unmaps the file if the source is on one."""
+        with self._lock:
+            self._text = None
+            self._parts.clear()
+            if isinstance(self.data, mmap.mmap):
+                self.data.close()
+
+    def __enter__(self) -> 'JsonSource':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
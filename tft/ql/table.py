@@ -3,6 +3,7 @@
 from abc import abstractmethod
 from typing import Iterable, override
 import attrs
+import tft.client.meta as meta
 import tft.ql.expr as ql
 from tft.ql.util import avg_place
 from tft.queries.augs import get_aug_name_map
@@ -11,6 +12,26 @@ from tft.queries.items import get_item_name_map
 from tft.queries.traits import get_trait_name_map
 from tft.ql.coerce import *
 
+# Query from the names a comp is made of to their readable names, rebuilt when the set data is refreshed.
+COMP_NAME_QUERY: ql.BaseQuery | None = None
+
+@meta.on_refresh
+def reset_comp_name_query():
+    global COMP_NAME_QUERY
+    COMP_NAME_QUERY = None
+
+def get_comp_name_query() -> ql.BaseQuery:
+    """
+    Returns a query that joins the names of a comp to the readable names of the augments, traits and
+    champs they are, and orders them augments first, then traits, then champs.
+    """
+    global COMP_NAME_QUERY
+    if COMP_NAME_QUERY is None:
+        mappings = [get_aug_name_map(), get_trait_name_map(), get_champ_name_map()]
+        names = [{'apiName': api_name, 'order': order, 'readable': name} for order, mapping in enumerate(mappings) for api_name, name in mapping.items()]
+        COMP_NAME_QUERY = ql.join(ql.query(names), ql.idx('name'), ql.idx('apiName')).sort_by(ql.idx('order')).map(ql.idx('readable'))
+    return COMP_NAME_QUERY
+
 def adjust_field_to_size(s, length):
     """
     If a field is longer than its length, perform shortening.
@@ -159,13 +180,7 @@ class CompNameField(Field):
 
     @override
     def _get(self, source: dict) -> str:
-        output = []
-        mapping_order = [get_aug_name_map(), get_trait_name_map(), get_champ_name_map()]
-        name_list = self.query.eval(source)
-        for mapping in mapping_order:
-            for item in name_list:
-                if item['name'] in mapping:
-                    output.append(mapping[item['name']])
+        output = get_comp_name_query().eval(self.query.eval(source))
         return f"{' '.join(output):{self.length}}"
 
 @attrs.define
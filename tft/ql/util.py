@@ -1,10 +1,11 @@
 # Contains useful functions to use with the TFT QL language.
 # Mostly just to compute similarity scores.
+# The item queries are imported in the functions that use them, since they
+# depend on the client, which depends on QL.
 
 from collections import defaultdict
-from typing import Any, Callable, Iterable
-
-from tft.queries.items import get_components, get_recipes
+from typing import Any, Iterable
+from attrs import define, field
 
 
 def splay(m: Any, layer: int = 0, depth: int | None =None) -> None:
@@ -46,56 +47,126 @@ def pad_traits(traits: list[str]) -> list[str]:
     return new_traits
 
 
-def match_score(search_params: Iterable[str]) -> Callable[[Iterable[str]], int]:
+# The scores below are classes rather than closures so that queries using them can be pickled and
+# run in worker processes, see `tft.ql.parallel`.
+@define
+class MatchScore:
     """
-    Returns a function that computes a similarity score between a set
-    of champions and the search params (which is a set of champions).
+    Computes a similarity score between a set of champions and the search
+    params: how many of the search params are in it.
     """
-    comparison_set = set(search_params)
-    def compare(other: Iterable[str]) -> int:
+    comparison_set: frozenset[str] = field(converter=frozenset)
+
+    def __call__(self, other: Iterable[str]) -> int:
         count = 0
         # We set this because there are double poppy builds.
         for item in set(other):
-            if item in comparison_set:
+            if item in self.comparison_set:
                 count += 1
         return count
-    
-    return compare
 
+    def fingerprint(self) -> tuple:
+        return (MatchScore, self.comparison_set)
 
-def count_match_score(search_params: Iterable) -> Callable[[Iterable[str]], int]:
+
+def match_score(search_params: Iterable[str]) -> MatchScore:
     """
-    Returns a function that computes a similarity score between a match
-    score set and the search params (which is also a set).
+    Returns a function that computes a similarity score between a set
+    of champions and the search params (which is a set of champions).
     """
-    comparison_dict = defaultdict(int)
-    for item in search_params:
-        comparison_dict[item] += 1
-    
-    def compare(other: Iterable) -> int:
+    return MatchScore(search_params)
+
+
+@define
+class MatchRank:
+    """Ranks comps by match score, then by games."""
+    score: MatchScore = field()
+
+    def __call__(self, comp: dict) -> int:
+        return self.score(comp['units']) * 10000000 + comp['games']
+
+    def fingerprint(self) -> tuple:
+        return (MatchRank, self.score.fingerprint())
+
+
+def match_rank(search_params: Iterable[str]) -> MatchRank:
+    """
+    Returns a function that ranks a comp by its match score with the search
+    params, breaking ties by games played.
+    """
+    return MatchRank(match_score(search_params))
+
+
+@define
+class CountMatchScore:
+    """
+    Computes a similarity score between a list and the search params, counting
+    repeated items as many times as both have them.
+    """
+    comparison_dict: dict[Any, int] = field()
+
+    def __call__(self, other: Iterable) -> int:
         count = 0
         other_comparison_dict = defaultdict(int)
         for item in other:
             other_comparison_dict[item] += 1
-        
+
         for item, val in other_comparison_dict.items():
-            count += min(val, comparison_dict[item])
-        
+            count += min(val, self.comparison_dict.get(item, 0))
+
         return count
-    return compare
 
-def built_from(search_params: Iterable[str]) -> Callable[[Iterable[str]], bool]:
+    def fingerprint(self) -> tuple:
+        return (CountMatchScore, tuple(sorted(self.comparison_dict.items(), key=repr)))
+
+
+def count_match_score(search_params: Iterable) -> CountMatchScore:
     """
-    Returns a function which returns true if a passed list of items can be
-    built from search params.
+    Returns a function that computes a similarity score between a match
+    score set and the search params (which is also a set).
+    """
+    comparison_dict = defaultdict(int)
+    for item in search_params:
+        comparison_dict[item] += 1
+    return CountMatchScore(dict(comparison_dict))
+
+
+@define
+class ComponentsOrSelf:
+    """Converts an item to its components, or a list of just itself if it has none."""
+    recipes: dict[str, list[str]] = field(repr=False)
+
+    def __call__(self, item: str) -> list[str]:
+        if item in self.recipes:
+            return self.recipes[item]
+        return [item]
+
+    def fingerprint(self) -> tuple:
+        return (ComponentsOrSelf, id(self.recipes))
+
+
+def components_or_self() -> ComponentsOrSelf:
+    """
+    Returns a function that converts an item to its components, or a list of
+    just itself if it has no components.
     """
+    from tft.queries.items import get_recipes
+    return ComponentsOrSelf(get_recipes())
+
 
-    def compare(items: Iterable[str]) -> bool:
+@define
+class BuiltFrom:
+    """Returns true if a list of items can be built from the search params."""
+    search_params: tuple[str, ...] = field(converter=tuple)
+    components: set[str] = field(repr=False)
+    recipes: dict[str, list[str]] = field(repr=False)
+
+    def __call__(self, items: Iterable[str]) -> bool:
         # First directly match items.
-        items_to_match = list(search_params) 
+        items_to_match = list(self.search_params)
         missing_items = set() # Items we didn't match yet.
-        components = get_components()
-        recipes = get_recipes()
+        components = self.components
+        recipes = self.recipes
         for item in items:
             if item in items_to_match:
                 items_to_match.remove(item)
@@ -122,7 +193,15 @@ def built_from(search_params: Iterable[str]) -> Callable[[Iterable[str]], bool]:
             matched_components[item] -= 1
         
         return True
-    
-    return compare
+
+    def fingerprint(self) -> tuple:
+        return (BuiltFrom, self.search_params, id(self.components), id(self.recipes))
 
 
+def built_from(search_params: Iterable[str]) -> BuiltFrom:
+    """
+    Returns a function which returns true if a passed list of items can be
+    built from search params.
+    """
+    from tft.queries.items import get_components, get_recipes
+    return BuiltFrom(search_params, get_components(), get_recipes())
@@ -0,0 +1,203 @@
+"""
+Materialized views: named queries kept computed over keyed data, like the comp details keyed by
+cluster id, and brought up to date when the data changes by only evaluating the partitions that did.
+
+A view's `source` returns the data for a scope, like a dataset, as a dict of partitions by key. Its
+`partition` query is evaluated on each partition as a dict of just that key, and the results are
+joined in key order, lists concatenated and dicts merged, then `combine` is evaluated on them if the
+view has one. Reading a view compares every partition with the one it was last evaluated on, by
+identity, since a refresh keeps the responses that didn't change, see `meta.MetaTFTClient.request`.
+So when 3 comps out of 40 were refreshed, only those 3 are evaluated again. They are evaluated
+outside the view's lock, so readers of a view that is up to date, or of another scope, don't wait on
+them. Readers that evaluate the same scope at once each publish only if no one else did first, and
+otherwise compare with what was published, see `View.read`.
+
+Every change to a view bumps its version, and the value it returns is a new object, so caches keyed
+by either are invalidated exactly when the view changes. Results memoized on a view are kept by its
+version, and indexes on its value by identity, so neither is dropped by a refresh that didn't change
+the view, see `tft.queries.comps.reset_query_cache`. Values are shared, so they must not be changed.
+
+A `ViewSource` is a view as the dataset of a query, which reads the view when the query is
+evaluated, so a query built once follows the view as it changes.
+
+Usage:
+    VIEWS.define('comps', lambda dataset: meta.get_comp_details(dataset=dataset), ql.map(...).explode('cluster'), ql.sort_by(...))
+    rows = VIEWS.get('comps', dataset)
+    ql.query(ViewSource('comps', dataset)).filter(...).eval()
+"""
+from collections import OrderedDict
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Hashable
+from attrs import define, field, frozen
+
+if TYPE_CHECKING:
+    # Not imported at runtime, `tft.ql.expr` reads views as datasets.
+    from tft.ql.expr import BaseQuery
+
+MAX_SCOPES = 8
+
+
+@define
+class _Materialized:
+    """A view computed for one scope."""
+    # The value and the result of every partition, by key.
+    parts: dict[Any, tuple[Any, Any]] = field(factory=dict)
+    value: Any = field(default=None)
+    version: int = field(default=0)
+
+
+def _join(results: list) -> Any:
+    """Concatenates lists and merges dicts, in order. A single result is kept as it is."""
+    if len(results) == 1:
+        return results[0]
+    if all(isinstance(result, list) for result in results):
+        return [row for result in results for row in result]
+    if all(isinstance(result, dict) for result in results):
+        merged = {}
+        for result in results:
+            merged.update(result)
+        return merged
+    return results
+
+
+@define
+class View:
+    """A query kept computed over keyed data, for up to `max_scopes` scopes. Thread safe."""
+    name: str = field()
+    source: Callable[[Any], dict] = field()
+    partition: 'BaseQuery' = field()
+    combine: 'BaseQuery | None' = field(default=None)
+    max_scopes: int = field(default=MAX_SCOPES)
+    # How many partitions have been evaluated, over every scope.
+    evaluated: int = field(default=0, init=False)
+    # How many times the view changed, over every scope, which versions are taken from so they
+    # aren't reused for a scope that was dropped and read again.
+    changes: int = field(default=0, init=False)
+    _scopes: OrderedDict[Hashable, _Materialized] = field(factory=OrderedDict, init=False)
+    _lock: threading.Lock = field(factory=threading.Lock, init=False)
+
+    def get(self, scope: Hashable = None) -> Any:
+        """The view for the scope, with the partitions that changed since it was last read evaluated again."""
+        return self.read(scope)[0]
+
+    def read(self, scope: Hashable = None) -> tuple[Any, int]:
+        """
+        Same as `get`, along with the version of the value. The partitions that changed are
+        evaluated without holding the lock, against the scope as it was when they were compared, and
+        published only if the scope's version is still the same. Otherwise they are compared again
+        with what another reader published, which evaluates nothing if it read the same data.
+        """
+        # A copy, since fetches on other threads can add to the source while it is read.
+        items = list(self.source(scope).items())
+        while True:
+            with self._lock:
+                state = self._scopes.get(scope)
+                if state is None:
+                    state = self._scopes[scope] = _Materialized()
+                    while len(self._scopes) > self.max_scopes:
+                        self._scopes.popitem(last=False)
+                self._scopes.move_to_end(scope)
+                previous, version = state.parts, state.version
+                if version != 0 and len(items) == len(previous) and all(key in previous and previous[key][0] is value for key, value in items):
+                    return state.value, version
+            parts = {}
+            evaluated = 0
+            for key, value in items:
+                part = previous.get(key)
+                if part is None or part[0] is not value:
+                    part = (value, self.partition.eval({key: value}))
+                    evaluated += 1
+                parts[key] = part
+            joined = _join([result for _, result in parts.values()])
+            value = self.combine.eval(joined) if self.combine is not None else joined
+            with self._lock:
+                self.evaluated += evaluated
+                # A scope dropped meanwhile is still published to, for this reader.
+                if state.version == version:
+                    state.parts = parts
+                    state.value = value
+                    self.changes += 1
+                    state.version = self.changes
+                    return value, state.version
+
+    def version(self, scope: Hashable = None) -> int:
+        """The version of the view for the scope, which is new every time it changes, 0 if it was never read."""
+        with self._lock:
+            state = self._scopes.get(scope)
+            return state.version if state is not None else 0
+
+    def values(self) -> list:
+        """The value of every scope, as it was last read."""
+        with self._lock:
+            return [state.value for state in self._scopes.values()]
+
+    def invalidate(self) -> None:
+        """Drops every scope, so the view is evaluated whole the next time it is read, with new versions."""
+        with self._lock:
+            self._scopes.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'scopes': len(self._scopes),
+                'partitions': sum(len(state.parts) for state in self._scopes.values()),
+                'evaluated': self.evaluated,
+                'versions': {str(scope): state.version for scope, state in self._scopes.items()},
+            }
+
+
+@define
+class ViewRegistry:
+    """The views by name."""
+    _views: dict[str, View] = field(factory=dict, init=False)
+
+    def define(self, name: str, source: Callable[[Any], dict], partition: 'BaseQuery', combine: 'BaseQuery | None' = None, max_scopes: int = MAX_SCOPES) -> View:
+        """
+        Registers a view, see `View`. `source` is called with the scope the view is read for, None
+        by default, and returns its partitions by key.
+        """
+        assert name not in self._views, f"View {name} is already defined."
+        view = self._views[name] = View(name, source, partition, combine, max_scopes)
+        return view
+
+    def get(self, name: str, scope: Hashable = None) -> Any:
+        """The view for the scope, brought up to date with its source."""
+        return self._views[name].get(scope)
+
+    def read(self, name: str, scope: Hashable = None) -> tuple[Any, int]:
+        """The view for the scope, brought up to date with its source, and its version."""
+        return self._views[name].read(scope)
+
+    def version(self, name: str, scope: Hashable = None) -> int:
+        """The version of the view for the scope, bumped whenever it changes."""
+        return self._views[name].version(scope)
+
+    def values(self) -> list:
+        """The value of every view for every scope, as they were last read."""
+        return [value for view in self._views.values() for value in view.values()]
+
+    def invalidate(self) -> None:
+        for view in self._views.values():
+            view.invalidate()
+
+    def stats(self) -> dict:
+        return {name: view.stats() for name, view in self._views.items()}
+
+
+# Singleton the views in `tft.queries` are defined in.
+VIEWS = ViewRegistry()
+
+
+@frozen
+class ViewSource:
+    """A view in `VIEWS` as the dataset of a query, read when the query is evaluated."""
+    name: str = field()
+    scope: Hashable = field(default=None)
+
+    def read(self) -> tuple[Any, int]:
+        """The view brought up to date with its source, and its version."""
+        return VIEWS.read(self.name, self.scope)
+
+    def fingerprint(self) -> tuple:
+        """Names the view, memoized results on it are kept by its version as well, see `BaseQuery.eval_cached`."""
+        return (ViewSource, self.name, self.scope)
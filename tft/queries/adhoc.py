@@ -0,0 +1,62 @@
+"""
+Ad hoc QL queries over the cached MetaTFT data, written in the text syntax of `tft.ql.parse`, with
+budgets on how long they run and how many rows they return.
+"""
+from typing import Any, Callable
+import tft.client.meta as meta
+import tft.ql.expr as ql
+from tft.ql.budget import limit
+from tft.ql.parse import PLANS, Plan
+from tft.queries.augs import query_augs
+from tft.queries.champs import query_champs
+from tft.queries.comp_traits import query_champ_traits
+from tft.queries.comps import query_comp_details, query_comps, query_top_comps
+from tft.queries.traits import query_traits
+
+DEFAULT_MAX_ROWS = 100
+DEFAULT_SECONDS = 1.0
+# Upper bounds on the budgets a caller can ask for.
+MAX_ROWS = 5000
+MAX_SECONDS = 10.0
+
+# The datasets a query can start from, by name. Each is memoized, see `BaseQuery.cached`.
+DATASETS: dict[str, Callable[[meta.Dataset | None], ql.BaseQuery]] = {
+    'comps': query_comps,
+    'top_comps': query_top_comps,
+    'comp_details': query_comp_details,
+    'champs': lambda dataset: query_champs(),
+    'champ_traits': lambda dataset: query_champ_traits(),
+    'traits': lambda dataset: query_traits(),
+    'augs': lambda dataset: query_augs(),
+    'items': lambda dataset: ql.query(meta.get_set_data()).idx('items'),
+}
+
+
+def get_plan(text: str, dataset: meta.Dataset | None = None) -> Plan:
+    """
+    Returns the plan for a query on the dataset, parsed and compiled the first time the text is run.
+    Raises `tft.ql.parse.ParseError` if the text isn't a valid query.
+    """
+    text = text.strip()
+    datasets = {name: (lambda make=make: make(dataset).cached()) for name, make in DATASETS.items()}
+    return PLANS.get((text, dataset), lambda: Plan.build(text, datasets))
+
+
+def run_query(text: str, dataset: meta.Dataset | None = None, max_rows: int = DEFAULT_MAX_ROWS, seconds: float = DEFAULT_SECONDS) -> dict:
+    """
+    Runs a query on the dataset for at most `seconds`, raising `tft.ql.budget.BudgetExceeded` if it
+    takes longer. A list or dict result is cut to its first `max_rows` rows.
+
+    Returns:
+        dict: The `result`, how many `rows` it had before it was cut and whether it was `truncated`
+    """
+    plan = get_plan(text, dataset)
+    with limit(min(seconds, MAX_SECONDS)):
+        result = plan.run()
+    max_rows = min(max_rows, MAX_ROWS)
+    rows = len(result) if isinstance(result, (list, dict)) else 1
+    if isinstance(result, list):
+        result = result[:max_rows]
+    elif isinstance(result, dict) and rows > max_rows:
+        result = dict(list(result.items())[:max_rows])
+    return {'result': result, 'rows': rows, 'truncated': rows > max_rows}
@@ -3,6 +3,11 @@ import tft.client.meta as meta
 
 AUG_NAME_MAP = None
 
+@meta.on_refresh
+def reset_aug_caches():
+    global AUG_NAME_MAP
+    AUG_NAME_MAP = None
+
 def query_augs():
     return ql.query(meta.get_set_data()).idx('augments')
 
@@ -1,14 +1,36 @@
 import tft.ql.expr as ql
 import tft.client.meta as meta
+from tft.ql.views import VIEWS, ViewSource
 
 CHAMP_NAME_MAP = None
 
+@meta.on_refresh
+def reset_champ_caches():
+    """
+    Drops the cached champ data so it is rebuilt from the refreshed set data.
+    """
+    global CHAMP_NAME_MAP
+    CHAMP_NAME_MAP = None
+
 def query_champs():
     """
     Gets a query object for all champ data.
     """
     return ql.query(meta.get_set_data()).idx('units').filter(ql.idx('traits').len().gt(0))
 
+# Builds of each champ in each dataset, evaluated again when a refresh brings new data for the champ.
+VIEWS.define('champ_builds', lambda scope: meta.get_champ_item_data(*scope), ql.query().map(ql.idx('builds').map(ql.sub({
+    'items': ql.idx('buildNames').split('|'),
+    'places': ql.idx('places'),
+}))).values().flatten(), max_scopes=64)
+
+def query_champ_builds(champ_id: str, dataset: meta.Dataset | None = None):
+    """
+    Returns a query on the builds of a champ, with their items split out, which reads the
+    `champ_builds` view when it is evaluated.
+    """
+    return ql.query(ViewSource('champ_builds', (champ_id, dataset)))
+
 def get_champ_name_map():
     """
     Returns a dictionary that maps API names to human readable names. Use for displaying data.
@@ -2,57 +2,53 @@
 Module for computing trait levels for compositions.
 WRITTEN BY CLAUDE
 """
-from collections import Counter
 from typing import Iterable
 
 import tft.ql.expr as ql
 import tft.client.meta as meta
 from tft.queries.traits import query_traits
 
+# Query from a comp's units to how many of them have each trait, compiled once per set data.
+_TRAIT_COUNTS: ql.BaseQuery | None = None
 
-# Cached mappings
-_CHAMP_TO_TRAITS: dict[str, list[str]] | None = None
-_SOFT_TO_HARD_TRAITS: dict[str, str] | None = None
 
-
-def _get_soft_to_hard_traits() -> dict[str, str]:
+@meta.on_refresh
+def _reset_trait_counts() -> None:
     """
-    Returns a mapping from trait display names to trait API names.
-    WRITTEN BY CLAUDE
-
-    Returns:
-        dict: Maps display names (e.g., 'Juggernaut') to API names (e.g., 'TFT16_Juggernaut')
+    Drops the query so it is rebuilt on the refreshed set data.
     """
-    global _SOFT_TO_HARD_TRAITS
-    if _SOFT_TO_HARD_TRAITS is None:
-        traits = ql.query(meta.get_set_data()).idx('traits').filter(ql.contains('units')).map(ql.sub({
-            'apiName': ql.idx('apiName'),
-            'name': ql.idx('name'),
-        })).eval()
-        _SOFT_TO_HARD_TRAITS = {t['name']: t['apiName'] for t in traits}
-    return _SOFT_TO_HARD_TRAITS
+    global _TRAIT_COUNTS
+    _TRAIT_COUNTS = None
 
 
-def _get_champ_to_traits() -> dict[str, list[str]]:
+def query_champ_traits() -> ql.BaseQuery:
     """
-    Returns a mapping from champion API names to their trait API names.
-    WRITTEN BY CLAUDE
+    Returns a query for the traits of every champion, by trait API name. The set data lists a
+    champion's traits by display name, so they are joined to the traits by name.
 
-    Returns:
-        dict: Maps champion API names to list of trait API names
+    Ex:
+    [{'apiName': 'TFT16_Teemo', 'traits': ['TFT16_Teamup_SingedTeemo', 'TFT16_Yordle']}, ...]
+    """
+    set_data = ql.query(meta.get_set_data())
+    traits = set_data.idx('traits').filter(ql.contains('units')).map(ql.sub({
+        'apiName': ql.idx('apiName'),
+        'name': ql.idx('name'),
+    }))
+    return set_data.idx('units').filter(ql.idx('traits').len().gt(0)).map(ql.sub({
+        'apiName': ql.idx('apiName'),
+        'traits': ql.idx('traits').join(traits, ql.query(), ql.idx('name')).map(ql.idx('apiName')),
+    }))
+
+
+def _get_trait_counts() -> ql.BaseQuery:
+    """
+    Returns a query that joins units to their traits and counts how many units have each trait.
     """
-    global _CHAMP_TO_TRAITS
-    if _CHAMP_TO_TRAITS is None:
-        soft_to_hard = _get_soft_to_hard_traits()
-        champs = ql.query(meta.get_set_data()).idx('units').filter(ql.idx('traits').len().gt(0)).map(ql.sub({
-            'apiName': ql.idx('apiName'),
-            'traits': ql.idx('traits'),
-        })).eval()
-        _CHAMP_TO_TRAITS = {}
-        for champ in champs:
-            trait_api_names: list[str] = [soft_to_hard.get(t, t) for t in champ['traits']]
-            _CHAMP_TO_TRAITS[champ['apiName']] = trait_api_names
-    return _CHAMP_TO_TRAITS
+    global _TRAIT_COUNTS
+    if _TRAIT_COUNTS is None:
+        _TRAIT_COUNTS = ql.join(query_champ_traits(), ql.query(), ql.idx('apiName')).map(ql.idx('traits')).flatten().group_by(
+            ql.query()).agg({'count': ql.count()})
+    return _TRAIT_COUNTS
 
 
 def compute_comp_traits(units: Iterable[str]) -> list[tuple[str, int]]:
@@ -67,19 +63,15 @@ def compute_comp_traits(units: Iterable[str]) -> list[tuple[str, int]]:
         List of (trait_api_id, active_level) tuples sorted by level descending.
         Only traits with an active level >= 1 are included.
     """
-    champ_to_traits = _get_champ_to_traits()
-    trait_data = query_traits().eval()
+    trait_data = query_traits().eval_cached()
 
     # Count how many champions contribute to each trait
-    trait_counts: Counter[str] = Counter()
-    for unit in units:
-        unit_traits = champ_to_traits.get(unit, [])
-        for trait in unit_traits:
-            trait_counts[trait] += 1
+    trait_counts = _get_trait_counts().eval(list(units))
 
     # Determine active level for each trait
     result: list[tuple[str, int]] = []
-    for trait_api_id, count in trait_counts.items():
+    for trait_api_id, counts in trait_counts.items():
+        count = counts['count']
         trait_info = trait_data.get(trait_api_id)
         if not trait_info:
             continue
@@ -1,12 +1,32 @@
 import tft.ql.expr as ql
+from tft.ql.cache import RESULTS
+from tft.ql.index import INDEXES
+from tft.ql.parallel import SNAPSHOTS
+from tft.ql.parse import PLANS
+from tft.ql.views import VIEWS, ViewSource
 import tft.client.meta as meta
 
+@meta.on_refresh
+def reset_query_cache():
+    """
+    Drops the memoized query results, the indexes on them, the parsed ad hoc queries and the
+    snapshots workers read so they are rebuilt from the refreshed data. What was computed from the
+    views is kept: results on a view are kept by its version and the views' values are new lists
+    when they change, see `tft.ql.views`. Plans are all dropped, the datasets they were parsed on
+    are read when parsing.
+    """
+    views = VIEWS.values()
+    RESULTS.invalidate()
+    INDEXES.invalidate(keep=views)
+    PLANS.invalidate()
+    SNAPSHOTS.invalidate(keep=views)
 
-def query_comps():
+def explode_comps(query: ql.BaseQuery) -> ql.BaseQuery:
     """
-    Returns a query object containing all comps in the dataset.
+    Returns `query` on comp details by cluster exploded into a row for every early and late option
+    of every comp, with its cluster.
     """
-    return ql.query(meta.get_comp_details()).map(ql.idx('results').sub({
+    return query.map(ql.idx('results').sub({
         'early': ql.idx('early_options').explode('level').map(ql.sub({
             'units': ql.idx('unit_list').split('&'),
             'avg_place': ql.idx('avg'),
@@ -19,13 +39,30 @@ def query_comps():
             'games': ql.idx('count'),
             'level': ql.idx('level'),
         })),
-    }).values().flatten()).explode('cluster').sort_by(ql.idx('games'), True)
+    }).values().flatten()).explode('cluster')
+
+# Comps by cluster, evaluated again only for the clusters a refresh changed.
+VIEWS.define('comps', lambda dataset: meta.get_comp_details(dataset=dataset), explode_comps(ql.query()), ql.query().sort_by(ql.idx('games'), True))
+
+def query_comps(dataset: meta.Dataset | None = None):
+    """
+    Returns a query object containing all comps in the dataset, which reads the `comps` view when
+    it is evaluated.
+    """
+    return ql.query(ViewSource('comps', dataset))
 
-def query_comp_details():
+def query_indexed_comps(dataset: meta.Dataset | None = None):
+    """
+    Returns a query on the memoized comps, see `query_comps`, indexed for filters by level and
+    cluster.
+    """
+    return query_comps(dataset).indexed(['level', 'cluster'])
+
+def query_comp_details(dataset: meta.Dataset | None = None):
     """
     Returns a query object containing data about a particular comp.
     """
-    return ql.query(meta.get_comp_details()).filter(ql.contains('results')).map(ql.query(), ql.idx('1'), on_key=True).map(
+    return ql.query(meta.get_comp_details(dataset=dataset)).filter(ql.contains('results')).map(ql.query(), ql.idx('1'), on_key=True).map(
         ql.idx('results').select([
             'placements',
             'unit_stats',
@@ -36,15 +73,28 @@ def query_comp_details():
             'rerolls'
         ]))
 
-def query_top_comps():
+def query_top_comps(dataset: meta.Dataset | None = None):
     """
     Returns a query object containing the main build for the top comps.
     """
-    return ql.query(meta.get_comp_data()).idx('results.data.cluster_details').map(ql.sub({
+    return ql.query(meta.get_comp_data(dataset)).idx('results.data.cluster_details').map(ql.sub({
         'units': ql.idx('units_string').split(', '),
         'name': ql.idx('name').map(ql.select(['name', 'type'])),
         'games': ql.idx('overall.count'),
         'avg_place': ql.idx('overall.avg'),
         'builds': ql.idx('builds').map(ql.idx('buildName'), ql.idx('unit')),
         'stars': ql.idx('stars')
-    })).explode('cluster')
\ No newline at end of file
+    })).explode('cluster')
+
+def query_indexed_top_comps(dataset: meta.Dataset | None = None):
+    """
+    Returns a query on the memoized top comps, see `query_top_comps`, indexed for filters by units
+    and cluster.
+    """
+    return query_top_comps(dataset).indexed(['units', 'cluster'])
+
+def has_champs(champs: list[str]) -> ql.BaseQuery:
+    """
+    Returns a query for whether a comp has every champ, which is looked up on indexed comps.
+    """
+    return ql.all([ql.idx('units').contains(champ) for champ in champs])
\ No newline at end of file
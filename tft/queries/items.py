@@ -1,12 +1,19 @@
 from enum import Enum
 import tft.client.meta as meta
 import tft.ql.expr as ql
+from tft.ql.views import VIEWS
 # Easy access to queries and dicts here.
 
-ITEM_NAME_MAP = None
-COMPLETED_ITEMS = None
-COMPONENT_ITEMS = None
-RECIPES = None
+# Names missing from the set data.
+ONE_OFF_ITEM_NAMES = {
+    'TFT12_Item_Faerie_QueensCrown': "Faerie Queen's Crown",
+    'TFT12_Item_Faerie_QueensCrownRadiant': "Radiant Faerie Queen's Crown",
+    'TFT12_Item_Faerie_ArmorRadiant': "Radiant Faerie Armor",
+    'TFT_Item_UnstableTreasureChest': "Unstable Treasure Chest",
+    'TFT7_Item_ShimmerscaleMogulsMail': "Mogul's Mail",
+    'TFT_Item_Artifact_SilvermereDawn': "Silvermere Dawn",
+    'TFT5_Item_BloodthirsterRadiant': "Radiant Bloodthirster",
+}
 
 class ItemType(Enum):
     COMPONENT = 'component'
@@ -15,71 +22,63 @@ class ItemType(Enum):
     # ARTIFACT = 'artifact'
     # TRAIT = 'trait'
 
-def query_component_items():
+def query_component_items(set_data: dict | None = None):
     """
     Returns a query of all component items.
     """
-    component_names = query_buildable_items().map(ql.idx('composition')).vals().flatten().unary(set).eval()
-    return ql.query(meta.get_set_data()).idx('items').filter(ql.idx('apiName').in_set(component_names)).map(ql.sub({
+    set_data = meta.get_set_data() if set_data is None else set_data
+    component_names = query_buildable_items(set_data).map(ql.idx('composition')).vals().flatten().unary(set).eval()
+    return ql.query(set_data).idx('items').filter(ql.idx('apiName').in_set(component_names)).map(ql.sub({
         'name': ql.idx('en_name')
     }), ql.idx('apiName'))
 
-def query_buildable_items():
+def query_buildable_items(set_data: dict | None = None):
     """
     Returns a query of all buildable items.
     """
-    return ql.query(meta.get_set_data()).idx('items').filter(ql.idx('composition').len().eq(2)).map(ql.sub({
+    return ql.query(meta.get_set_data() if set_data is None else set_data).idx('items').filter(ql.idx('composition').len().eq(2)).map(ql.sub({
         'name': ql.idx('en_name'),
         'composition': ql.idx('composition'),
         'unique': ql.idx('unique')
     }), ql.idx('apiName'))
 
-def get_item_name_map():
+def _item_names(set_data: dict) -> dict[str, str]:
+    names = query_component_items(set_data).map(ql.idx('name')).eval()
+    names.update(query_buildable_items(set_data).map(ql.idx('name')).eval())
+    names.update(ONE_OFF_ITEM_NAMES)
+    return names
+
+def _set_data(_) -> dict:
+    """The set data, which the item views are computed from as a whole."""
+    return {'set': meta.get_set_data()}
+
+# Only computed again when a refresh brings new set data.
+VIEWS.define('item_names', _set_data, ql.idx('set').unary(_item_names))
+VIEWS.define('components', _set_data, ql.idx('set').unary(lambda set_data: set(query_component_items(set_data).keys().eval())))
+VIEWS.define('completed_items', _set_data, ql.idx('set').unary(lambda set_data: set(query_buildable_items(set_data).keys().eval())))
+VIEWS.define('recipes', _set_data, ql.idx('set').unary(lambda set_data: query_buildable_items(set_data).map(ql.idx('composition')).eval()))
+
+def get_item_name_map() -> dict[str, str]:
     """
     Returns a dictionary to map from API names to human readable names. Use for displaying data.
     """
-    global ITEM_NAME_MAP
-    if ITEM_NAME_MAP is None:
-        ITEM_NAME_MAP = {}
-        component_item_map = query_component_items().map(ql.idx('name')).eval()
-        buildable_items = query_buildable_items().map(ql.idx('name')).eval()
-        for k, v in component_item_map.items():
-            ITEM_NAME_MAP[k] = v
-        for k,v in buildable_items.items():
-            ITEM_NAME_MAP[k] = v
-        # One offs.
-        ITEM_NAME_MAP['TFT12_Item_Faerie_QueensCrown'] = "Faerie Queen's Crown"
-        ITEM_NAME_MAP['TFT12_Item_Faerie_QueensCrownRadiant'] = "Radiant Faerie Queen's Crown"
-        ITEM_NAME_MAP['TFT12_Item_Faerie_ArmorRadiant'] = "Radiant Faerie Armor"
-        ITEM_NAME_MAP['TFT_Item_UnstableTreasureChest'] = "Unstable Treasure Chest"
-        ITEM_NAME_MAP['TFT7_Item_ShimmerscaleMogulsMail'] = "Mogul's Mail"
-        ITEM_NAME_MAP['TFT_Item_Artifact_SilvermereDawn'] = "Silvermere Dawn"
-        ITEM_NAME_MAP['TFT5_Item_BloodthirsterRadiant'] = "Radiant Bloodthirster"
-    return ITEM_NAME_MAP
+    return VIEWS.get('item_names')
 
 def get_components() -> set[str]:
     """
-    Returns a set of all component item API names. Caches it in a global variable.
+    Returns a set of all component item API names, kept in the `components` view.
     """
-    global COMPONENT_ITEMS
-    if COMPONENT_ITEMS is None:
-        COMPONENT_ITEMS = set(query_component_items().keys().eval())
-    return COMPONENT_ITEMS
+    return VIEWS.get('components')
 
 def get_completed_items() -> set[str]:
     """
-    Returns a set of all completed item API names. Caches it in a global variable.
+    Returns a set of all completed item API names, kept in the `completed_items` view.
     """
-    global COMPLETED_ITEMS
-    if COMPLETED_ITEMS is None:
-        COMPLETED_ITEMS = set(query_buildable_items().keys().eval())
-    return COMPLETED_ITEMS
+    return VIEWS.get('completed_items')
 
 def get_recipes() -> dict[str, list[str]]:
     """
-    Returns a dictionary mapping completed items to a list of their component items. Caches it in a global variable.
+    Returns a dictionary mapping completed items to a list of their component items, kept in the
+    `recipes` view.
     """
-    global RECIPES
-    if RECIPES is None:
-        RECIPES = query_buildable_items().map(ql.idx('composition')).eval()
-    return RECIPES
+    return VIEWS.get('recipes')
@@ -3,6 +3,14 @@ import tft.client.meta as meta
 
 TRAIT_NAME_MAP: dict[str, str] = dict()
 
+@meta.on_refresh
+def reset_trait_caches():
+    """
+    Drops the cached trait data so it is rebuilt from the refreshed set data.
+    """
+    global TRAIT_NAME_MAP
+    TRAIT_NAME_MAP = dict()
+
 def query_traits():
     """
     Returns a query for trait data.